@@ -0,0 +1,85 @@
+"""
+测试用例写入基准：对比逐个创建ORM对象db.add后提交，与按批executemany批量插入的耗时
+
+用法（在backend目录下执行）：
+    python benchmarks/bench_case_insert.py [--cases 100,500,2000] [--database-url URL]
+
+默认使用内存SQLite；传入MySQL连接串可测量真实的数据库往返开销，
+基准会在独立的会话ID下写入数据并在结束后删除
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.dialects.mysql import LONGTEXT
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import TestCase
+from utils.test_case_store import build_test_case_row, bulk_insert_test_cases
+
+@compiles(LONGTEXT, "sqlite")
+def _compile_longtext_sqlite(type_, compiler, **kw):
+    # SQLite没有LONGTEXT类型，基准中按TEXT建表
+    return "TEXT"
+
+def make_case(i: int) -> dict:
+    return {
+        "title": f"验证用户登录功能-场景{i}",
+        "group_name": "Web端测试用例|登录|账号密码登录",
+        "maintainer": "测试人员",
+        "precondition": "用户已注册且账号状态正常",
+        "step_description": "【1】打开登录页面\n【2】输入正确的用户名和密码\n【3】点击登录按钮",
+        "expected_result": "【1】页面正常展示\n【2】输入框正常回显\n【3】登录成功并跳转到首页",
+        "case_level": "中",
+        "case_type": "功能测试",
+        "test_suggestions": "关注密码错误次数限制",
+        "source_chunk_hash": "0" * 64
+    }
+
+def insert_with_orm_loop(db, session_id: str, cases: list) -> None:
+    for order_index, case_data in enumerate(cases):
+        db.add(TestCase(**build_test_case_row(session_id, case_data, order_index)))
+    db.commit()
+
+def insert_with_bulk(db, session_id: str, cases: list) -> None:
+    rows = [build_test_case_row(session_id, case_data, order_index) for order_index, case_data in enumerate(cases)]
+    bulk_insert_test_cases(db, rows)
+    db.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description="测试用例写入基准")
+    parser.add_argument("--cases", default="100,500,2000", help="每次写入的测试用例数，逗号分隔")
+    parser.add_argument("--database-url", default="sqlite://", help="数据库连接串，默认内存SQLite")
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    Base.metadata.create_all(bind=engine, tables=[TestCase.__table__])
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    print(f"{'用例数':>8}{'ORM逐个写入(ms)':>18}{'批量写入(ms)':>16}{'加速比':>10}")
+    for case_count in (int(c) for c in args.cases.split(",")):
+        cases = [make_case(i) for i in range(case_count)]
+        timings = []
+        for insert_func in (insert_with_orm_loop, insert_with_bulk):
+            session_id = f"bench-{uuid.uuid4()}"
+            db = SessionLocal()
+            try:
+                start = time.perf_counter()
+                insert_func(db, session_id, cases)
+                timings.append((time.perf_counter() - start) * 1000)
+                assert db.query(TestCase).filter(TestCase.session_id == session_id).count() == case_count
+            finally:
+                db.query(TestCase).filter(TestCase.session_id == session_id).delete()
+                db.commit()
+                db.close()
+        print(f"{case_count:>8}{timings[0]:>18.1f}{timings[1]:>16.1f}{timings[0] / timings[1]:>10.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+AI响应JSON提取基准：对比原有的逐级回退解析与单次扫描容错提取器
+在不同体积、不同异常形态的响应语料上的成功率和耗时
+
+用法（在backend目录下执行）：
+    python benchmarks/bench_json_extractor.py [--cases 10,50,200] [--repeat 20]
+"""
+import os
+import re
+import ast
+import sys
+import json
+import time
+import logging
+import argparse
+from typing import Any, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.json_extractor import extract_json
+
+def legacy_parse_chunk_response(ai_response: str) -> Dict[str, Any]:
+    """原有的逐级回退解析逻辑（保留用于对比）"""
+    # 检查是否包含特定的markdown标记
+    if '```json' in ai_response:
+        logging.info("发现```json标记")
+    if '```' in ai_response:
+        logging.info("发现```标记")
+    if ai_response.strip().startswith('['):
+        logging.info("AI响应以[开头")
+    if ai_response.strip().endswith(']'):
+        logging.info("AI响应以]结尾")
+
+    # 解析JSON响应 - 简化和强化的提取逻辑
+    logging.info("开始JSON解析过程")
+
+    # 方法1: 直接尝试解析整个响应
+    try:
+        result = json.loads(ai_response)
+        if isinstance(result, dict) and "test_cases" in result:
+            logging.info("直接JSON解析成功 - 新格式")
+            return result
+        elif isinstance(result, list):
+            logging.info("直接JSON解析成功 - 旧格式")
+            return {"test_cases": result, "analysis_suggestions": ""}
+    except Exception as e:
+        logging.info(f"直接JSON解析失败: {e}")
+        logging.info(f"失败时的响应类型: {type(ai_response)}")
+        logging.info(f"响应长度: {len(ai_response)}")
+        logging.info(f"响应前100字符: {repr(ai_response[:100])}")
+        logging.info(f"响应后100字符: {repr(ai_response[-100:])}")
+
+    # 方法2: 提取```json代码块
+    try:
+        # 查找```json标记
+        json_start = ai_response.find('```json')
+        if json_start != -1:
+            json_start += 7  # 跳过"```json"
+            json_end = ai_response.find('```', json_start)
+            if json_end != -1:
+                json_content = ai_response[json_start:json_end].strip()
+                result = json.loads(json_content)
+                if isinstance(result, dict) and "test_cases" in result:
+                    logging.info("```json代码块解析成功 - 新格式")
+                    return result
+                elif isinstance(result, list):
+                    logging.info("```json代码块解析成功 - 旧格式")
+                    return {"test_cases": result, "analysis_suggestions": ""}
+    except Exception as e:
+        logging.info(f"```json代码块解析失败: {e}")
+
+    # 方法3: 提取任何```代码块中的JSON
+    try:
+        code_start = ai_response.find('```')
+        if code_start != -1:
+            code_start += 3
+            code_end = ai_response.find('```', code_start)
+            if code_end != -1:
+                code_content = ai_response[code_start:code_end].strip()
+                # 尝试解析代码块内容
+                result = json.loads(code_content)
+                if isinstance(result, dict) and "test_cases" in result:
+                    logging.info("```代码块解析成功 - 新格式")
+                    return result
+                elif isinstance(result, list):
+                    logging.info("```代码块解析成功 - 旧格式")
+                    return {"test_cases": result, "analysis_suggestions": ""}
+    except Exception as e:
+        logging.info(f"```代码块解析失败: {e}")
+
+    # 方法4: 使用正则表达式提取JSON对象或数组
+    try:
+        # 首先尝试匹配包含test_cases的对象
+        json_match = re.search(r'\{[\s\S]*"test_cases"[\s\S]*\}', ai_response)
+        if json_match:
+            result = json.loads(json_match.group())
+            if isinstance(result, dict) and "test_cases" in result:
+                logging.info("正则表达式JSON对象解析成功 - 新格式")
+                return result
+
+        # 如果没有找到对象，尝试匹配数组
+        json_match = re.search(r'\[[\s\S]*\]', ai_response)
+        if json_match:
+            result = json.loads(json_match.group())
+            if isinstance(result, list):
+                logging.info("正则表达式JSON数组解析成功 - 旧格式")
+                return {"test_cases": result, "analysis_suggestions": ""}
+    except Exception as e:
+        logging.info(f"正则表达式JSON解析失败: {e}")
+
+    # 方法5: 处理截断的JSON响应 - 尝试修复不完整的JSON
+    try:
+        logging.info("尝试修复截断的JSON响应")
+        # 尝试找到最后一个完整的JSON对象
+        # 从后往前查找完整的对象结尾
+        fixed_json = ai_response
+
+        # 如果响应被截断，尝试补全
+        if not fixed_json.strip().endswith('}'):
+            # 查找最后一个完整的对象
+            last_complete_obj = fixed_json.rfind('}')
+            if last_complete_obj != -1:
+                # 移除不完整的部分，补全对象
+                fixed_json = fixed_json[:last_complete_obj + 1]
+                logging.info(f"尝试修复JSON，原长度: {len(ai_response)}, 修复后长度: {len(fixed_json)}")
+
+                result = json.loads(fixed_json)
+                if isinstance(result, dict) and "test_cases" in result:
+                    logging.info(f"截断JSON修复成功 - 新格式，获得 {len(result.get('test_cases', []))} 个测试用例")
+                    return result
+                elif isinstance(result, list):
+                    logging.info(f"截断JSON修复成功 - 旧格式，获得 {len(result)} 个测试用例")
+                    return {"test_cases": result, "analysis_suggestions": ""}
+    except Exception as e:
+        logging.info(f"截断JSON修复失败: {e}")
+
+    # 方法6: 提取所有完整的JSON对象
+    try:
+        logging.info("尝试提取所有完整的JSON对象")
+        # 使用正则表达式找到所有完整的JSON对象
+        object_matches = re.findall(r'\{[^{}]*\}', ai_response)
+        if object_matches:
+            # 构建一个JSON数组
+            json_array = '[' + ','.join(object_matches) + ']'
+            test_cases = json.loads(json_array)
+            if isinstance(test_cases, list) and len(test_cases) > 0:
+                logging.info(f"提取完整JSON对象成功，获得 {len(test_cases)} 个测试用例")
+                return {"test_cases": test_cases, "analysis_suggestions": ""}
+    except Exception as e:
+        logging.info(f"提取完整JSON对象失败: {e}")
+
+    # 方法7: 使用Python的ast.literal_eval作为最后手段
+    try:
+        logging.info("尝试使用ast.literal_eval解析")
+        # 提取看起来最像JSON数组的部分
+        json_match = re.search(r'\[.*\]', ai_response, re.DOTALL)
+        if json_match:
+            json_content = json_match.group()
+            # 尝试修复常见的JSON语法错误
+            # 1. 移除尾随逗号
+            json_content = re.sub(r',(\s*[}\]])', r'\1', json_content)
+            # 2. 确保字符串引号正确
+            json_content = re.sub(r'([{,]\s*)([a-zA-Z_][a-zA-Z0-9_]*)\s*:', r'\1"\2":', json_content)
+
+            test_cases = ast.literal_eval(json_content)
+            if isinstance(test_cases, list) and len(test_cases) > 0:
+                logging.info(f"ast.literal_eval解析成功，获得 {len(test_cases)} 个测试用例")
+                return {"test_cases": test_cases, "analysis_suggestions": ""}
+    except Exception as e:
+        logging.info(f"ast.literal_eval解析失败: {e}")
+
+    # 方法8: 手动提取测试用例信息
+    try:
+        logging.info("尝试手动提取测试用例信息")
+        test_cases = []
+
+        # 查找所有看起来像是测试用例的对象
+        case_pattern = r'\{\s*"title":\s*"([^"]*)"[^}]*\}'
+        matches = re.findall(case_pattern, ai_response, re.DOTALL)
+
+        if matches:
+            for i, title in enumerate(matches):
+                test_case = {
+                    "title": title,
+                    "group_name": f"功能组{i+1}",
+                    "maintainer": "测试人员",
+                    "precondition": "系统正常运行",
+                    "step_description": "请补充具体测试步骤",
+                    "expected_result": "请补充预期结果",
+                    "case_level": "中",
+                    "case_type": "功能测试",
+                    "test_suggestions": ""
+                }
+                test_cases.append(test_case)
+
+            if test_cases:
+                logging.info(f"手动提取成功，获得 {len(test_cases)} 个基础测试用例")
+                return {"test_cases": test_cases, "analysis_suggestions": ""}
+    except Exception as e:
+        logging.info(f"手动提取失败: {e}")
+
+    # 所有方法都失败
+    error_msg = f"所有JSON提取方法都失败。AI响应内容: {ai_response[:500]}..."
+    logging.error(error_msg)
+    raise Exception(error_msg)
+
+def make_case(i: int) -> dict:
+    return {
+        "title": f"验证用户登录功能-场景{i}",
+        "group_name": "Web端测试用例|登录|账号密码登录",
+        "maintainer": "测试人员",
+        "precondition": "用户已注册且账号状态正常",
+        "step_description": "【1】打开登录页面\n【2】输入正确的用户名和密码\n【3】点击登录按钮",
+        "expected_result": "【1】页面正常展示\n【2】输入框正常回显\n【3】登录成功并跳转到首页",
+        "case_level": "高" if i % 3 == 0 else "中",
+        "case_type": "功能测试",
+        "test_suggestions": "关注密码错误次数限制"
+    }
+
+def build_corpus(case_count: int) -> dict:
+    """构造同一组测试用例的多种响应形态"""
+    payload = {"test_cases": [make_case(i) for i in range(case_count)], "analysis_suggestions": "建议补充异常场景"}
+    clean = json.dumps(payload, ensure_ascii=False, indent=2)
+    array = json.dumps(payload["test_cases"], ensure_ascii=False, indent=2)
+    trailing = re.sub(r'("|\d|\]|\})(\s*\n\s*)(\}|\])', r'\1,\2\3', clean)
+    unquoted = re.sub(r'\n(\s*)"([a-z_]+)":', r'\n\1\2:', clean)
+    return {
+        "clean": clean,
+        "array": array,
+        "fenced": f"```json\n{clean}\n```",
+        "prose_fenced": f"以下是根据文档生成的测试用例：\n\n```json\n{clean}\n```\n\n如需调整请告知。",
+        "trailing_commas": f"```json\n{trailing}\n```",
+        "unquoted_keys": unquoted,
+        "raw_newlines": clean.replace("\\n", "\n"),
+        "truncated": clean[: int(len(clean) * 0.8)],
+        "truncated_fenced": f"```json\n{clean[: int(len(clean) * 0.6)]}",
+    }
+
+def count_cases(result) -> int:
+    if isinstance(result, dict):
+        return len(result.get("test_cases", []))
+    if isinstance(result, list):
+        return len(result)
+    return 0
+
+def run_legacy(text: str) -> int:
+    return count_cases(legacy_parse_chunk_response(text))
+
+def run_extractor(text: str) -> int:
+    result, _ = extract_json(text)
+    return count_cases(result)
+
+def measure(func, text: str, repeat: int):
+    try:
+        cases = func(text)
+    except Exception:
+        return None, 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(text)
+    return (time.perf_counter() - start) / repeat * 1000, cases
+
+def main():
+    parser = argparse.ArgumentParser(description="AI响应JSON提取基准")
+    parser.add_argument("--cases", default="10,50,200", help="每个响应包含的测试用例数，逗号分隔")
+    parser.add_argument("--repeat", type=int, default=20, help="每个样本重复解析次数")
+    args = parser.parse_args()
+
+    # 原有逻辑每一步都输出日志，计时时关闭
+    logging.disable(logging.CRITICAL)
+
+    print(f"{'样本':<18}{'用例数':>6}{'大小(KB)':>10}{'原有(ms)':>12}{'原有用例':>8}{'提取器(ms)':>12}{'提取器用例':>10}  修复")
+    for case_count in (int(c) for c in args.cases.split(",")):
+        for name, text in build_corpus(case_count).items():
+            legacy_ms, legacy_cases = measure(run_legacy, text, args.repeat)
+            new_ms, new_cases = measure(run_extractor, text, args.repeat)
+            try:
+                repairs = ",".join(extract_json(text)[1]) or "-"
+            except Exception:
+                repairs = "失败"
+            legacy_col = f"{legacy_ms:.3f}" if legacy_ms is not None else "失败"
+            new_col = f"{new_ms:.3f}" if new_ms is not None else "失败"
+            print(f"{name:<18}{case_count:>6}{len(text.encode('utf-8')) / 1024:>10.1f}{legacy_col:>12}{legacy_cases:>8}{new_col:>12}{new_cases:>10}  {repairs}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+近似重复检测基准：生成带改写重复的测试用例语料，测量deduplicate_test_cases在不同用例数下的耗时，
+并与两两比较Jaccard相似度的精确结果对比召回率
+
+用法（在backend目录下执行）：
+    python benchmarks/bench_near_duplicates.py [--cases 1000,5000,10000] [--threshold 0.7] [--exact-limit 2000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.ai_client import deduplicate_test_cases
+from utils.near_duplicates import case_similarity_text, normalize_case_text, shingle_hashes, jaccard, NEAR_DUPLICATE_THRESHOLD, NEAR_DUPLICATE_TITLE_THRESHOLD
+
+MODULES = ["登录", "注册", "购物车", "订单", "支付", "退款", "消息通知", "个人中心", "搜索", "商品详情",
+           "优惠券", "积分", "收货地址", "发票", "评价", "客服", "物流", "会员", "设置", "首页推荐"]
+ACTIONS = ["新增", "编辑", "删除", "查询", "导出", "批量操作", "筛选", "排序", "分享", "收藏",
+           "导入", "复制", "撤销", "审核", "提交", "取消", "恢复", "预览", "打印", "同步"]
+CONDITIONS = ["正常数据", "空数据", "超长输入", "特殊字符", "无权限用户", "网络中断", "并发提交", "重复提交", "过期会话", "分页边界",
+              "弱网环境", "首次使用", "数据量较大", "字段缺失", "格式错误", "跨天操作", "多设备登录", "缓存失效", "接口超时", "余额不足",
+              "已注销账号", "离线状态", "低内存设备", "横屏模式", "深色模式"]
+OBJECTS = ["列表", "弹窗", "表单", "详情页", "输入框", "下拉菜单", "提示信息", "按钮", "页签", "卡片", "图表", "附件"]
+VERBS = ["点击", "输入", "选择", "拖动", "长按", "勾选", "清空", "上传", "滑动", "双击"]
+CHECKS = ["数据是否保存成功", "页面跳转是否正确", "错误提示是否友好", "按钮状态是否正确", "统计数字是否更新",
+          "日志是否记录", "通知是否发送", "权限校验是否生效", "排序结果是否正确", "缓存是否刷新"]
+SUFFIXES = ["", "功能验证", "场景测试", "检查"]
+
+def make_case(i: int, rng: random.Random) -> Dict[str, str]:
+    # 标题由模块、操作、条件组合而成且不带编号，步骤从短语库中随机组合，模拟同一文档中主题相近但内容不同的用例
+    module = MODULES[i % len(MODULES)]
+    action = ACTIONS[(i // len(MODULES)) % len(ACTIONS)]
+    condition = CONDITIONS[(i // (len(MODULES) * len(ACTIONS))) % len(CONDITIONS)]
+    steps = [f"【1】进入{module}页面，准备{condition}"]
+    for step in range(2, rng.randint(4, 6)):
+        steps.append(f"【{step}】{rng.choice(VERBS)}{rng.choice(OBJECTS)}，{rng.choice(VERBS)}{rng.choice(OBJECTS)}后{action}")
+    steps.append(f"【{len(steps) + 1}】检查{rng.choice(CHECKS)}，以及{rng.choice(CHECKS)}")
+    return {
+        "title": f"{module}-{action}-{condition}",
+        "step_description": "\n".join(steps),
+        "expected_result": "操作结果符合需求描述"
+    }
+
+def paraphrase(case: Dict[str, str], rng: random.Random) -> Dict[str, str]:
+    """模拟重叠分块或重复生成产生的改写：改动标题措辞、步骤编号格式和少量字词"""
+    title = case["title"] + rng.choice(SUFFIXES[1:])
+    steps = case["step_description"].replace("【", "").replace("】", ". ")
+    steps = steps.replace("检查", rng.choice(["确认", "检查"]), 1)
+    return {"title": title, "step_description": steps, "expected_result": case["expected_result"]}
+
+def make_corpus(count: int, duplicate_ratio: float, seed: int = 42) -> List[Dict[str, str]]:
+    rng = random.Random(seed)
+    originals = [make_case(i, rng) for i in range(int(count * (1 - duplicate_ratio)))]
+    corpus = list(originals)
+    while len(corpus) < count:
+        corpus.append(paraphrase(rng.choice(originals), rng))
+    rng.shuffle(corpus)
+    return corpus
+
+def exact_near_duplicates(cases: List[Dict[str, str]], threshold: float) -> int:
+    """两两比较的精确结果（O(n²)，只用于校验小规模语料）"""
+    kept = []
+    removed = 0
+    seen_titles = set()
+    for case in cases:
+        title = case["title"].strip()
+        if title in seen_titles:
+            continue
+        seen_titles.add(title)
+        text, numbers = case_similarity_text(case)
+        hashes = shingle_hashes(normalize_case_text(text))
+        title_hashes = shingle_hashes(normalize_case_text(title))
+        if any(
+            numbers == kept_numbers and jaccard(hashes, kept_hashes) >= threshold
+            and jaccard(title_hashes, kept_title) >= NEAR_DUPLICATE_TITLE_THRESHOLD
+            for kept_hashes, kept_title, kept_numbers in kept
+        ):
+            removed += 1
+            continue
+        kept.append((hashes, title_hashes, numbers))
+    return removed
+
+def main():
+    parser = argparse.ArgumentParser(description="近似重复检测基准")
+    parser.add_argument("--cases", default="1000,5000,10000", help="语料中的用例数，逗号分隔")
+    parser.add_argument("--threshold", type=float, default=NEAR_DUPLICATE_THRESHOLD, help="近似重复阈值，默认取NEAR_DUPLICATE_THRESHOLD")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.3, help="语料中改写重复用例的比例")
+    parser.add_argument("--exact-limit", type=int, default=2000, help="用例数不超过该值时计算两两比较的精确结果")
+    args = parser.parse_args()
+
+    print(f"{'用例数':>8}{'标题去重后':>12}{'LSH去重后':>12}{'耗时(ms)':>12}{'每千条(ms)':>12}{'召回率':>10}")
+    for case_count in (int(c) for c in args.cases.split(",")):
+        corpus = make_corpus(case_count, args.duplicate_ratio)
+        title_unique = len(deduplicate_test_cases(corpus, similarity_threshold=0))
+        start = time.perf_counter()
+        near_unique = len(deduplicate_test_cases(corpus, similarity_threshold=args.threshold))
+        elapsed = (time.perf_counter() - start) * 1000
+
+        recall = "-"
+        if case_count <= args.exact_limit:
+            expected = exact_near_duplicates(corpus, args.threshold)
+            recall = f"{(title_unique - near_unique) / expected:.3f}" if expected else "1.000"
+        print(f"{case_count:>8}{title_unique:>12}{near_unique:>12}{elapsed:>12.1f}{elapsed / case_count * 1000:>12.1f}{recall:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+提示词布局测量：对文档分块后，逐块统计提示词中说明文字与文档内容各占多少token，
+并对比原有布局（文档块夹在说明中间）与模板布局（固定说明作为system前缀、文档块在最后）
+可被服务商前缀缓存的token数
+
+用法（在backend目录下执行）：
+    python benchmarks/bench_prompt_layout.py [--file PRD.md] [--sections 40] [--chunk-tokens 3500] [--detail]
+"""
+import os
+import sys
+import random
+import argparse
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.chunker import count_tokens, split_content
+from utils.prompt_templates import CHUNK_TEMPLATE
+
+FEATURES = ["登录", "注册", "购物车", "订单", "支付", "退款", "消息通知", "个人中心", "搜索", "优惠券"]
+RULES = ["必填校验", "长度限制为1到50个字符", "失败三次后锁定十分钟", "仅管理员可见", "超时后自动取消",
+         "金额保留两位小数", "支持批量操作", "需要二次确认", "记录操作日志", "按创建时间倒序排列"]
+
+def legacy_chunk_prompt(chunk: str, index: int, total: int) -> str:
+    """原有的分块提示词：说明文字和文档块都在一条user消息中，文档块位于中间（保留用于对比）"""
+    return f"""
+请详细分析以下产品需求文档片段，并生成符合Excel模板格式的全面、详细的测试用例和针对这部分内容的专门测试建议。
+
+这是第 {index+1} 部分（共 {total} 部分），请重点关注这部分的功能需求、业务逻辑和技术实现细节。
+
+文档内容片段：
+{chunk}
+
+请按照以下格式返回JSON对象，必须包含测试用例数组和这部分的专门分析建议：
+
+```json
+{{
+  "test_cases": [
+    {{
+      "title": "测试用例标题（*必填）",
+      "group_name": "所属分组（选填，用|分隔层级，如：Web端测试用例|首页|我的待办）",
+      "maintainer": "维护人（选填，成员姓名）",
+      "precondition": "前置条件（选填，执行测试前的必要条件）",
+      "step_description": "步骤描述（选填，使用【1】、【2】等编号格式，每个步骤一行）",
+      "expected_result": "预期结果（选填，每个步骤对应的预期结果，与步骤编号对应）",
+      "case_level": "用例等级（选填：高/中/低，默认：中）",
+      "case_type": "用例类型（选填：功能测试/性能测试/安全测试/兼容性测试，默认：功能测试）",
+      "test_suggestions": "针对此测试用例的具体建议，如测试数据准备、注意事项、关联测试等"
+    }}
+  ],
+  "analysis_suggestions": "针对这部分文档内容的专门测试策略分析和建议"
+}}
+```
+
+**重要要求**（严格按照Excel模板格式）：
+
+1. **测试用例生成**（遵循Teambition导入规范）：
+   - 针对这部分文档内容生成详细的测试用例
+   - 测试用例必须覆盖所有功能点、业务场景、边界条件和异常情况
+   - 包括但不限于：正常流程、异常流程、边界值、数据验证、权限控制等
+   - **步骤描述格式**：必须使用【1】、【2】、【3】等中文编号格式，每个步骤单独一行
+   - **预期结果格式**：与步骤描述对应，使用相同的【1】、【2】、【3】编号格式
+   - **分组格式**：使用"|"分隔层级，如"Web端测试用例|首页|我的待办"
+   - **必填规则**：只有"title"是必填项，其他字段选填但建议尽可能完整
+   - 区分不同优先级：核心业务（高）、主要功能（中）、非核心功能（低）
+   - 包含多种测试类型：功能测试、性能测试、安全测试、兼容性测试等
+   - 如果这部分有多个功能模块，每个模块都要有对应的测试用例
+   - 考虑用户操作的各种可能性和错误场景
+   - 为每个测试用例提供具体的测试建议
+
+2. **分析建议生成**（重点关注）：
+   - **必须**在"analysis_suggestions"字段中，提供针对这部分文档内容的专门测试策略分析
+   - 分析这部分功能的技术特点和业务逻辑
+   - 指出这部分功能的潜在风险点和测试难点
+   - 推荐针对这部分功能的专门测试方法和测试工具
+   - 说明这部分功能与其他模块的依赖关系和集成测试要点
+   - 提供这部分功能的测试数据准备建议
+   - 分析这部分功能的性能和安全测试要点
+
+3. **内容针对性**：
+   - 分析建议必须基于这部分文档的具体内容，不能是通用模板
+   - 要体现对这部分业务逻辑和技术实现的深入理解
+   - 提供实用的、可操作的测试指导建议
+
+**Excel模板格式要求**：
+- 确保生成的JSON格式完全正确
+- 所有字段都必须有值，不能有空值或缺失字段（选填字段可以为空字符串）
+- 测试用例必须包含所有必需字段
+- analysis_suggestions字段必须包含有价值的分析内容，不能留空
+- 步骤描述和预期结果必须使用【1】、【2】、【3】的中文编号格式
+- 分组名称使用"|"分隔多个层级
+
+请直接返回JSON对象，不要包含其他文本。确保JSON格式正确且无语法错误。
+    """
+
+def make_document(sections: int, seed: int = 7) -> str:
+    """生成由若干功能章节组成的PRD文档"""
+    rng = random.Random(seed)
+    parts = []
+    for i in range(sections):
+        feature = FEATURES[i % len(FEATURES)]
+        lines = [f"## {i + 1}. {feature}模块需求"]
+        for j in range(rng.randint(8, 14)):
+            lines.append(f"{j + 1}、用户在{feature}页面执行操作{j + 1}时，系统{rng.choice(RULES)}，并{rng.choice(RULES)}。")
+        parts.append("\n".join(lines))
+    return "\n\n".join(parts)
+
+def main():
+    parser = argparse.ArgumentParser(description="提示词布局测量")
+    parser.add_argument("--file", help="要测量的文档（纯文本或Markdown），不指定时生成示例文档")
+    parser.add_argument("--sections", type=int, default=40, help="生成示例文档的章节数")
+    parser.add_argument("--chunk-tokens", type=int, default=3500, help="分块大小（token）")
+    parser.add_argument("--detail", action="store_true", help="输出每个分块的统计")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "r", encoding="utf-8") as f:
+            content = f.read()
+    else:
+        content = make_document(args.sections)
+    chunks: List[str] = split_content(content, max_tokens=args.chunk_tokens)
+
+    legacy_total = legacy_instruction = 0
+    total = instruction = content_tokens = prefix = 0
+    if args.detail:
+        print(f"{'块':>4}{'内容':>8}{'原说明':>8}{'新说明':>8}{'可缓存前缀':>10}{'说明占比':>10}")
+    for i, chunk in enumerate(chunks):
+        chunk_tokens = count_tokens(chunk)
+        legacy_tokens = count_tokens(legacy_chunk_prompt(chunk, i, len(chunks)))
+        stats = CHUNK_TEMPLATE.measure(index=i + 1, total=len(chunks), content=chunk)
+        legacy_total += legacy_tokens
+        legacy_instruction += legacy_tokens - chunk_tokens
+        total += stats["prompt_tokens"]
+        instruction += stats["instruction_tokens"]
+        content_tokens += stats["content_tokens"]
+        prefix += stats["prefix_tokens"]
+        if args.detail:
+            share = stats["instruction_tokens"] / max(1, stats["prompt_tokens"])
+            print(f"{i + 1:>4}{chunk_tokens:>8}{legacy_tokens - chunk_tokens:>8}{stats['instruction_tokens']:>8}{stats['prefix_tokens']:>10}{share:>10.1%}")
+
+    # 第一个请求写入前缀缓存，之后的请求命中
+    cacheable = prefix - (prefix // len(chunks) if chunks else 0)
+    print(f"分块数: {len(chunks)}，文档内容: {content_tokens} tokens")
+    print(f"原有布局: 提示词 {legacy_total} tokens，其中说明 {legacy_instruction}（{legacy_instruction / max(1, legacy_total):.1%}），可缓存前缀 0")
+    print(f"模板布局: 提示词 {total} tokens，其中说明 {instruction}（{instruction / max(1, total):.1%}），"
+          f"可缓存前缀 {cacheable}（{cacheable / max(1, total):.1%}）")
+    print(f"按前缀缓存后需全价计费的提示词: {total - cacheable} tokens，较原有布局减少 {1 - (total - cacheable) / max(1, legacy_total):.1%}")
+
+if __name__ == "__main__":
+    main()
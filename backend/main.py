@@ -1,26 +1,45 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Request, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
 import uvicorn
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 import uuid
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import List, Optional
 import json
 import httpx
+import tempfile
+from pydantic import ValidationError
 import asyncio
 
 from database import SessionLocal, engine, Base
-from models import FileUpload, TestCase, ChatSession, AIConfiguration
+from models import FileUpload, TestCase, ChatSession, AIConfiguration, AnalysisJob, LLMCallLog
 from schemas import (
-    FileUploadResponse, TestCaseCreate, TestCaseUpdate, TestCaseResponse,
+    FileUploadResponse, TestCaseCreate, TestCaseUpdate, TestCaseResponse, TestCaseListItem, TestCaseBatchUpdate, TestCaseBatchDelete,
     ChatSessionCreate, ChatSessionUpdate, ChatSessionResponse, AIConfigurationCreate, AIConfigurationResponse,
-    AnalyzeRequest, AnalyzeResponse
+    AnalyzeRequest, AnalyzeResponse, AnalysisJobResponse, TestCaseImportResponse
 )
-from utils.file_processor import process_file
-from utils.ai_client import analyze_with_ai_enhanced
+from utils.upload_storage import save_upload_stream, UploadTooLargeError, UPLOAD_TEMP_DIR
+from utils.test_case_store import (
+    build_test_case_row, bulk_insert_test_cases, bulk_update_test_cases, upsert_test_cases_by_title,
+    update_test_cases_by_ids, delete_test_cases_by_ids
+)
+from utils.case_excel import export_test_cases_to_tempfile, iter_case_sheet_rows, CaseSheetError, XLSX_MEDIA_TYPE
+from utils.pagination import encode_cursor, decode_cursor, keyset_after, parse_fields, InvalidCursorError
+from utils.file_blobs import acquire_blob, register_blob, release_blob, release_upload_file, blob_disk_path, collect_unreferenced_blobs
+from utils.file_processor import process_file, is_extraction_error, init_extraction_pool, close_extraction_pool
+from utils.ai_client import analyze_with_ai_enhanced, split_document
+from utils.http_client import init_http_clients, close_http_clients
+from utils.job_manager import JobManager, JobQueueFullError, ANALYSIS_MAX_WORKERS, ANALYSIS_MAX_QUEUE
+from utils.job_leases import WORKER_ID, JOB_HEARTBEAT_SECONDS, claim_job, renew_leases, fail_expired_jobs, adopt_orphaned_jobs
+from utils.progress_events import progress_broker, format_sse
+from utils.llm_cache import get_cache_stats, evict_expired_entries, chunk_hash
+from utils.provider_pool import get_pool_stats
+from utils.usage_stats import job_usage, session_usage, config_usage
 import asyncio
 from typing import Dict
 import logging
@@ -51,13 +70,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # 用例列表分页游标
 )
 
 # 静态文件服务
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
-# 分析进度跟踪
-analysis_progress: Dict[str, str] = {}
+# SSE连接的心跳间隔，以及任务不在本进程时查库的间隔（秒）
+SSE_KEEPALIVE_SECONDS = 15
+SSE_FALLBACK_POLL_SECONDS = 2
 
 # 数据库依赖
 def get_db():
@@ -70,6 +91,36 @@ def get_db():
 # 确保上传目录存在
 os.makedirs("uploads", exist_ok=True)
 
+@app.on_event("startup")
+async def startup_http_clients():
+    """为已有AI配置预建长连接HTTP客户端"""
+    db = SessionLocal()
+    try:
+        endpoints = {config.api_endpoint for config in db.query(AIConfiguration).all()}
+    finally:
+        db.close()
+    init_http_clients(endpoints)
+
+@app.on_event("shutdown")
+async def shutdown_http_clients():
+    """关闭共享的HTTP客户端"""
+    await close_http_clients()
+
+@app.on_event("startup")
+async def startup_extraction_pool():
+    """创建文档解析进程池"""
+    init_extraction_pool()
+
+@app.on_event("startup")
+async def startup_collect_file_blobs():
+    """回收上次运行遗留的无引用上传文件"""
+    collect_unreferenced_blobs()
+
+@app.on_event("shutdown")
+async def shutdown_extraction_pool():
+    """关闭文档解析进程池"""
+    close_extraction_pool()
+
 @app.get("/")
 async def root():
     return {"message": "AstraTest-PRD2TC API"}
@@ -88,28 +139,57 @@ async def upload_file(
         unique_filename = f"{file_id}{file_extension}"
         file_path = os.path.join("uploads", unique_filename)
         
-        # 保存文件
-        content = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(content)
+        # 流式保存文件，同时计算大小和内容哈希
+        try:
+            file_size, content_hash = await save_upload_stream(file, file_path)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
         
-        # 提取文件内容
-        extracted_content = await process_file(file_path, file.content_type)
+        # 内容相同的文件已存储时复用磁盘文件和提取结果，不再重复解析
+        blob = acquire_blob(db, content_hash)
+        if blob is not None:
+            os.remove(file_path)
+            file_url = blob.file_url
+            extracted_content = blob.extracted_content
+            if extracted_content is None:
+                # 之前的提取失败，重新提取
+                extracted_content = await process_file(blob_disk_path(file_url), file.content_type)
+                if not is_extraction_error(extracted_content):
+                    blob.extracted_content = extracted_content
+                    db.commit()
+            logging.info(f"上传文件内容已存在，复用已存储的文件: {file_url}")
+        else:
+            file_url = f"/uploads/{unique_filename}"
+            extracted_content = await process_file(file_path, file.content_type)
+            blob = register_blob(
+                db, content_hash, file_url, file_size,
+                None if is_extraction_error(extracted_content) else extracted_content
+            )
+            if blob.file_url != file_url:
+                # 并发上传的相同内容已先登记，改用先登记的文件
+                os.remove(file_path)
+                file_url = blob.file_url
         
         # 保存到数据库
         db_file = FileUpload(
             id=file_id,
             session_id=session_id,
             file_name=file.filename,
-            file_url=f"/uploads/{unique_filename}",
+            file_url=file_url,
             file_type=file.content_type,
-            file_size=len(content),
+            file_size=file_size,
+            content_hash=content_hash,
             upload_status="completed",
             extracted_content=extracted_content
         )
-        db.add(db_file)
-        db.commit()
-        db.refresh(db_file)
+        try:
+            db.add(db_file)
+            db.commit()
+            db.refresh(db_file)
+        except Exception:
+            db.rollback()
+            release_blob(db, content_hash)
+            raise
 
         # 更新会话标题为文档名+测试用例格式
         try:
@@ -131,12 +211,15 @@ async def upload_file(
             file_url=db_file.file_url,
             file_type=db_file.file_type,
             file_size=db_file.file_size,
+            content_hash=db_file.content_hash,
             upload_status=db_file.upload_status,
             extracted_content=db_file.extracted_content,
             analysis_suggestions=db_file.analysis_suggestions,
             created_at=db_file.created_at
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         error_detail = f"文件上传失败: {str(e)}\n详细错误: {traceback.format_exc()}"
@@ -159,113 +242,461 @@ def generate_session_title(file_name: str) -> str:
     # 否则添加"测试用例"后缀
     return f"{base_name}测试用例"
 
+@app.delete("/api/files/{file_id}")
+async def delete_file(file_id: str, db: Session = Depends(get_db)):
+    """删除上传文件记录，文件内容不再被其他上传引用时回收磁盘文件"""
+    db_file = db.query(FileUpload).filter(FileUpload.id == file_id).first()
+    if not db_file:
+        raise HTTPException(status_code=404, detail="文件未找到")
+
+    try:
+        content_hash = db_file.content_hash
+        file_url = db_file.file_url
+        db.query(ChatSession).filter(ChatSession.file_id == file_id).update({"file_id": None}, synchronize_session=False)
+        db.delete(db_file)
+        db.commit()
+
+        release_upload_file(db, content_hash, file_url)
+        return {"message": "文件已删除"}
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"删除文件失败: {str(e)}")
+
 @app.post("/api/analyze", response_model=AnalyzeResponse)
 async def analyze_document(
     request: AnalyzeRequest,
     db: Session = Depends(get_db)
 ):
-    """AI分析生成测试用例"""
+    """提交AI分析任务，立即返回任务ID，通过 /api/jobs/{job_id} 查询进度"""
+    # 获取文件内容
+    file_upload = db.query(FileUpload).filter(FileUpload.id == request.file_id).first()
+    if not file_upload:
+        raise HTTPException(status_code=404, detail="文件未找到")
+
+    # 获取AI配置
+    ai_config = db.query(AIConfiguration).filter(AIConfiguration.is_active == True).first()
+    if not ai_config:
+        raise HTTPException(status_code=400, detail="请先配置AI服务")
+
+    if job_manager.is_full():
+        raise HTTPException(status_code=429, detail="分析任务队列已满，请稍后重试")
+
+    db_job = AnalysisJob(
+        id=str(uuid.uuid4()),
+        session_id=request.session_id,
+        file_id=request.file_id,
+        status="queued",
+        full_reanalysis=request.full_reanalysis,
+        progress_message="任务排队中",
+        worker_id=WORKER_ID,
+        heartbeat_at=datetime.now()
+    )
+    db.add(db_job)
+    db.commit()
+
     try:
-        # 获取文件内容
-        file_upload = db.query(FileUpload).filter(FileUpload.id == request.file_id).first()
-        if not file_upload:
-            raise HTTPException(status_code=404, detail="文件未找到")
-        
-        # 获取AI配置
-        ai_config = db.query(AIConfiguration).filter(AIConfiguration.is_active == True).first()
-        if not ai_config:
-            raise HTTPException(status_code=400, detail="请先配置AI服务")
-        
-        # 调用AI分析（使用增强版，支持大文档分块分析）
-
-        # 定义进度回调函数
-        def progress_callback(message: str):
-            # 这里可以添加WebSocket或SSE推送逻辑
-            logging.info(f"分析进度: {message}")
-            # 将进度保存到内存中，可以通过另一个接口查询
-            analysis_progress[request.file_id] = message
-
-        test_cases, analysis_suggestions = await analyze_with_ai_enhanced(
-            content=file_upload.extracted_content,
-            ai_config=ai_config,
-            progress_callback=progress_callback,
-            file_name=file_upload.file_name
-        )
-        
-        # 检查是否生成了有效的测试用例
-        if not test_cases:
-            raise Exception("AI未能生成任何有效的测试用例。请检查文档内容是否包含明确的功能需求，或AI服务配置是否正确。")
+        job_manager.submit(db_job.id)
+    except JobQueueFullError as e:
+        db_job.status = "failed"
+        db_job.error_message = str(e)
+        db.commit()
+        raise HTTPException(status_code=429, detail=str(e))
+
+    return AnalyzeResponse(
+        success=True,
+        message="分析任务已提交",
+        test_cases_count=0,
+        job_id=db_job.id,
+        status=db_job.status
+    )
+
+async def run_analysis_job(job_id: str):
+    """后台执行AI分析任务并持久化任务状态"""
+    db = SessionLocal()
+    try:
+        # 以条件更新原子地认领任务：同一任务被多次入队（或已被其他进程接管）时只有一方能把状态从queued改为running
+        if not claim_job(db, job_id):
+            return
+
+        job = db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
+        progress_broker.publish(job_id, build_job_event(job, "progress"))
 
-        # 保存分析建议到文件上传记录
         try:
+            file_upload = db.query(FileUpload).filter(FileUpload.id == job.file_id).first()
+            if not file_upload:
+                raise Exception("文件未找到")
+
+            ai_config = db.query(AIConfiguration).filter(AIConfiguration.is_active == True).first()
+            if not ai_config:
+                raise Exception("请先配置AI服务")
+
+            # 增量分析：会话中已有带来源块哈希的测试用例时，与新文档的分块比对，
+            # 未变化的块沿用已有用例，新增或变化的块重新分析，已移除的块对应用例标记为退役；
+            # 全量重新分析时不读取AI结果缓存，所有块重新生成，已有的AI生成用例全部退役
+            chunk_hashes = [chunk_hash(chunk) for chunk in split_document(file_upload.extracted_content, ai_config)]
+            existing_cases = db.query(TestCase).filter(
+                TestCase.session_id == job.session_id,
+                TestCase.is_retired == False,
+                TestCase.source_chunk_hash.isnot(None)
+            ).order_by(TestCase.ai_order.asc(), TestCase.created_at.asc()).all()
+            if job.full_reanalysis:
+                reuse_hashes = set()
+                logging.info(f"全量重新分析：共 {len(chunk_hashes)} 个块，已有 {len(existing_cases)} 个AI生成用例将被替换")
+            else:
+                reuse_hashes = {case.source_chunk_hash for case in existing_cases} & set(chunk_hashes)
+            if existing_cases and not job.full_reanalysis:
+                logging.info(f"增量分析：共 {len(chunk_hashes)} 个块，其中 {len(reuse_hashes)} 个块内容未变化")
+
+            # 定义进度回调函数，进度和分块计数写入任务记录，并推送给订阅的SSE连接
+            progress_stats = {}
+
+            def progress_callback(message: str, **details):
+                logging.info(f"分析进度: {message}")
+                progress_stats.update(details)
+                job.progress_message = message
+                for field in ("total_chunks", "completed_chunks", "failed_chunks", "reused_chunks"):
+                    if field in details:
+                        setattr(job, field, details[field])
+                db.commit()
+                progress_broker.publish(job_id, build_job_event(job, "progress", **progress_stats))
+
+            # 流式响应时每生成一个测试用例立即推送，前端无需等待整块完成
+            def case_callback(chunk_index: int, case: dict):
+                progress_broker.publish(job_id, {
+                    "type": "case",
+                    "job_id": job_id,
+                    "chunk_index": chunk_index,
+                    "case": {field: case.get(field) for field in (
+                        "title", "group_name", "precondition", "step_description",
+                        "expected_result", "case_level", "case_type"
+                    )}
+                })
+
+            # 每次AI请求的token用量、耗时和重试次数立即写入，任务失败或取消时也保留
+            def usage_callback(record: dict):
+                db.add(LLMCallLog(
+                    id=str(uuid.uuid4()),
+                    job_id=job_id,
+                    session_id=job.session_id,
+                    file_id=job.file_id,
+                    **record
+                ))
+                db.commit()
+
+            # 调用AI分析（使用增强版，支持大文档分块分析）
+            test_cases, analysis_suggestions = await analyze_with_ai_enhanced(
+                content=file_upload.extracted_content,
+                ai_config=ai_config,
+                progress_callback=progress_callback,
+                file_name=file_upload.file_name,
+                reuse_chunk_hashes=reuse_hashes,
+                bypass_cache=job.full_reanalysis,
+                case_callback=case_callback,
+                usage_callback=usage_callback
+            )
+
+            # 检查是否生成了有效的测试用例（增量分析时文档可能没有需要重新生成的部分）
+            if not test_cases and not reuse_hashes:
+                raise Exception("AI未能生成任何有效的测试用例。请检查文档内容是否包含明确的功能需求，或AI服务配置是否正确。")
+
+            # 保存分析建议到文件上传记录
             file_upload.analysis_suggestions = analysis_suggestions
-            db.commit()
             logging.info(f"已保存分析建议到文件记录，长度: {len(analysis_suggestions)} 字符")
+
+            # 未沿用的已有用例标记为退役：来源块已不在新文档中，或全量重新分析时由新生成的用例替换
+            retired_cases = [case for case in existing_cases if case.source_chunk_hash not in reuse_hashes]
+
+            # 按新文档的块顺序排列沿用的用例和新生成的用例
+            carried_by_hash = {}
+            for case in existing_cases:
+                if case.source_chunk_hash in reuse_hashes:
+                    carried_by_hash.setdefault(case.source_chunk_hash, []).append(case)
+            new_by_hash = {}
+            for case_data in test_cases:
+                new_by_hash.setdefault(case_data.get("source_chunk_hash"), []).append(case_data)
+
+            ordered_cases = []
+            for hash_value in dict.fromkeys(chunk_hashes):
+                ordered_cases.extend(carried_by_hash.pop(hash_value, []))
+                ordered_cases.extend(new_by_hash.pop(hash_value, []))
+            for remaining in new_by_hash.values():
+                ordered_cases.extend(remaining)
+
+            # 保存测试用例到数据库：新用例分批批量插入，沿用和退役的用例按主键批量更新
+            new_rows = []
+            updated_rows = [{"id": case.id, "is_retired": True} for case in retired_cases]
+            for order_index, case_data in enumerate(ordered_cases):
+                if isinstance(case_data, TestCase):
+                    updated_rows.append({"id": case_data.id, "ai_order": order_index})
+                else:
+                    new_rows.append(build_test_case_row(job.session_id, case_data, order_index))
+            bulk_update_test_cases(db, updated_rows)
+            bulk_insert_test_cases(db, new_rows)
+
+            job.status = "succeeded"
+            job.test_cases_count = len(test_cases)
+            job.retired_cases_count = len(retired_cases)
+            job.progress_message = "AI分析完成"
+            job.finished_at = datetime.now()
+            db.commit()
+            progress_broker.finish(job_id, build_job_event(job, "done"))
+
+        except asyncio.CancelledError:
+            db.rollback()
+            job.status = "cancelled"
+            job.progress_message = "任务已取消"
+            job.finished_at = datetime.now()
+            db.commit()
+            progress_broker.finish(job_id, build_job_event(job, "done"))
+            raise
+
         except Exception as e:
-            logging.warning(f"保存分析建议失败: {e}")
-
-        # 保存测试用例到数据库
-        saved_cases = []
-        for order_index, case_data in enumerate(test_cases):
-            db_case = TestCase(
-                id=str(uuid.uuid4()),
-                session_id=request.session_id,
-                title=case_data.get("title", ""),
-                group_name=case_data.get("group_name", ""),
-                maintainer=case_data.get("maintainer", ""),
-                precondition=case_data.get("precondition", ""),
-                step_description=case_data.get("step_description", ""),
-                expected_result=case_data.get("expected_result", ""),
-                case_level=case_data.get("case_level", "中"),
-                case_type=case_data.get("case_type", "功能测试"),
-                ai_order=order_index,  # 保存AI返回的原始顺序
-                test_suggestions=case_data.get("test_suggestions", "")  # 保存测试建议
-            )
-            db.add(db_case)
-            saved_cases.append(db_case)
+            db.rollback()
+            logging.error(f"分析任务 {job_id} 失败: {e}")
+            job.status = "failed"
+            job.error_message = str(e)
+            job.progress_message = "分析失败"
+            job.finished_at = datetime.now()
+            db.commit()
+            progress_broker.finish(job_id, build_job_event(job, "done"))
+    finally:
+        db.close()
 
-        db.commit()
+def build_job_event(job: AnalysisJob, event_type: str, **details) -> dict:
+    """根据任务状态构建推送给前端的结构化进度事件"""
+    event = {
+        "type": event_type,
+        "job_id": job.id,
+        "status": job.status,
+        "message": job.progress_message,
+        "total_chunks": job.total_chunks or 0,
+        "completed_chunks": job.completed_chunks or 0,
+        "failed_chunks": job.failed_chunks or 0,
+        "chunk_index": details.get("chunk_index"),
+        "cases_so_far": details.get("cases_so_far", job.test_cases_count or 0),
+        "tokens_used": details.get("tokens_used"),
+        "summary_tokens": details.get("summary_tokens"),
+        "eta_seconds": None
+    }
+    # 按已完成分块的平均耗时估算剩余时间
+    if job.started_at and event["completed_chunks"] and event["total_chunks"] > event["completed_chunks"]:
+        elapsed = (datetime.now() - job.started_at).total_seconds()
+        remaining = event["total_chunks"] - event["completed_chunks"]
+        event["eta_seconds"] = round(elapsed / event["completed_chunks"] * remaining, 1)
+    if event_type == "done":
+        event["test_cases_count"] = job.test_cases_count or 0
+        event["error_message"] = job.error_message
+    return event
 
-        return AnalyzeResponse(
-            success=True,
-            message="AI分析完成",
-            test_cases_count=len(saved_cases)
-        )
-    
+job_manager = JobManager(run_analysis_job, ANALYSIS_MAX_WORKERS, ANALYSIS_MAX_QUEUE)
+job_lease_task: Optional[asyncio.Task] = None
+
+def maintain_job_leases() -> None:
+    """为本进程持有的任务续约，把租约过期的运行中任务标记为失败，并接管租约过期的排队任务"""
+    db = SessionLocal()
+    try:
+        renew_leases(db)
+        fail_expired_jobs(db)
+        for job_id in adopt_orphaned_jobs(db, job_manager.free_slots()):
+            try:
+                job_manager.submit(job_id)
+            except JobQueueFullError as e:
+                db.query(AnalysisJob).filter(AnalysisJob.id == job_id, AnalysisJob.status == "queued").update({
+                    "status": "failed",
+                    "error_message": str(e),
+                    "finished_at": datetime.now()
+                }, synchronize_session=False)
+                db.commit()
     except Exception as e:
-        # 提供详细的错误信息，包括AI分析失败的具体原因
-        error_msg = str(e)
-        if "AI" in error_msg:
-            raise HTTPException(status_code=500, detail=f"AI分析失败: {error_msg}")
-        else:
-            raise HTTPException(status_code=500, detail=f"系统处理失败: {error_msg}")
+        db.rollback()
+        logging.warning(f"维护分析任务租约失败: {e}")
+    finally:
+        db.close()
+
+async def job_lease_loop():
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+        maintain_job_leases()
+
+@app.on_event("startup")
+async def startup_job_manager():
+    """
+    启动后台任务执行器，并恢复已退出进程遗留的任务：多进程部署时其他进程仍在续约的任务不受影响，
+    只有租约过期的运行中任务标记为失败，租约过期的排队任务由本进程接管
+    """
+    global job_lease_task
+    await job_manager.start()
+    evict_expired_entries()
+    maintain_job_leases()
+    job_lease_task = asyncio.create_task(job_lease_loop())
+
+@app.on_event("shutdown")
+async def shutdown_job_manager():
+    """停止后台任务执行器"""
+    if job_lease_task is not None:
+        job_lease_task.cancel()
+    await job_manager.stop()
+
+@app.get("/api/jobs/{job_id}", response_model=AnalysisJobResponse)
+async def get_job(job_id: str, db: Session = Depends(get_db)):
+    """获取分析任务状态"""
+    job = db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="任务未找到")
+    return AnalysisJobResponse.model_validate(job)
+
+@app.post("/api/jobs/{job_id}/cancel", response_model=AnalysisJobResponse)
+async def cancel_job(job_id: str, db: Session = Depends(get_db)):
+    """取消排队中或运行中的分析任务"""
+    job = db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="任务未找到")
+    if job.status not in ("queued", "running"):
+        raise HTTPException(status_code=400, detail=f"任务已结束，当前状态: {job.status}")
+
+    if job.status == "queued":
+        # 排队中的任务直接标记取消，worker取到时会跳过
+        job_manager.cancel(job_id)
+        job.status = "cancelled"
+        job.progress_message = "任务已取消"
+        job.finished_at = datetime.now()
+        db.commit()
+    elif not job_manager.cancel(job_id):
+        raise HTTPException(status_code=409, detail="任务不在当前服务进程中运行，无法取消")
+    else:
+        # 等待运行中的任务处理取消并写入状态
+        for _ in range(50):
+            await asyncio.sleep(0.1)
+            db.refresh(job)
+            if job.status != "running":
+                break
+
+    return AnalysisJobResponse.model_validate(job)
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """以Server-Sent Events推送分析任务的进度事件，任务结束后关闭连接"""
+    db = SessionLocal()
+    try:
+        job = db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
+        if not job:
+            raise HTTPException(status_code=404, detail="任务未找到")
+        initial_event = build_job_event(job, "done" if job.status not in ("queued", "running") else "progress")
+    finally:
+        db.close()
+
+    async def event_stream():
+        yield format_sse(initial_event)
+        if initial_event["type"] == "done":
+            return
+
+        queue = progress_broker.subscribe(job_id)
+        try:
+            while True:
+                if await request.is_disconnected():
+                    break
+                # 任务在本进程中时由事件驱动；否则（多worker部署）降级为低频查库
+                local = job_manager.is_running(job_id) or job_manager.is_queued(job_id)
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS if local else SSE_FALLBACK_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    if local:
+                        yield ": keep-alive\n\n"
+                        continue
+                    poll_db = SessionLocal()
+                    try:
+                        polled_job = poll_db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
+                        event = build_job_event(polled_job, "done" if polled_job.status not in ("queued", "running") else "progress")
+                    finally:
+                        poll_db.close()
+                yield format_sse(event)
+                if event["type"] == "done":
+                    break
+        finally:
+            progress_broker.unsubscribe(job_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/jobs/{job_id}/usage")
+async def get_job_usage(job_id: str, db: Session = Depends(get_db)):
+    """获取分析任务的AI用量：token数、费用、耗时和重试次数的合计、按阶段汇总和每次请求明细"""
+    job = db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="任务未找到")
+    return job_usage(db, job_id)
+
+@app.get("/api/cache/stats")
+async def get_llm_cache_stats():
+    """获取AI结果缓存的命中统计"""
+    return get_cache_stats()
 
 @app.get("/api/analysis-progress/{file_id}")
-async def get_analysis_progress(file_id: str):
-    """获取AI分析进度"""
-    progress = analysis_progress.get(file_id, "未开始分析")
-    return {"file_id": file_id, "progress": progress}
-
-@app.get("/api/test-cases/{session_id}", response_model=List[TestCaseResponse])
-async def get_test_cases(session_id: str, db: Session = Depends(get_db)):
-    """获取测试用例列表"""
-    cases = db.query(TestCase).filter(TestCase.session_id == session_id).order_by(TestCase.ai_order.asc(), TestCase.created_at.asc()).all()
-    return [TestCaseResponse(
-        id=case.id,
-        session_id=case.session_id,
-        title=case.title,
-        group_name=case.group_name,
-        maintainer=case.maintainer,
-        precondition=case.precondition,
-        step_description=case.step_description,
-        expected_result=case.expected_result,
-        case_level=case.case_level,
-        case_type=case.case_type,
-        ai_order=case.ai_order,
-        test_suggestions=case.test_suggestions,
-        created_at=case.created_at,
-        updated_at=case.updated_at
-    ) for case in cases]
+async def get_analysis_progress(file_id: str, db: Session = Depends(get_db)):
+    """获取AI分析进度（兼容接口，读取该文件最近一次分析任务的状态）"""
+    job = db.query(AnalysisJob).filter(AnalysisJob.file_id == file_id).order_by(AnalysisJob.created_at.desc()).first()
+    progress = job.progress_message if job else "未开始分析"
+    return {"file_id": file_id, "progress": progress, "job_id": job.id if job else None, "status": job.status if job else None}
+
+# 用例列表可选择返回的字段，按此顺序输出
+TEST_CASE_LIST_FIELDS = list(TestCaseListItem.model_fields.keys())
+
+@app.get("/api/test-cases/{session_id}", response_model=List[TestCaseListItem], response_model_exclude_unset=True)
+async def get_test_cases(
+    session_id: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="每页条数，不传时返回全部用例"),
+    cursor: Optional[str] = Query(None, description="上一页响应头X-Next-Cursor中的游标"),
+    fields: Optional[str] = Query(None, description="逗号分隔的返回字段，如 title,case_level；id总是返回"),
+    db: Session = Depends(get_db)
+):
+    """
+    获取测试用例列表
+    按 (ai_order, created_at, id) 进行键集分页，还有下一页时在响应头X-Next-Cursor中返回游标；
+    传入fields时只查询所选的列，大文本字段可通过 /api/test-cases/detail/{case_id} 按需获取
+    """
+    try:
+        selected = parse_fields(fields, TEST_CASE_LIST_FIELDS, ["id"]) or TEST_CASE_LIST_FIELDS
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # 排序键总是查询，用于生成下一页游标
+    sort_keys = ["ai_order", "created_at", "id"]
+    columns = selected + [name for name in sort_keys if name not in selected]
+    query = db.query(*[getattr(TestCase, name) for name in columns]).filter(
+        TestCase.session_id == session_id,
+        TestCase.is_retired == False
+    )
+    if cursor:
+        try:
+            key = decode_cursor(cursor)
+        except InvalidCursorError:
+            raise HTTPException(status_code=400, detail="无效的分页游标")
+        query = query.filter(keyset_after(TestCase.ai_order, TestCase.created_at, TestCase.id, key))
+    query = query.order_by(TestCase.ai_order.asc(), TestCase.created_at.asc(), TestCase.id.asc())
+
+    if limit is None:
+        rows = query.all()
+    else:
+        # 多取一条判断是否还有下一页
+        rows = query.limit(limit + 1).all()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            response.headers["X-Next-Cursor"] = encode_cursor(last.ai_order, last.created_at, last.id)
+
+    return [{name: getattr(row, name) for name in selected} for row in rows]
+
+@app.get("/api/test-cases/detail/{case_id}", response_model=TestCaseResponse)
+async def get_test_case_detail(case_id: str, db: Session = Depends(get_db)):
+    """获取单个测试用例的完整内容"""
+    db_case = db.query(TestCase).filter(TestCase.id == case_id).first()
+    if not db_case:
+        raise HTTPException(status_code=404, detail="测试用例未找到")
+    return TestCaseResponse.model_validate(db_case)
 
 @app.post("/api/test-cases", response_model=TestCaseResponse)
 async def create_test_case(case: TestCaseCreate, db: Session = Depends(get_db)):
@@ -295,6 +726,43 @@ async def create_test_case(case: TestCaseCreate, db: Session = Depends(get_db)):
         updated_at=db_case.updated_at
     )
 
+# 批量修改、删除接口单次请求的用例数上限
+TEST_CASE_BATCH_MAX_IDS = 5000
+
+def _check_batch_ids(ids: List[str]) -> None:
+    if not ids:
+        raise HTTPException(status_code=400, detail="请选择测试用例")
+    if len(ids) > TEST_CASE_BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"单次最多操作 {TEST_CASE_BATCH_MAX_IDS} 条测试用例")
+
+@app.post("/api/test-cases/batch-update")
+async def batch_update_test_cases(request: TestCaseBatchUpdate, db: Session = Depends(get_db)):
+    """批量更新测试用例：将update中传入的字段应用到所有选中的用例，在一个事务中完成"""
+    _check_batch_ids(request.ids)
+    update_data = request.update.model_dump(exclude_unset=True)
+    if not update_data:
+        raise HTTPException(status_code=400, detail="没有需要更新的字段")
+
+    try:
+        updated = update_test_cases_by_ids(db, request.ids, update_data)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"批量更新测试用例失败: {str(e)}")
+    return {"message": f"已更新 {updated} 条测试用例", "updated": updated}
+
+@app.post("/api/test-cases/batch-delete")
+async def batch_delete_test_cases(request: TestCaseBatchDelete, db: Session = Depends(get_db)):
+    """批量删除测试用例，在一个事务中完成"""
+    _check_batch_ids(request.ids)
+    try:
+        deleted = delete_test_cases_by_ids(db, request.ids)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"批量删除测试用例失败: {str(e)}")
+    return {"message": f"已删除 {deleted} 条测试用例", "deleted": deleted}
+
 @app.put("/api/test-cases/{case_id}", response_model=TestCaseResponse)
 async def update_test_case(
     case_id: str,
@@ -431,6 +899,145 @@ async def delete_session(session_id: str, db: Session = Depends(get_db)):
         db.rollback()
         raise HTTPException(status_code=500, detail=f"删除会话失败: {str(e)}")
 
+def _export_session_cases(session_id: str, case_level: Optional[str], case_type: Optional[str], keyword: Optional[str]):
+    """在工作线程中按列表顺序分批读取会话的测试用例并写入xlsx临时文件"""
+    db = SessionLocal()
+    try:
+        query = db.query(TestCase).filter(TestCase.session_id == session_id, TestCase.is_retired == False)
+        if case_level:
+            query = query.filter(TestCase.case_level == case_level)
+        if case_type:
+            query = query.filter(TestCase.case_type == case_type)
+        if keyword:
+            pattern = f"%{keyword}%"
+            query = query.filter(or_(
+                TestCase.title.like(pattern),
+                TestCase.group_name.like(pattern),
+                TestCase.maintainer.like(pattern),
+                TestCase.precondition.like(pattern),
+                TestCase.step_description.like(pattern),
+                TestCase.expected_result.like(pattern)
+            ))
+        query = query.order_by(TestCase.ai_order.asc(), TestCase.created_at.asc(), TestCase.id.asc())
+        # 流式读取，每批500行，不一次加载全部用例
+        return export_test_cases_to_tempfile(query.yield_per(500))
+    finally:
+        db.close()
+
+@app.get("/api/sessions/{session_id}/usage")
+async def get_session_usage(session_id: str, db: Session = Depends(get_db)):
+    """获取会话内所有分析任务的AI用量合计，以及按任务和按模型的汇总"""
+    db_session = db.query(ChatSession).filter(ChatSession.id == session_id, ChatSession.is_deleted == False).first()
+    if not db_session:
+        raise HTTPException(status_code=404, detail="会话未找到")
+    return session_usage(db, session_id)
+
+@app.get("/api/sessions/{session_id}/export.xlsx")
+async def export_session_test_cases(
+    session_id: str,
+    case_level: Optional[str] = None,
+    case_type: Optional[str] = None,
+    keyword: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """按Teambition基础用例模板导出会话的测试用例，可按用例等级、类型和关键字筛选"""
+    db_session = db.query(ChatSession).filter(ChatSession.id == session_id, ChatSession.is_deleted == False).first()
+    if not db_session:
+        raise HTTPException(status_code=404, detail="会话未找到")
+    title = db_session.title
+
+    try:
+        path, _ = await asyncio.to_thread(_export_session_cases, session_id, case_level, case_type, keyword)
+    except Exception as e:
+        logging.error(f"导出测试用例失败: {e}")
+        raise HTTPException(status_code=500, detail=f"导出测试用例失败: {str(e)}")
+
+    filename = f"测试用例_{title}_{datetime.now().strftime('%Y%m%d%H%M%S')}.xlsx"
+    return FileResponse(
+        path,
+        media_type=XLSX_MEDIA_TYPE,
+        filename=filename,
+        background=BackgroundTask(os.remove, path)  # 发送完成后删除临时文件
+    )
+
+# 导入文件中可以省略、留空时使用默认值的字段
+IMPORT_FIELD_DEFAULTS = {"case_level": "中", "case_type": "功能测试"}
+
+def _validated_import_cases(session_id: str, path: str, file_type: str, result: Dict):
+    """逐行校验导入的用例，校验失败的行记入result["errors"]，通过的行按文件中存在的列生成写入数据"""
+    for row_number, values in iter_case_sheet_rows(path, file_type):
+        result["total"] += 1
+        if not values.get("title"):
+            result["errors"].append({"row": row_number, "message": "标题不能为空"})
+            continue
+        if len(values["title"]) > 500:
+            result["errors"].append({"row": row_number, "message": "标题长度不能超过500个字符"})
+            continue
+        for field, default in IMPORT_FIELD_DEFAULTS.items():
+            if field in values and not values[field]:
+                values[field] = default
+        try:
+            case = TestCaseCreate(session_id=session_id, **values)
+        except ValidationError as e:
+            message = "; ".join(f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors())
+            result["errors"].append({"row": row_number, "message": message})
+            continue
+        yield case.model_dump(include=set(values))
+
+def _import_session_cases(session_id: str, path: str, file_type: str) -> Dict:
+    """在工作线程中流式解析导入文件并按批写入，全部行在同一事务中提交"""
+    result = {"total": 0, "created": 0, "updated": 0, "failed": 0, "errors": []}
+    db = SessionLocal()
+    try:
+        stats = upsert_test_cases_by_title(db, session_id, _validated_import_cases(session_id, path, file_type, result))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    result.update(stats)
+    result["failed"] = len(result["errors"])
+    return result
+
+@app.post("/api/sessions/{session_id}/import", response_model=TestCaseImportResponse)
+async def import_session_test_cases(session_id: str, file: UploadFile = File(...), db: Session = Depends(get_db)):
+    """
+    按基础用例模板格式导入xlsx或csv中的测试用例：会话中已有同标题用例时更新，否则新建
+    返回逐行的校验错误，校验失败的行不影响其他行导入
+    """
+    db_session = db.query(ChatSession).filter(ChatSession.id == session_id, ChatSession.is_deleted == False).first()
+    if not db_session:
+        raise HTTPException(status_code=404, detail="会话未找到")
+
+    file_type = os.path.splitext(file.filename or "")[1].lower().lstrip(".")
+    if file_type not in ("xlsx", "csv"):
+        raise HTTPException(status_code=400, detail="仅支持导入xlsx和csv文件")
+
+    # 临时文件放在上传临时目录中，与save_upload_stream的中间文件位于同一文件系统，写完后可原子替换
+    os.makedirs(UPLOAD_TEMP_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix="import_", suffix=f".{file_type}", dir=UPLOAD_TEMP_DIR)
+    os.close(fd)
+    try:
+        try:
+            await save_upload_stream(file, temp_path)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        result = await asyncio.to_thread(_import_session_cases, session_id, temp_path, file_type)
+    except HTTPException:
+        raise
+    except CaseSheetError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logging.error(f"导入测试用例失败: {e}")
+        raise HTTPException(status_code=500, detail=f"导入测试用例失败: {str(e)}")
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    logging.info(f"会话 {session_id} 导入测试用例: 新建 {result['created']} 条，更新 {result['updated']} 条，失败 {result['failed']} 条")
+    return TestCaseImportResponse(**result)
+
 @app.get("/api/ai-config", response_model=List[AIConfigurationResponse])
 async def get_ai_configs(db: Session = Depends(get_db)):
     """获取AI配置列表"""
@@ -442,6 +1049,13 @@ async def get_ai_configs(db: Session = Depends(get_db)):
         api_endpoint=config.api_endpoint,
         model_name=config.model_name,
         api_key="***" + config.api_key[-4:] if config.api_key else "",  # 隐藏API密钥
+        context_window=config.context_window,
+        requests_per_minute=config.requests_per_minute,
+        tokens_per_minute=config.tokens_per_minute,
+        pool_name=config.pool_name,
+        weight=config.weight,
+        input_price=config.input_price,
+        output_price=config.output_price,
         is_active=config.is_active,
         created_at=config.created_at,
         updated_at=config.updated_at
@@ -461,6 +1075,13 @@ async def create_ai_config(config: AIConfigurationCreate, db: Session = Depends(
         api_endpoint=config.api_endpoint,
         model_name=config.model_name,
         api_key=config.api_key,
+        context_window=config.context_window,
+        requests_per_minute=config.requests_per_minute,
+        tokens_per_minute=config.tokens_per_minute,
+        pool_name=config.pool_name,
+        weight=config.weight if config.weight is not None else 1,
+        input_price=config.input_price,
+        output_price=config.output_price,
         is_active=config.is_active
     )
     db.add(db_config)
@@ -474,10 +1095,28 @@ async def create_ai_config(config: AIConfigurationCreate, db: Session = Depends(
         api_endpoint=db_config.api_endpoint,
         model_name=db_config.model_name,
         api_key="***" + db_config.api_key[-4:],
+        context_window=db_config.context_window,
+        requests_per_minute=db_config.requests_per_minute,
+        tokens_per_minute=db_config.tokens_per_minute,
+        pool_name=db_config.pool_name,
+        weight=db_config.weight,
+        input_price=db_config.input_price,
+        output_price=db_config.output_price,
         is_active=db_config.is_active,
         created_at=db_config.created_at,
         updated_at=db_config.updated_at
     )
 
+@app.get("/api/ai-config/usage")
+async def get_ai_config_usage(days: Optional[int] = Query(30, ge=1, le=3650, description="统计最近的天数"), db: Session = Depends(get_db)):
+    """按AI配置、模型和请求阶段汇总最近一段时间的AI用量"""
+    return config_usage(db, since=datetime.now() - timedelta(days=days))
+
+@app.get("/api/ai-config/pool-stats")
+async def get_ai_pool_stats(db: Session = Depends(get_db)):
+    """各AI配置在本进程中的请求统计（平均延迟、错误率、是否被暂时摘除）"""
+    configs = db.query(AIConfiguration).order_by(AIConfiguration.pool_name.asc(), AIConfiguration.created_at.asc()).all()
+    return get_pool_stats(configs)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
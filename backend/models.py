@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, BigInteger, Boolean, DateTime, func
+from sqlalchemy import Column, String, Text, BigInteger, Integer, Boolean, DateTime, Numeric, Index, false, func
 from sqlalchemy.dialects.mysql import LONGTEXT
 from database import Base
 
@@ -11,11 +11,23 @@ class FileUpload(Base):
     file_url = Column(Text, nullable=False)
     file_type = Column(String(100))
     file_size = Column(BigInteger)
+    content_hash = Column(String(64), index=True)  # 文件内容SHA-256
     upload_status = Column(String(20), default="completed")
     extracted_content = Column(LONGTEXT)
     analysis_suggestions = Column(Text)  # AI生成的整体分析建议
     created_at = Column(DateTime, server_default=func.now())
 
+class FileBlob(Base):
+    __tablename__ = "file_blobs"
+
+    content_hash = Column(String(64), primary_key=True)  # 文件内容SHA-256
+    file_url = Column(Text, nullable=False)
+    file_size = Column(BigInteger)
+    extracted_content = Column(LONGTEXT)  # 提取失败时为空，下次上传重新提取
+    ref_count = Column(Integer, default=0)  # 引用该文件的上传记录数，为0时可回收
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
 class TestCase(Base):
     __tablename__ = "test_cases"
 
@@ -31,6 +43,8 @@ class TestCase(Base):
     case_type = Column(String(50))
     ai_order = Column(BigInteger)  # AI返回的原始顺序
     test_suggestions = Column(Text)  # AI生成的测试建议
+    source_chunk_hash = Column(String(64), index=True)  # 生成该用例的文档块哈希，用于增量分析
+    is_retired = Column(Boolean, nullable=False, default=False, server_default=false())  # 来源块已从新版文档中移除或变更
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
@@ -55,6 +69,75 @@ class AIConfiguration(Base):
     api_endpoint = Column(Text, nullable=False)
     model_name = Column(String(100), nullable=False)
     api_key = Column(String(500), nullable=False)
+    context_window = Column(Integer)  # 模型上下文窗口（token数），为空时使用默认分块大小
+    requests_per_minute = Column(Integer)  # 服务商的每分钟请求数限额，为空时不限制
+    tokens_per_minute = Column(Integer)  # 服务商的每分钟token数限额，为空时不限制
+    pool_name = Column(String(100), index=True)  # 提供方池名称，同名的配置共同分担分块请求
+    weight = Column(Integer, default=1)  # 在提供方池中的权重，0表示不参与分担
+    input_price = Column(Numeric(12, 4))  # 每百万输入token价格，为空时不计算费用
+    output_price = Column(Numeric(12, 4))  # 每百万输出token价格
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, server_default=func.now())
-    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
\ No newline at end of file
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+
+    id = Column(String(36), primary_key=True)
+    session_id = Column(String(36), index=True)
+    file_id = Column(String(36), index=True)
+    status = Column(String(20), default="queued")  # queued/running/succeeded/failed/cancelled
+    full_reanalysis = Column(Boolean, default=False)  # 是否跳过增量分析，全部重新生成
+    progress_message = Column(Text)  # 最近一次进度描述
+    total_chunks = Column(Integer, default=0)
+    completed_chunks = Column(Integer, default=0)
+    failed_chunks = Column(Integer, default=0)
+    reused_chunks = Column(Integer, default=0)  # 内容未变化、沿用已有用例的块数
+    test_cases_count = Column(Integer, default=0)
+    retired_cases_count = Column(Integer, default=0)
+    error_message = Column(Text)
+    created_at = Column(DateTime, server_default=func.now())
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    worker_id = Column(String(100))  # 持有任务的后端进程
+    heartbeat_at = Column(DateTime)  # 持有进程最近一次续约的时间，超过租约时长未续约视为进程已退出
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_cache_entries"
+
+    cache_key = Column(String(64), primary_key=True)  # 块内容哈希+模型+端点+温度+提示词版本的SHA-256
+    model_name = Column(String(100))
+    api_endpoint = Column(Text)
+    prompt_version = Column(String(50))
+    response = Column(LONGTEXT, nullable=False)  # 解析后的AI结果（JSON）
+    size_bytes = Column(BigInteger, default=0)
+    hit_count = Column(BigInteger, default=0)
+    created_at = Column(DateTime, server_default=func.now(), index=True)
+    last_accessed_at = Column(DateTime, server_default=func.now(), index=True)
+
+class LLMCallLog(Base):
+    __tablename__ = "llm_call_logs"
+    __table_args__ = (
+        Index("idx_ai_config_created", "ai_config_id", "created_at"),
+    )
+
+    id = Column(String(36), primary_key=True)
+    job_id = Column(String(36), index=True)
+    session_id = Column(String(36), index=True)
+    file_id = Column(String(36))
+    ai_config_id = Column(String(36))  # 实际处理请求的AI配置（提供方池中的成员）
+    model_name = Column(String(100))
+    stage = Column(String(20), nullable=False)  # chunk/document/summary
+    chunk_index = Column(Integer)
+    status = Column(String(20), nullable=False)  # succeeded/failed
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    total_tokens = Column(Integer, default=0)
+    usage_estimated = Column(Boolean, default=False)  # 响应中没有usage字段，按分词器估算
+    latency_ms = Column(Integer)
+    attempts = Column(Integer, default=1)  # 含重试和切换池成员的请求次数
+    cost = Column(Numeric(14, 6))  # 按AI配置价格计算的费用，未设置价格时为空
+    error_message = Column(Text)
+    created_at = Column(DateTime, server_default=func.now(), index=True)
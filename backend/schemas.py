@@ -10,6 +10,7 @@ class FileUploadResponse(BaseModel):
     file_url: str
     file_type: Optional[str]
     file_size: Optional[int]
+    content_hash: Optional[str] = None
     upload_status: str
     extracted_content: Optional[str]
     analysis_suggestions: Optional[str]
@@ -45,6 +46,13 @@ class TestCaseUpdate(BaseModel):
     case_type: Optional[str] = None
     test_suggestions: Optional[str] = None
 
+class TestCaseBatchUpdate(BaseModel):
+    ids: List[str]
+    update: TestCaseUpdate  # 只更新传入的字段，应用到ids中的所有用例
+
+class TestCaseBatchDelete(BaseModel):
+    ids: List[str]
+
 class TestCaseResponse(TestCaseBase):
     id: str
     session_id: str
@@ -55,6 +63,34 @@ class TestCaseResponse(TestCaseBase):
     class Config:
         from_attributes = True
 
+class TestCaseListItem(BaseModel):
+    """用例列表项：通过fields参数只返回部分字段，未选择的字段不出现在响应中"""
+    id: str
+    session_id: Optional[str] = None
+    title: Optional[str] = None
+    group_name: Optional[str] = None
+    maintainer: Optional[str] = None
+    precondition: Optional[str] = None
+    step_description: Optional[str] = None
+    expected_result: Optional[str] = None
+    case_level: Optional[str] = None
+    case_type: Optional[str] = None
+    ai_order: Optional[int] = None
+    test_suggestions: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class TestCaseImportError(BaseModel):
+    row: int  # 文件中的行号（从1开始）
+    message: str
+
+class TestCaseImportResponse(BaseModel):
+    total: int  # 处理的数据行数（不含说明行、标题行、示例行和空行）
+    created: int
+    updated: int
+    failed: int
+    errors: List[TestCaseImportError] = []
+
 # ChatSession schemas
 class ChatSessionCreate(BaseModel):
     title: str
@@ -87,6 +123,13 @@ class AIConfigurationCreate(BaseModel):
     model_name: str
     api_key: str
     user_id: Optional[str] = None
+    context_window: Optional[int] = None
+    requests_per_minute: Optional[int] = None
+    tokens_per_minute: Optional[int] = None
+    pool_name: Optional[str] = None
+    weight: Optional[int] = None  # 为空时按1处理
+    input_price: Optional[float] = None
+    output_price: Optional[float] = None
     is_active: bool = True
 
 class AIConfigurationResponse(BaseModel):
@@ -96,6 +139,13 @@ class AIConfigurationResponse(BaseModel):
     api_endpoint: str
     model_name: str
     api_key: str  # 已在API中处理隐藏
+    context_window: Optional[int] = None
+    requests_per_minute: Optional[int] = None
+    tokens_per_minute: Optional[int] = None
+    pool_name: Optional[str] = None
+    weight: Optional[int] = None
+    input_price: Optional[float] = None
+    output_price: Optional[float] = None
     is_active: bool
     created_at: datetime
     updated_at: datetime
@@ -107,8 +157,32 @@ class AIConfigurationResponse(BaseModel):
 class AnalyzeRequest(BaseModel):
     file_id: str
     session_id: str
+    full_reanalysis: bool = False  # 为True时不做增量分析，所有块重新生成测试用例
 
 class AnalyzeResponse(BaseModel):
     success: bool
     message: str
-    test_cases_count: int
\ No newline at end of file
+    test_cases_count: int
+    job_id: Optional[str] = None
+    status: Optional[str] = None
+
+# AnalysisJob schemas
+class AnalysisJobResponse(BaseModel):
+    id: str
+    session_id: str
+    file_id: str
+    status: str
+    progress_message: Optional[str] = None
+    total_chunks: int = 0
+    completed_chunks: int = 0
+    failed_chunks: int = 0
+    reused_chunks: int = 0
+    test_cases_count: int = 0
+    retired_cases_count: int = 0
+    error_message: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
\ No newline at end of file
@@ -1,223 +1,280 @@
-import httpx
 import json
-import re
+import time
 import logging
-import ast
+import asyncio
+import os
+import httpx
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from models import AIConfiguration
-
-def estimate_token_count(text: str) -> int:
-    """估算文本的token数量（粗略估算）"""
-    # 中文字符通常一个字符约等于2个token
-    # 英文字符通常4个字符约等于1个token
-    chinese_chars = len(re.findall(r'[\u4e00-\u9fff]', text))
-    english_chars = len(re.findall(r'[a-zA-Z]', text))
-
-    chinese_tokens = chinese_chars * 2
-    english_tokens = english_chars / 4
-
-    return int(chinese_tokens + english_tokens)
-
-def smart_split_content(content: str, max_tokens: int = 3000) -> List[str]:
-    """
-    智能分块函数，按照标题和段落边界分割内容
-    """
-    # 估算token
-    total_tokens = estimate_token_count(content)
-
-    if total_tokens <= max_tokens:
+from utils.http_client import get_http_client
+from utils.llm_scheduler import call_with_retry, raise_for_ai_status
+from utils.provider_pool import get_pool_members
+from utils.llm_cache import build_cache_key, get_cached_result, store_result, chunk_hash
+from utils.stream_parser import IncrementalCaseParser
+from utils.json_extractor import extract_json, JSONExtractError
+from utils.chunker import count_tokens, split_content
+from utils.near_duplicates import NearDuplicateIndex, case_similarity_text, NEAR_DUPLICATE_THRESHOLD
+from utils.suggestion_reducer import reduce_suggestions, SUGGESTION_MAX_TOKENS
+from utils.prompt_templates import CHUNK_TEMPLATE, DOCUMENT_TEMPLATE, SUGGESTION_TEMPLATE
+
+# 提示词模板版本，参与AI结果缓存键的计算，模板内容变化后旧的缓存结果失效
+CHUNK_PROMPT_VERSION = CHUNK_TEMPLATE.version
+SINGLE_PROMPT_VERSION = DOCUMENT_TEMPLATE.version
+SUGGESTION_PROMPT_VERSION = SUGGESTION_TEMPLATE.version
+
+# 分块分析和整篇分析使用的采样温度
+CHUNK_TEMPERATURE = 0.8
+SINGLE_TEMPERATURE = 0.7
+# 合并分析建议时使用较低的温度，使结果稳定
+SUGGESTION_TEMPERATURE = 0.3
+
+# 不超过该token数的文档整篇分析，否则按块分析
+SMALL_DOCUMENT_TOKENS = 3000
+# AI配置未设置上下文窗口时的分块大小
+CHUNK_MAX_TOKENS = 3500
+# 分块请求允许的最大输出token数
+CHUNK_OUTPUT_TOKENS = 3000
+# 按上下文窗口计算的分块大小下限和上限（上限避免单块内容过多，输出token不足以覆盖）
+CHUNK_MIN_TOKENS = 1000
+AI_CHUNK_TOKEN_CAP = int(os.getenv("AI_CHUNK_TOKEN_CAP", "8000"))
+
+# 是否以stream模式请求AI，边生成边解析测试用例
+AI_STREAM_RESPONSES = os.getenv("AI_STREAM_RESPONSES", "false").lower() in ("1", "true", "yes")
+
+# stream模式下是否请求服务商在最后一个事件中返回usage（stream_options.include_usage），
+# 服务商不支持该参数时设为false，用量改为按分词器估算
+AI_STREAM_INCLUDE_USAGE = os.getenv("AI_STREAM_INCLUDE_USAGE", "true").lower() in ("1", "true", "yes")
+
+# 提示词统计模式：开启后记录每个分块的提示词中说明文字与文档内容各占多少token
+AI_PROMPT_STATS = os.getenv("AI_PROMPT_STATS", "false").lower() in ("1", "true", "yes")
+
+# 设置后将每次AI响应的完整内容追加写入该文件，用于排查解析问题
+AI_DEBUG_RESPONSE_LOG = os.getenv("AI_DEBUG_RESPONSE_LOG", "")
+
+# 同一AI配置（提供方池中的每个成员）允许并发执行的分块请求数
+AI_CHUNK_CONCURRENCY = int(os.getenv("AI_CHUNK_CONCURRENCY", "4"))
+
+# 每个AI配置一个信号量，限制该配置的并发分块请求
+_chunk_semaphores: Dict[tuple, asyncio.Semaphore] = {}
+
+def get_chunk_semaphore(ai_config: AIConfiguration) -> asyncio.Semaphore:
+    """获取AI配置对应的分块并发信号量，配置属于提供方池时并发数按池成员数放大"""
+    concurrency = max(1, AI_CHUNK_CONCURRENCY) * len(get_pool_members(ai_config))
+    key = (ai_config.id or ai_config.api_endpoint, concurrency)
+    semaphore = _chunk_semaphores.get(key)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(concurrency)
+        _chunk_semaphores[key] = semaphore
+    return semaphore
+
+def build_chunk_messages(chunk: str, index: int, total: int) -> List[Dict[str, str]]:
+    """构建单个文档块的分析请求消息：固定说明在前作为可缓存前缀，文档块在最后"""
+    return CHUNK_TEMPLATE.render(index=index + 1, total=total, content=chunk)
+
+def chunk_token_budget(ai_config: Optional[AIConfiguration] = None) -> int:
+    """单个分块的token预算：按模型上下文窗口扣除提示词模板和输出预留后打包"""
+    context_window = getattr(ai_config, "context_window", None)
+    if not context_window:
+        return CHUNK_MAX_TOKENS
+    prompt_overhead = CHUNK_TEMPLATE.measure(index=1, total=1, content="")["instruction_tokens"]
+    budget = context_window - prompt_overhead - CHUNK_OUTPUT_TOKENS
+    return max(CHUNK_MIN_TOKENS, min(budget, AI_CHUNK_TOKEN_CAP))
+
+def split_document(content: str, ai_config: Optional[AIConfiguration] = None) -> List[str]:
+    """按分析时的规则切分文档：小文档整篇作为一块，大文档按AI配置的token预算智能分块"""
+    if count_tokens(content) <= SMALL_DOCUMENT_TOKENS:
         return [content]
+    return split_content(content, max_tokens=chunk_token_budget(ai_config))
 
-    # 按标题分割
-    sections = []
-    current_section = ""
-    current_tokens = 0
-
-    # 使用正则表达式匹配标题（支持多种格式）
-    lines = content.split('\n')
-
-    for line in lines:
-        line_tokens = estimate_token_count(line)
-
-        # 检查是否是标题行（包含标题标识或数字编号）
-        is_heading = (
-            line.startswith('[标题') or  # 我们的格式
-            re.match(r'^(第\d+[章节篇]|[一二三四五六七八九十]+[、.]|\d+[、.])', line.strip()) or  # 中文编号
-            re.match(r'^#{1,6}\s+', line.strip()) or  # Markdown格式
-            re.match(r'^[A-Z][a-zA-Z\s]{1,50}[：:]', line.strip()) or  # 英文标题
-            (len(line.strip()) < 50 and (line.strip().endswith('：') or line.strip().endswith(':')))  # 短行以冒号结尾
-        )
-
-        # 如果当前部分加上新行会超过限制，且遇到了标题，就分割
-        if current_tokens + line_tokens > max_tokens and (is_heading or current_tokens > max_tokens * 0.8):
-            if current_section.strip():
-                sections.append(current_section.strip())
-            current_section = line + "\n"
-            current_tokens = line_tokens
-        else:
-            current_section += line + "\n"
-            current_tokens += line_tokens
-
-    # 添加最后一部分
-    if current_section.strip():
-        sections.append(current_section.strip())
-
-    # 如果还是太大，就按段落强制分割
-    final_sections = []
-    for section in sections:
-        if estimate_token_count(section) > max_tokens * 1.2:
-            # 强制按段落分割
-            paragraphs = section.split('\n\n')
-            current_part = ""
-            current_tokens = 0
-
-            for para in paragraphs:
-                para_tokens = estimate_token_count(para)
-                if current_tokens + para_tokens > max_tokens:
-                    if current_part.strip():
-                        final_sections.append(current_part.strip())
-                    current_part = para + "\n\n"
-                    current_tokens = para_tokens
-                else:
-                    current_part += para + "\n\n"
-                    current_tokens += para_tokens
-
-            if current_part.strip():
-                final_sections.append(current_part.strip())
-        else:
-            final_sections.append(section)
-
-    return final_sections
-
-async def analyze_with_ai_enhanced(content: str, ai_config: AIConfiguration, progress_callback=None, file_name=None) -> tuple[List[Dict[str, Any]], str]:
+async def analyze_with_ai_enhanced(content: str, ai_config: AIConfiguration, progress_callback=None, file_name=None, reuse_chunk_hashes: Optional[set] = None, case_callback=None, usage_callback=None, bypass_cache: bool = False) -> tuple[List[Dict[str, Any]], str]:
     """
     增强版AI分析函数，支持大文档分块分析
-    返回：(测试用例列表, 整体分析建议)
+    reuse_chunk_hashes: 已有测试用例的块哈希，这些块不再生成测试用例（增量分析）
+    case_callback: 流式响应时每解析出一个测试用例回调 case_callback(块序号, 用例)
+    usage_callback: 每次AI请求结束后回调 usage_callback(用量记录)，记录中带有chunk_index（整篇分析和建议归并时为None）
+    bypass_cache: 为True时不读取AI结果缓存，所有块重新请求AI（新结果仍写入缓存）
+    返回：(测试用例列表, 整体分析建议)，每个测试用例带有来源块的source_chunk_hash
     """
+    reuse_chunk_hashes = reuse_chunk_hashes or set()
+    # 进度事件中的tokens_used为实际消耗的token数（响应中没有usage时按分词器估算）
+    tokens_used = 0
+
+    def record_usage(record: Dict[str, Any], chunk_index: Optional[int] = None) -> None:
+        nonlocal tokens_used
+        tokens_used += record["total_tokens"]
+        if usage_callback:
+            usage_callback({**record, "chunk_index": chunk_index})
+
     try:
         # 估算token数量
-        total_tokens = estimate_token_count(content)
+        total_tokens = count_tokens(content)
         logging.info(f"文档总token数估算: {total_tokens}")
 
         # 如果内容较小，直接使用原始方法
-        if total_tokens <= 3000:
-            test_cases = await analyze_with_ai(content, ai_config)
-            # 为小文档生成简单的分析建议
-            analysis_suggestions = "建议进行全面的功能测试，覆盖所有业务流程和异常情况。"
+        if total_tokens <= SMALL_DOCUMENT_TOKENS:
+            if progress_callback:
+                progress_callback("正在分析文档...", total_chunks=1, completed_chunks=0, failed_chunks=0)
+            content_hash = chunk_hash(content)
+            cache_key = build_cache_key(content, ai_config.model_name, ai_config.api_endpoint, SINGLE_TEMPERATURE, SINGLE_PROMPT_VERSION)
+            result = None if bypass_cache else get_cached_result(cache_key)
+            if content_hash in reuse_chunk_hashes:
+                # 文档未变化，沿用已有测试用例，只取缓存中的分析建议
+                logging.info("文档内容未变化，沿用已有测试用例")
+                test_cases = []
+                reused_chunks = 1
+            else:
+                if result is None:
+                    result = await analyze_with_ai(content, ai_config, on_usage=record_usage)
+                    store_result(cache_key, ai_config.model_name, ai_config.api_endpoint, SINGLE_PROMPT_VERSION, result)
+                else:
+                    logging.info("命中AI结果缓存，跳过整篇分析请求")
+                test_cases = result.get("test_cases", [])
+                for case in test_cases:
+                    case["source_chunk_hash"] = content_hash
+                reused_chunks = 0
+            # AI未给出整体建议时，为小文档生成简单的分析建议
+            analysis_suggestions = (result or {}).get("analysis_suggestions") or "建议进行全面的功能测试，覆盖所有业务流程和异常情况。"
+            if progress_callback:
+                progress_callback(
+                    "分析完成，正在优化结果...",
+                    total_chunks=1,
+                    completed_chunks=1,
+                    failed_chunks=0,
+                    reused_chunks=reused_chunks,
+                    chunk_index=0,
+                    cases_so_far=len(test_cases),
+                    tokens_used=tokens_used
+                )
             return test_cases, analysis_suggestions
 
         # 大文档分块处理
-        chunks = smart_split_content(content, max_tokens=3500)  # 增加token限制，减少过度分割
+        chunks = split_document(content, ai_config)
+        chunk_hashes = [chunk_hash(chunk) for chunk in chunks]
         logging.info(f"文档被分割为 {len(chunks)} 个块进行分析")
 
         all_test_cases = []
         all_analysis_suggestions = []
 
-        for i, chunk in enumerate(chunks):
+        semaphore = get_chunk_semaphore(ai_config)
+        completed_count = 0
+        failed_count = 0
+        reused_count = 0
+        cases_so_far = 0
+
+        if progress_callback:
+            progress_callback(f"文档被分割为 {len(chunks)} 个部分，等待分析...", total_chunks=len(chunks), completed_chunks=0, failed_chunks=0)
+
+        async def run_chunk(i: int, chunk: str) -> Optional[Any]:
+            nonlocal completed_count, failed_count, reused_count, cases_so_far
+            # 内容未变化的块直接复用缓存结果，不占用并发名额
+            cache_key = build_cache_key(chunk, ai_config.model_name, ai_config.api_endpoint, CHUNK_TEMPERATURE, CHUNK_PROMPT_VERSION)
+            chunk_result = None if bypass_cache else get_cached_result(cache_key)
+            if chunk_hashes[i] in reuse_chunk_hashes:
+                # 增量分析：该块已有测试用例，只保留缓存中的分析建议
+                logging.info(f"第 {i+1} 个块内容未变化，沿用已有测试用例")
+                suggestions = chunk_result.get("analysis_suggestions", "") if isinstance(chunk_result, dict) else ""
+                chunk_result = {"test_cases": [], "analysis_suggestions": suggestions}
+                reused_count += 1
+            elif chunk_result is not None:
+                logging.info(f"第 {i+1} 个块命中AI结果缓存")
+            else:
+                async with semaphore:
+                    if progress_callback:
+                        progress_callback(f"正在分析第 {i+1}/{len(chunks)} 部分...")
+
+                    logging.info(f"分析第 {i+1} 个块，大小: {count_tokens(chunk)} tokens")
+
+                    # 为每个块生成请求消息，固定说明在system消息中，各块请求共享同一前缀
+                    chunk_messages = build_chunk_messages(chunk, i, len(chunks))
+                    if AI_PROMPT_STATS:
+                        stats = CHUNK_TEMPLATE.measure(index=i + 1, total=len(chunks), content=chunk)
+                        logging.info(
+                            f"第 {i+1} 个块提示词 {stats['prompt_tokens']} tokens：说明 {stats['instruction_tokens']}"
+                            f"（其中可缓存前缀 {stats['prefix_tokens']}），文档内容 {stats['content_tokens']}，"
+                            f"说明占比 {stats['instruction_tokens'] / max(1, stats['prompt_tokens']):.0%}"
+                        )
+
+                    try:
+                        on_case = (lambda case: case_callback(i, case)) if case_callback else None
+                        chunk_result = await analyze_chunk_with_ai_new(
+                            chunk_messages, ai_config, temperature=CHUNK_TEMPERATURE, on_case=on_case,
+                            on_usage=lambda record: record_usage(record, i)
+                        )
+                        store_result(cache_key, ai_config.model_name, ai_config.api_endpoint, CHUNK_PROMPT_VERSION, chunk_result)
+                    except Exception as e:
+                        logging.error(f"第 {i+1} 个块分析失败: {str(e)}，继续处理下一个块")
+                        chunk_result = None
+                        failed_count += 1
+
+            # 各块完成顺序不固定，按完成数量汇报进度
+            completed_count += 1
+            if isinstance(chunk_result, dict):
+                cases_so_far += len(chunk_result.get("test_cases") or [])
+            elif isinstance(chunk_result, list):
+                cases_so_far += len(chunk_result)
             if progress_callback:
-                progress_callback(f"正在分析第 {i+1}/{len(chunks)} 部分...")
-
-            logging.info(f"分析第 {i+1} 个块，大小: {estimate_token_count(chunk)} tokens")
-
-            # 为每个块生成专门的提示词 - 增强版，重点强调分析建议，适配Excel模板格式
-            chunk_prompt = f"""
-请详细分析以下产品需求文档片段，并生成符合Excel模板格式的全面、详细的测试用例和针对这部分内容的专门测试建议。
-
-这是第 {i+1} 部分（共 {len(chunks)} 部分），请重点关注这部分的功能需求、业务逻辑和技术实现细节。
-
-文档内容片段：
-{chunk}
-
-请按照以下格式返回JSON对象，必须包含测试用例数组和这部分的专门分析建议：
-
-```json
-{{
-  "test_cases": [
-    {{
-      "title": "测试用例标题（*必填）",
-      "group_name": "所属分组（选填，用|分隔层级，如：Web端测试用例|首页|我的待办）",
-      "maintainer": "维护人（选填，成员姓名）",
-      "precondition": "前置条件（选填，执行测试前的必要条件）",
-      "step_description": "步骤描述（选填，使用【1】、【2】等编号格式，每个步骤一行）",
-      "expected_result": "预期结果（选填，每个步骤对应的预期结果，与步骤编号对应）",
-      "case_level": "用例等级（选填：高/中/低，默认：中）",
-      "case_type": "用例类型（选填：功能测试/性能测试/安全测试/兼容性测试，默认：功能测试）",
-      "test_suggestions": "针对此测试用例的具体建议，如测试数据准备、注意事项、关联测试等"
-    }}
-  ],
-  "analysis_suggestions": "针对这部分文档内容的专门测试策略分析和建议"
-}}
-```
-
-**重要要求**（严格按照Excel模板格式）：
-
-1. **测试用例生成**（遵循Teambition导入规范）：
-   - 针对这部分文档内容生成详细的测试用例
-   - 测试用例必须覆盖所有功能点、业务场景、边界条件和异常情况
-   - 包括但不限于：正常流程、异常流程、边界值、数据验证、权限控制等
-   - **步骤描述格式**：必须使用【1】、【2】、【3】等中文编号格式，每个步骤单独一行
-   - **预期结果格式**：与步骤描述对应，使用相同的【1】、【2】、【3】编号格式
-   - **分组格式**：使用"|"分隔层级，如"Web端测试用例|首页|我的待办"
-   - **必填规则**：只有"title"是必填项，其他字段选填但建议尽可能完整
-   - 区分不同优先级：核心业务（高）、主要功能（中）、非核心功能（低）
-   - 包含多种测试类型：功能测试、性能测试、安全测试、兼容性测试等
-   - 如果这部分有多个功能模块，每个模块都要有对应的测试用例
-   - 考虑用户操作的各种可能性和错误场景
-   - 为每个测试用例提供具体的测试建议
-
-2. **分析建议生成**（重点关注）：
-   - **必须**在"analysis_suggestions"字段中，提供针对这部分文档内容的专门测试策略分析
-   - 分析这部分功能的技术特点和业务逻辑
-   - 指出这部分功能的潜在风险点和测试难点
-   - 推荐针对这部分功能的专门测试方法和测试工具
-   - 说明这部分功能与其他模块的依赖关系和集成测试要点
-   - 提供这部分功能的测试数据准备建议
-   - 分析这部分功能的性能和安全测试要点
-
-3. **内容针对性**：
-   - 分析建议必须基于这部分文档的具体内容，不能是通用模板
-   - 要体现对这部分业务逻辑和技术实现的深入理解
-   - 提供实用的、可操作的测试指导建议
-
-**Excel模板格式要求**：
-- 确保生成的JSON格式完全正确
-- 所有字段都必须有值，不能有空值或缺失字段（选填字段可以为空字符串）
-- 测试用例必须包含所有必需字段
-- analysis_suggestions字段必须包含有价值的分析内容，不能留空
-- 步骤描述和预期结果必须使用【1】、【2】、【3】的中文编号格式
-- 分组名称使用"|"分隔多个层级
-
-请直接返回JSON对象，不要包含其他文本。确保JSON格式正确且无语法错误。
-            """
-
-            try:
-                chunk_result = await analyze_chunk_with_ai_new(chunk_prompt, ai_config)
-                if chunk_result and isinstance(chunk_result, dict) and "test_cases" in chunk_result:
-                    all_test_cases.extend(chunk_result["test_cases"])
-                    # 收集分析建议
-                    if "analysis_suggestions" in chunk_result and chunk_result["analysis_suggestions"]:
-                        all_analysis_suggestions.append(chunk_result["analysis_suggestions"])
-                    logging.info(f"第 {i+1} 个块分析完成，生成 {len(chunk_result['test_cases'])} 个测试用例")
-                elif isinstance(chunk_result, list):  # 兼容旧格式
-                    all_test_cases.extend(chunk_result)
-                    logging.info(f"第 {i+1} 个块分析完成，生成 {len(chunk_result)} 个测试用例")
-                else:
-                    logging.warning(f"第 {i+1} 个块未生成测试用例，继续处理下一个块")
-            except Exception as e:
-                logging.error(f"第 {i+1} 个块分析失败: {str(e)}，继续处理下一个块")
-                continue
+                progress_callback(
+                    f"已完成 {completed_count}/{len(chunks)} 部分分析",
+                    total_chunks=len(chunks),
+                    completed_chunks=completed_count,
+                    failed_chunks=failed_count,
+                    reused_chunks=reused_count,
+                    chunk_index=i,
+                    cases_so_far=cases_so_far,
+                    tokens_used=tokens_used
+                )
+            return chunk_result
+
+        # 并发分析所有块，gather按提交顺序返回结果，保证ai_order稳定
+        chunk_results = await asyncio.gather(*(run_chunk(i, chunk) for i, chunk in enumerate(chunks)))
+
+        for i, chunk_result in enumerate(chunk_results):
+            # 记录测试用例的来源块，供后续增量分析比对
+            if isinstance(chunk_result, dict):
+                chunk_cases = chunk_result.get("test_cases") or []
+            elif isinstance(chunk_result, list):
+                chunk_cases = chunk_result
+            else:
+                chunk_cases = []
+            for case in chunk_cases:
+                if isinstance(case, dict):
+                    case["source_chunk_hash"] = chunk_hashes[i]
+
+            if chunk_result and isinstance(chunk_result, dict) and "test_cases" in chunk_result:
+                all_test_cases.extend(chunk_result["test_cases"])
+                # 收集分析建议
+                if "analysis_suggestions" in chunk_result and chunk_result["analysis_suggestions"]:
+                    all_analysis_suggestions.append(chunk_result["analysis_suggestions"])
+                logging.info(f"第 {i+1} 个块分析完成，生成 {len(chunk_result['test_cases'])} 个测试用例")
+            elif isinstance(chunk_result, list):  # 兼容旧格式
+                all_test_cases.extend(chunk_result)
+                logging.info(f"第 {i+1} 个块分析完成，生成 {len(chunk_result)} 个测试用例")
+            else:
+                logging.warning(f"第 {i+1} 个块未生成测试用例，继续处理下一个块")
 
         # 去重和优化
         unique_cases = deduplicate_test_cases(all_test_cases)
         logging.info(f"分析完成，共生成 {len(unique_cases)} 个去重后的测试用例")
 
-        # 合并所有分析建议 - 使用AI生成的建议，如果没有则生成简单的提示
+        # 合并所有分析建议：去重后仍过长时由AI树形归并为一份整体测试策略，如果没有则生成简单的提示
+        combined_suggestions = ""
+        summary_tokens = 0
         if all_analysis_suggestions:
-            # 使用AI生成的分析建议
-            combined_suggestions = "\n\n".join(all_analysis_suggestions)
-            logging.info(f"使用AI生成的分析建议，共 {len(all_analysis_suggestions)} 条")
-        else:
+            if progress_callback:
+                progress_callback(f"正在合并 {len(all_analysis_suggestions)} 个部分的分析建议...")
+
+            def report_reduce(level: int, used: int) -> None:
+                if progress_callback:
+                    progress_callback(f"正在合并分析建议（已完成第 {level} 轮）...", tokens_used=tokens_used, summary_tokens=used)
+
+            combined_suggestions, summary_tokens = await reduce_suggestions(
+                all_analysis_suggestions,
+                lambda messages: summarize_suggestions(messages, ai_config, on_usage=record_usage, bypass_cache=bypass_cache),
+                progress_callback=report_reduce
+            )
+            logging.info(f"使用AI生成的分析建议，共 {len(all_analysis_suggestions)} 条，合并后 {len(combined_suggestions)} 字符，合并消耗 {summary_tokens} tokens")
+        if not combined_suggestions:
             # 只有在AI确实没有生成任何建议时才使用简单的提示
             combined_suggestions = f"""
 基于对《{file_name or '当前文档'}》的分析，AI已为您生成了 {len(unique_cases)} 个详细的测试用例。
@@ -228,7 +285,7 @@ async def analyze_with_ai_enhanced(content: str, ai_config: AIConfiguration, pro
             logging.info("AI未生成整体分析建议，使用简单提示")
 
         if progress_callback:
-            progress_callback("分析完成，正在优化结果...")
+            progress_callback("分析完成，正在优化结果...", tokens_used=tokens_used, summary_tokens=summary_tokens)
 
         return unique_cases, combined_suggestions
 
@@ -237,19 +294,211 @@ async def analyze_with_ai_enhanced(content: str, ai_config: AIConfiguration, pro
         # 直接抛出异常，不再返回默认测试用例
         raise Exception(f"AI分析失败: {str(e)}")
 
-async def analyze_chunk_with_ai_new(prompt: str, ai_config: AIConfiguration) -> Dict[str, Any]:
-    """分析单个块的AI请求"""
+async def summarize_suggestions(messages: List[Dict[str, str]], ai_config: AIConfiguration, on_usage=None, bypass_cache: bool = False) -> tuple[str, int]:
+    """
+    请求AI合并一组分析建议，结果按提示词缓存，与分块请求共用并发名额
+    on_usage: 请求结束后回调 on_usage(用量记录)
+    bypass_cache: 为True时不读取缓存
+    返回：(合并后的建议, 本次请求消耗的token数，命中缓存时为0)
+    """
+    # system消息由模板版本确定，缓存键只需包含user消息
+    cache_key = build_cache_key(messages[-1]["content"], ai_config.model_name, ai_config.api_endpoint, SUGGESTION_TEMPERATURE, SUGGESTION_PROMPT_VERSION)
+    cached = None if bypass_cache else get_cached_result(cache_key)
+    if isinstance(cached, dict) and cached.get("text"):
+        return cached["text"], 0
+
+    request_data = {
+        "model": ai_config.model_name,
+        "messages": messages,
+        "temperature": SUGGESTION_TEMPERATURE,
+        "max_tokens": SUGGESTION_MAX_TOKENS
+    }
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {ai_config.api_key}"
+    }
+    async with get_chunk_semaphore(ai_config):
+        result = await post_chat_completion_with_usage("summary", request_data, headers, ai_config, on_usage)
+    if "choices" not in result or not result["choices"]:
+        raise Exception("AI返回结果格式错误：缺少choices字段")
+
+    text = (result["choices"][0]["message"]["content"] or "").strip()
+    used = response_total_tokens(result)
+    if used is None:
+        used = sum(count_tokens(message["content"]) for message in messages) + count_tokens(text)
+    if text:
+        store_result(cache_key, ai_config.model_name, ai_config.api_endpoint, SUGGESTION_PROMPT_VERSION, {"text": text})
+    return text, used
+
+def usage_cost(ai_config: AIConfiguration, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """按AI配置的每百万token价格计算费用，未设置价格时返回None"""
+    input_price = getattr(ai_config, "input_price", None)
+    output_price = getattr(ai_config, "output_price", None)
+    if input_price is None and output_price is None:
+        return None
+    return (prompt_tokens * float(input_price or 0) + completion_tokens * float(output_price or 0)) / 1_000_000
+
+def build_usage_record(stage: str, ai_config: AIConfiguration, request_data: Dict[str, Any], call_info: Dict[str, Any], started_at: float,
+                       usage: Optional[Dict[str, Any]] = None, completion_text: str = "", error: Optional[Exception] = None) -> Dict[str, Any]:
+    """
+    构建一次AI请求的用量记录：token数取响应中的usage字段，没有时按分词器估算；
+    费用按实际处理请求的池成员的价格计算
+    """
+    member = call_info.get("member") or ai_config
+    usage = usage if isinstance(usage, dict) else {}
+    prompt_tokens = usage.get("prompt_tokens")
+    completion_tokens = usage.get("completion_tokens")
+    estimated = False
+    if not isinstance(prompt_tokens, int) or not isinstance(completion_tokens, int):
+        if error is not None:
+            # 请求失败没有生成内容，服务商不计费
+            prompt_tokens = completion_tokens = 0
+        else:
+            prompt_tokens = sum(count_tokens(message.get("content") or "") for message in request_data.get("messages", []))
+            completion_tokens = count_tokens(completion_text)
+            estimated = True
+    return {
+        "stage": stage,
+        "ai_config_id": member.id,
+        "model_name": member.model_name,
+        "status": "failed" if error is not None else "succeeded",
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "usage_estimated": estimated,
+        "latency_ms": int((time.monotonic() - started_at) * 1000),
+        "attempts": call_info.get("attempts", 1),
+        "cost": usage_cost(member, prompt_tokens, completion_tokens),
+        "error_message": str(error)[:1000] if error is not None else None
+    }
+
+def estimate_request_tokens(request_data: Dict[str, Any]) -> int:
+    """预估一次请求占用的token数（提示词+最大输出），用于按配置的TPM限流"""
+    prompt_tokens = sum(count_tokens(message.get("content") or "") for message in request_data.get("messages", []))
+    return prompt_tokens + int(request_data.get("max_tokens") or CHUNK_OUTPUT_TOKENS)
+
+def response_total_tokens(result: Dict[str, Any]) -> Optional[int]:
+    """响应中usage字段记录的实际token用量"""
+    usage = result.get("usage") if isinstance(result, dict) else None
+    total = usage.get("total_tokens") if isinstance(usage, dict) else None
+    return total if isinstance(total, int) else None
+
+def request_for_member(request_data: Dict[str, Any], headers: Dict[str, str], member: AIConfiguration) -> tuple[Dict[str, Any], Dict[str, str]]:
+    """将按主配置构建的请求改为发往提供方池中的某个成员：替换模型名和API密钥"""
+    return (
+        {**request_data, "model": member.model_name},
+        {**headers, "Authorization": f"Bearer {member.api_key}"}
+    )
+
+async def post_chat_completion(request_data: Dict[str, Any], headers: Dict[str, str], ai_config: AIConfiguration, call_info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    发送chat/completions请求并返回响应JSON：在AI配置所在的提供方池中选择成员，
+    按成员限额排队，失败时切换成员或退避重试
+    call_info: 传入字典时记录尝试次数和实际处理请求的成员配置
+    """
+    async def send(member: AIConfiguration) -> Dict[str, Any]:
+        member_request, member_headers = request_for_member(request_data, headers, member)
+        response = await get_http_client(member.api_endpoint).post(
+            member.api_endpoint + "/chat/completions",
+            json=member_request,
+            headers=member_headers
+        )
+        raise_for_ai_status(response)
+        return response.json()
+
+    return await call_with_retry(ai_config, estimate_request_tokens(request_data), send, usage_of=response_total_tokens, call_info=call_info)
+
+async def post_chat_completion_with_usage(stage: str, request_data: Dict[str, Any], headers: Dict[str, str], ai_config: AIConfiguration, on_usage=None) -> Dict[str, Any]:
+    """发送chat/completions请求，请求结束（成功或失败）后回调 on_usage(用量记录)"""
+    call_info = {}
+    started_at = time.monotonic()
+    try:
+        result = await post_chat_completion(request_data, headers, ai_config, call_info)
+    except Exception as e:
+        if on_usage:
+            on_usage(build_usage_record(stage, ai_config, request_data, call_info, started_at, error=e))
+        raise
+    if on_usage:
+        choices = result.get("choices") or [{}]
+        completion_text = (choices[0].get("message") or {}).get("content") or ""
+        on_usage(build_usage_record(stage, ai_config, request_data, call_info, started_at, result.get("usage"), completion_text))
+    return result
+
+async def request_chat_completion_stream(request_data: Dict[str, Any], headers: Dict[str, str], ai_config: AIConfiguration, on_case=None) -> tuple[str, List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    以stream模式请求AI，边接收边解析，每解析出一个完整的测试用例对象就回调on_case
+    返回：(完整响应文本, 流式解析出的测试用例列表, 服务商返回的usage)
+    """
+    parser = IncrementalCaseParser()
+    content_parts = []
+    streamed_cases = []
+    usage = None
+
+    stream_request = {**request_data, "stream": True}
+    if AI_STREAM_INCLUDE_USAGE:
+        stream_request["stream_options"] = {"include_usage": True}
+
+    client = get_http_client(ai_config.api_endpoint)
+    try:
+        async with client.stream(
+            "POST",
+            ai_config.api_endpoint + "/chat/completions",
+            json=stream_request,
+            headers=headers
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise_for_ai_status(response)
+
+            async for line in response.aiter_lines():
+                line = line.strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    event = json.loads(data)
+                except json.JSONDecodeError:
+                    logging.warning(f"无法解析的流式响应片段: {data[:200]}")
+                    continue
+
+                # usage在最后一个事件中返回，该事件的choices通常为空
+                if isinstance(event.get("usage"), dict):
+                    usage = event["usage"]
+                choices = event.get("choices") or []
+                if not choices:
+                    continue
+                delta = choices[0].get("delta") or {}
+                text = delta.get("content")
+                if not text:
+                    continue
+
+                content_parts.append(text)
+                for case in parser.feed(text):
+                    streamed_cases.append(case)
+                    if on_case:
+                        on_case(case)
+    except httpx.HTTPError as e:
+        # 已经推送过测试用例时中断不再重试，避免重复推送
+        if streamed_cases:
+            raise Exception(f"流式响应中断: {e}") from e
+        raise
+
+    return "".join(content_parts).strip(), streamed_cases, usage
+
+async def analyze_chunk_with_ai_new(messages: List[Dict[str, str]], ai_config: AIConfiguration, temperature: float = CHUNK_TEMPERATURE, on_case=None, on_usage=None) -> Dict[str, Any]:
+    """
+    分析单个块的AI请求
+    on_case: 启用流式响应时，每解析出一个测试用例即回调，用于实时推送
+    on_usage: 请求结束（成功或失败）后回调 on_usage(用量记录)，记录格式见build_usage_record
+    """
     try:
         request_data = {
             "model": ai_config.model_name,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "temperature": 0.8,  # 提高温度以增加多样性
-            "max_tokens": 3000  # 增加token限制，允许生成更多测试用例
+            "messages": messages,
+            "temperature": temperature,  # 提高温度以增加多样性
+            "max_tokens": CHUNK_OUTPUT_TOKENS  # 增加token限制，允许生成更多测试用例
         }
 
         headers = {
@@ -257,26 +506,36 @@ async def analyze_chunk_with_ai_new(prompt: str, ai_config: AIConfiguration) ->
             "Authorization": f"Bearer {ai_config.api_key}"
         }
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                ai_config.api_endpoint + "/chat/completions",
-                json=request_data,
-                headers=headers
-            )
-
-        if response.status_code != 200:
-            error_msg = f"AI API请求失败: {response.status_code} - {response.text}"
-            logging.error(error_msg)
-            raise Exception(error_msg)
-
-        result = response.json()
-
-        if "choices" not in result or not result["choices"]:
-            error_msg = "AI返回结果格式错误：缺少choices字段"
-            logging.error(error_msg)
-            raise Exception(error_msg)
-
-        ai_response = result["choices"][0]["message"]["content"].strip()
+        streamed_cases = []
+        usage = None
+        call_info = {}
+        started_at = time.monotonic()
+        try:
+            if AI_STREAM_RESPONSES:
+                # 只有收到响应内容之前的失败会重试，已推送的用例不会重复
+                ai_response, streamed_cases, usage = await call_with_retry(
+                    ai_config,
+                    estimate_request_tokens(request_data),
+                    lambda member: request_chat_completion_stream(*request_for_member(request_data, headers, member), member, on_case),
+                    usage_of=lambda result: response_total_tokens({"usage": result[2]}),
+                    call_info=call_info
+                )
+            else:
+                result = await post_chat_completion(request_data, headers, ai_config, call_info)
+                usage = result.get("usage")
+
+                if "choices" not in result or not result["choices"]:
+                    error_msg = "AI返回结果格式错误：缺少choices字段"
+                    logging.error(error_msg)
+                    raise Exception(error_msg)
+
+                ai_response = result["choices"][0]["message"]["content"].strip()
+        except Exception as e:
+            if on_usage:
+                on_usage(build_usage_record("chunk", ai_config, request_data, call_info, started_at, usage, error=e))
+            raise
+        if on_usage:
+            on_usage(build_usage_record("chunk", ai_config, request_data, call_info, started_at, usage, ai_response))
 
         # 记录AI响应的详细信息用于调试
         logging.info(f"AI响应内容预览: {ai_response[:500]}...")
@@ -284,270 +543,62 @@ async def analyze_chunk_with_ai_new(prompt: str, ai_config: AIConfiguration) ->
         logging.info(f"AI响应前50字符: {repr(ai_response[:50])}")
         logging.info(f"AI响应后50字符: {repr(ai_response[-50:])}")
 
-        # 强制记录完整的AI响应到单独的文件用于调试
-        with open('/tmp/ai_response_debug.log', 'a', encoding='utf-8') as f:
-            f.write(f"\n\n=== AI响应完整内容 ===\n")
-            f.write(f"时间: {datetime.now()}\n")
-            f.write(f"长度: {len(ai_response)}\n")
-            f.write(f"内容: {repr(ai_response)}\n")
-            f.write(f"原始内容:\n{ai_response}\n")
-            f.write(f"字符分析:\n")
-            f.write(f"  第一个字符: {repr(ai_response[0]) if ai_response else '空'} (ord: {ord(ai_response[0]) if ai_response else 'N/A'})\n")
-            f.write(f"  最后一个字符: {repr(ai_response[-1]) if ai_response else '空'} (ord: {ord(ai_response[-1]) if ai_response else 'N/A'})\n")
-            f.write(f"  是否以[开头: {ai_response.startswith('[') if ai_response else False}\n")
-            f.write(f"  是否以]结尾: {ai_response.endswith(']') if ai_response else False}\n")
-            # 尝试手动验证JSON格式
-            try:
-                json.loads(ai_response)
-                f.write(f"  手动JSON验证: 成功\n")
-            except Exception as json_e:
-                f.write(f"  手动JSON验证: 失败 - {json_e}\n")
-
-        # 检查是否包含特定的markdown标记
-        if '```json' in ai_response:
-            logging.info("发现```json标记")
-        if '```' in ai_response:
-            logging.info("发现```标记")
-        if ai_response.strip().startswith('['):
-            logging.info("AI响应以[开头")
-        if ai_response.strip().endswith(']'):
-            logging.info("AI响应以]结尾")
-
-        # 解析JSON响应 - 简化和强化的提取逻辑
-        logging.info("开始JSON解析过程")
-
-        # 方法1: 直接尝试解析整个响应
-        try:
-            result = json.loads(ai_response)
-            if isinstance(result, dict) and "test_cases" in result:
-                logging.info("直接JSON解析成功 - 新格式")
-                return result
-            elif isinstance(result, list):
-                logging.info("直接JSON解析成功 - 旧格式")
-                return {"test_cases": result, "analysis_suggestions": ""}
-        except Exception as e:
-            logging.info(f"直接JSON解析失败: {e}")
-            logging.info(f"失败时的响应类型: {type(ai_response)}")
-            logging.info(f"响应长度: {len(ai_response)}")
-            logging.info(f"响应前100字符: {repr(ai_response[:100])}")
-            logging.info(f"响应后100字符: {repr(ai_response[-100:])}")
-
-        # 方法2: 提取```json代码块
-        try:
-            # 查找```json标记
-            json_start = ai_response.find('```json')
-            if json_start != -1:
-                json_start += 7  # 跳过"```json"
-                json_end = ai_response.find('```', json_start)
-                if json_end != -1:
-                    json_content = ai_response[json_start:json_end].strip()
-                    result = json.loads(json_content)
-                    if isinstance(result, dict) and "test_cases" in result:
-                        logging.info("```json代码块解析成功 - 新格式")
-                        return result
-                    elif isinstance(result, list):
-                        logging.info("```json代码块解析成功 - 旧格式")
-                        return {"test_cases": result, "analysis_suggestions": ""}
-        except Exception as e:
-            logging.info(f"```json代码块解析失败: {e}")
-
-        # 方法3: 提取任何```代码块中的JSON
-        try:
-            code_start = ai_response.find('```')
-            if code_start != -1:
-                code_start += 3
-                code_end = ai_response.find('```', code_start)
-                if code_end != -1:
-                    code_content = ai_response[code_start:code_end].strip()
-                    # 尝试解析代码块内容
-                    result = json.loads(code_content)
-                    if isinstance(result, dict) and "test_cases" in result:
-                        logging.info("```代码块解析成功 - 新格式")
-                        return result
-                    elif isinstance(result, list):
-                        logging.info("```代码块解析成功 - 旧格式")
-                        return {"test_cases": result, "analysis_suggestions": ""}
-        except Exception as e:
-            logging.info(f"```代码块解析失败: {e}")
-
-        # 方法4: 使用正则表达式提取JSON对象或数组
-        try:
-            # 首先尝试匹配包含test_cases的对象
-            json_match = re.search(r'\{[\s\S]*"test_cases"[\s\S]*\}', ai_response)
-            if json_match:
-                result = json.loads(json_match.group())
-                if isinstance(result, dict) and "test_cases" in result:
-                    logging.info("正则表达式JSON对象解析成功 - 新格式")
-                    return result
-
-            # 如果没有找到对象，尝试匹配数组
-            json_match = re.search(r'\[[\s\S]*\]', ai_response)
-            if json_match:
-                result = json.loads(json_match.group())
-                if isinstance(result, list):
-                    logging.info("正则表达式JSON数组解析成功 - 旧格式")
-                    return {"test_cases": result, "analysis_suggestions": ""}
-        except Exception as e:
-            logging.info(f"正则表达式JSON解析失败: {e}")
-
-        # 方法5: 处理截断的JSON响应 - 尝试修复不完整的JSON
-        try:
-            logging.info("尝试修复截断的JSON响应")
-            # 尝试找到最后一个完整的JSON对象
-            # 从后往前查找完整的对象结尾
-            fixed_json = ai_response
-
-            # 如果响应被截断，尝试补全
-            if not fixed_json.strip().endswith('}'):
-                # 查找最后一个完整的对象
-                last_complete_obj = fixed_json.rfind('}')
-                if last_complete_obj != -1:
-                    # 移除不完整的部分，补全对象
-                    fixed_json = fixed_json[:last_complete_obj + 1]
-                    logging.info(f"尝试修复JSON，原长度: {len(ai_response)}, 修复后长度: {len(fixed_json)}")
-
-                    result = json.loads(fixed_json)
-                    if isinstance(result, dict) and "test_cases" in result:
-                        logging.info(f"截断JSON修复成功 - 新格式，获得 {len(result.get('test_cases', []))} 个测试用例")
-                        return result
-                    elif isinstance(result, list):
-                        logging.info(f"截断JSON修复成功 - 旧格式，获得 {len(result)} 个测试用例")
-                        return {"test_cases": result, "analysis_suggestions": ""}
-        except Exception as e:
-            logging.info(f"截断JSON修复失败: {e}")
+        # 按需记录完整的AI响应到单独的文件用于调试
+        if AI_DEBUG_RESPONSE_LOG:
+            with open(AI_DEBUG_RESPONSE_LOG, 'a', encoding='utf-8') as f:
+                f.write(f"\n\n=== AI响应完整内容 ===\n")
+                f.write(f"时间: {datetime.now()}\n")
+                f.write(f"长度: {len(ai_response)}\n")
+                f.write(f"原始内容:\n{ai_response}\n")
 
-        # 方法6: 提取所有完整的JSON对象
         try:
-            logging.info("尝试提取所有完整的JSON对象")
-            # 使用正则表达式找到所有完整的JSON对象
-            object_matches = re.findall(r'\{[^{}]*\}', ai_response)
-            if object_matches:
-                # 构建一个JSON数组
-                json_array = '[' + ','.join(object_matches) + ']'
-                test_cases = json.loads(json_array)
-                if isinstance(test_cases, list) and len(test_cases) > 0:
-                    logging.info(f"提取完整JSON对象成功，获得 {len(test_cases)} 个测试用例")
-                    return {"test_cases": test_cases, "analysis_suggestions": ""}
-        except Exception as e:
-            logging.info(f"提取完整JSON对象失败: {e}")
-
-        # 方法7: 使用Python的ast.literal_eval作为最后手段
-        try:
-            logging.info("尝试使用ast.literal_eval解析")
-            # 提取看起来最像JSON数组的部分
-            json_match = re.search(r'\[.*\]', ai_response, re.DOTALL)
-            if json_match:
-                json_content = json_match.group()
-                # 尝试修复常见的JSON语法错误
-                # 1. 移除尾随逗号
-                json_content = re.sub(r',(\s*[}\]])', r'\1', json_content)
-                # 2. 确保字符串引号正确
-                json_content = re.sub(r'([{,]\s*)([a-zA-Z_][a-zA-Z0-9_]*)\s*:', r'\1"\2":', json_content)
-
-                test_cases = ast.literal_eval(json_content)
-                if isinstance(test_cases, list) and len(test_cases) > 0:
-                    logging.info(f"ast.literal_eval解析成功，获得 {len(test_cases)} 个测试用例")
-                    return {"test_cases": test_cases, "analysis_suggestions": ""}
-        except Exception as e:
-            logging.info(f"ast.literal_eval解析失败: {e}")
-
-        # 方法8: 手动提取测试用例信息
-        try:
-            logging.info("尝试手动提取测试用例信息")
-            test_cases = []
-
-            # 查找所有看起来像是测试用例的对象
-            case_pattern = r'\{\s*"title":\s*"([^"]*)"[^}]*\}'
-            matches = re.findall(case_pattern, ai_response, re.DOTALL)
-
-            if matches:
-                for i, title in enumerate(matches):
-                    test_case = {
-                        "title": title,
-                        "group_name": f"功能组{i+1}",
-                        "maintainer": "测试人员",
-                        "precondition": "系统正常运行",
-                        "step_description": "请补充具体测试步骤",
-                        "expected_result": "请补充预期结果",
-                        "case_level": "中",
-                        "case_type": "功能测试",
-                        "test_suggestions": ""
-                    }
-                    test_cases.append(test_case)
-
-                if test_cases:
-                    logging.info(f"手动提取成功，获得 {len(test_cases)} 个基础测试用例")
-                    return {"test_cases": test_cases, "analysis_suggestions": ""}
-        except Exception as e:
-            logging.info(f"手动提取失败: {e}")
-
-        # 所有方法都失败
-        error_msg = f"所有JSON提取方法都失败。AI响应内容: {ai_response[:500]}..."
-        logging.error(error_msg)
-        raise Exception(error_msg)
+            return parse_chunk_response(ai_response)
+        except Exception:
+            # 流式解析已拿到完整的测试用例对象时，整体解析失败也不丢弃这些用例
+            if streamed_cases:
+                logging.info(f"整体解析失败，使用流式解析得到的 {len(streamed_cases)} 个测试用例")
+                return {"test_cases": streamed_cases, "analysis_suggestions": ""}
+            raise
 
     except Exception as e:
         logging.error(f"块分析错误: {str(e)}")
         # 抛出异常，让上层处理
         raise Exception(f"块分析失败: {str(e)}")
 
-def parse_json_content(json_content: str) -> List[Dict[str, Any]]:
-    """解析JSON内容，支持多种容错模式"""
-    print(f"[DEBUG] 进入parse_json_content，内容长度: {len(json_content)}")
-    logging.info(f"进入parse_json_content，内容长度: {len(json_content)}")
-
+def parse_chunk_response(ai_response: str) -> Dict[str, Any]:
+    """从块分析的AI响应中提取测试用例和分析建议"""
     try:
-        # 记录要解析的内容长度
-        logging.info(f"正在解析JSON内容，长度: {len(json_content)} 字符")
-        logging.info(f"JSON内容预览: {json_content[:200]}...")
-
-        # 清理常见的前缀问题（如多余的"json"文字）
-        cleaned_content = json_content.strip()
-        if cleaned_content.startswith('json\n') or cleaned_content.startswith('json\r\n'):
-            cleaned_content = cleaned_content[5:].strip()
-            logging.info("清理了'json'前缀")
-
-        # 尝试标准解析
-        print(f"[DEBUG] 尝试标准JSON解析...")
-        test_cases = json.loads(cleaned_content)
-        print(f"[DEBUG] 标准JSON解析成功，获得 {len(test_cases) if isinstance(test_cases, list) else 0} 个测试用例")
-        logging.info(f"标准JSON解析成功，获得 {len(test_cases) if isinstance(test_cases, list) else 0} 个测试用例")
-        return test_cases if isinstance(test_cases, list) else []
-    except json.JSONDecodeError as e:
-        print(f"[DEBUG] 标准JSON解析失败: {e}")
-        logging.warning(f"标准JSON解析失败: {e}")
-        logging.info(f"失败的JSON内容前200字符: {json_content[:200]}...")
-
-        # 尝试非严格模式
-        print(f"[DEBUG] 尝试非严格JSON解析...")
-        try:
-            test_cases = json.loads(cleaned_content, strict=False)
-            print(f"[DEBUG] 非严格JSON解析成功，获得 {len(test_cases) if isinstance(test_cases, list) else 0} 个测试用例")
-            logging.info(f"非严格JSON解析成功，获得 {len(test_cases) if isinstance(test_cases, list) else 0} 个测试用例")
-            return test_cases if isinstance(test_cases, list) else []
-        except Exception as e2:
-            print(f"[DEBUG] 非严格JSON解析失败: {e2}")
-            logging.warning(f"非严格JSON解析失败: {e2}")
-
-            # 尝试修复常见的JSON问题
-            print(f"[DEBUG] 尝试JSON修复解析...")
-            try:
-                # 修复未转义的换行符
-                fixed_content = cleaned_content.replace('\n', '\\n').replace('\r', '\\r')
-                test_cases = json.loads(fixed_content, strict=False)
-                print(f"[DEBUG] JSON修复解析成功，获得 {len(test_cases) if isinstance(test_cases, list) else 0} 个测试用例")
-                logging.info(f"JSON修复解析成功，获得 {len(test_cases) if isinstance(test_cases, list) else 0} 个测试用例")
-                return test_cases if isinstance(test_cases, list) else []
-            except Exception as e3:
-                print(f"[DEBUG] JSON修复解析失败: {e3}")
-                logging.error(f"JSON修复解析失败: {e3}")
-                logging.error(f"最终失败的JSON内容: {cleaned_content[:500]}...")
-                return []
-
-def deduplicate_test_cases(test_cases: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """测试用例去重和优化"""
+        result, repairs = extract_json(ai_response)
+    except JSONExtractError as e:
+        error_msg = f"无法从AI响应中提取JSON（已尝试修复: {', '.join(e.repairs) or '无'}）: {e}。AI响应内容: {ai_response[:500]}..."
+        logging.error(error_msg)
+        raise Exception(error_msg)
+
+    if repairs:
+        logging.info(f"AI响应JSON已修复: {', '.join(repairs)}")
+
+    if isinstance(result, dict) and "test_cases" in result:
+        return result
+    if isinstance(result, list):
+        return {"test_cases": result, "analysis_suggestions": ""}
+    if isinstance(result, dict) and result.get("title"):
+        return {"test_cases": [result], "analysis_suggestions": ""}
+
+    error_msg = f"AI响应JSON中没有测试用例。AI响应内容: {ai_response[:500]}..."
+    logging.error(error_msg)
+    raise Exception(error_msg)
+
+def deduplicate_test_cases(test_cases: List[Dict[str, Any]], similarity_threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    测试用例去重和优化：先去掉标题完全相同的用例，再去掉改写后的近似重复用例（"标题+步骤+预期结果"相似且标题本身也相似），保留先出现的；
+    去掉的每个近似重复用例都记录日志，便于核对误判
+    similarity_threshold: 近似重复阈值，默认取NEAR_DUPLICATE_THRESHOLD，0表示只按标题去重
+    """
+    threshold = NEAR_DUPLICATE_THRESHOLD if similarity_threshold is None else similarity_threshold
+    near_index = NearDuplicateIndex(threshold) if threshold > 0 else None
     seen_titles = set()
     unique_cases = []
+    near_duplicate_count = 0
 
     for case in test_cases:
         if not isinstance(case, dict):
@@ -559,6 +610,14 @@ def deduplicate_test_cases(test_cases: List[Dict[str, Any]]) -> List[Dict[str, A
 
         seen_titles.add(title)
 
+        if near_index is not None:
+            text, numbers = case_similarity_text(case)
+            duplicate_of = near_index.find_or_add(len(unique_cases), text, numbers, title=title)
+            if duplicate_of is not None:
+                near_duplicate_count += 1
+                logging.info(f"去除近似重复用例: 「{title}」与「{unique_cases[duplicate_of]['title']}」重复")
+                continue
+
         # 标准化测试用例格式
         standardized_case = {
             "title": title,
@@ -569,88 +628,27 @@ def deduplicate_test_cases(test_cases: List[Dict[str, Any]]) -> List[Dict[str, A
             "expected_result": case.get("expected_result", "请补充预期结果").strip() or "请补充预期结果",
             "case_level": case.get("case_level", "中").strip() or "中",
             "case_type": case.get("case_type", "功能测试").strip() or "功能测试",
-            "test_suggestions": case.get("test_suggestions", "").strip() or ""
+            "test_suggestions": case.get("test_suggestions", "").strip() or "",
+            "source_chunk_hash": case.get("source_chunk_hash")
         }
 
         unique_cases.append(standardized_case)
 
+    if near_duplicate_count:
+        logging.info(f"去除近似重复测试用例 {near_duplicate_count} 个（相似度阈值 {threshold}）")
     return unique_cases
 
-async def analyze_with_ai(content: str, ai_config: AIConfiguration) -> List[Dict[str, Any]]:
+async def analyze_with_ai(content: str, ai_config: AIConfiguration, on_usage=None) -> List[Dict[str, Any]]:
     """
     使用AI分析文档内容并生成符合Excel模板格式的测试用例
+    on_usage: 请求结束后回调 on_usage(用量记录)
     """
     try:
-        # 构建提示词 - 适配Excel模板格式
-        prompt = f"""
-请详细分析以下产品需求文档(PRD)，并生成符合Excel模板格式的全面、详细的测试用例。
-
-文档内容：
-{content}
-
-请按照以下格式返回JSON数组，每个测试用例包含以下字段：
-
-```json
-[
-  {{
-    "title": "测试用例标题（*必填）",
-    "group_name": "所属分组（选填，用|分隔层级，如：Web端测试用例|首页|我的待办）",
-    "maintainer": "维护人（选填，成员姓名）",
-    "precondition": "前置条件（选填，执行测试前的必要条件）",
-    "step_description": "步骤描述（选填，使用【1】、【2】等编号格式，每个步骤一行）",
-    "expected_result": "预期结果（选填，每个步骤对应的预期结果，与步骤编号对应）",
-    "case_level": "用例等级（选填：高/中/低，默认：中）",
-    "case_type": "用例类型（选填：功能测试/性能测试/安全测试/兼容性测试，默认：功能测试）"
-  }}
-]
-```
-
-**重要要求**（严格按照Excel模板格式）：
-
-1. **测试用例生成**（遵循Teambition导入规范）：
-   - 针对文档内容生成详细的测试用例
-   - 测试用例必须覆盖所有功能点、业务场景、边界条件和异常情况
-   - 包括但不限于：正常流程、异常流程、边界值、数据验证、权限控制等
-   - **步骤描述格式**：必须使用【1】、【2】、【3】等中文编号格式，每个步骤单独一行
-   - **预期结果格式**：与步骤描述对应，使用相同的【1】、【2】、【3】编号格式
-   - **分组格式**：使用"|"分隔层级，如"Web端测试用例|首页|我的待办"
-   - **必填规则**：只有"title"是必填项，其他字段选填但建议尽可能完整
-   - 区分不同优先级：核心业务（高）、主要功能（中）、非核心功能（低）
-   - 包含多种测试类型：功能测试、性能测试、安全测试、兼容性测试等
-   - 如果文档有多个功能模块，每个模块都要有对应的测试用例
-   - 考虑用户操作的各种可能性和错误场景
-
-2. **格式规范**：
-   - 确保生成的JSON格式完全正确
-   - 所有字段都必须有值，不能有空值或缺失字段（选填字段可以为空字符串）
-   - 步骤描述和预期结果必须使用【1】、【2】、【3】的中文编号格式
-   - 分组名称使用"|"分隔多个层级
-   - 参考示例格式：
-     ```
-     步骤描述：
-     【1】用户点击登录按钮
-     【2】系统跳转到登录页面
-     【3】用户输入正确的用户名和密码
-
-     预期结果：
-     【1】登录按钮可正常点击
-     【2】成功跳转到登录页面
-     【3】用户能够成功登录系统
-     ```
-
-请直接返回JSON数组，不要包含其他文本。确保JSON格式正确且无语法错误。
-        """
-        
         # 构建请求数据
         request_data = {
             "model": ai_config.model_name,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "temperature": 0.7,
+            "messages": DOCUMENT_TEMPLATE.render(content=content),
+            "temperature": SINGLE_TEMPERATURE,
             "max_tokens": 4000
         }
         
@@ -660,18 +658,8 @@ async def analyze_with_ai(content: str, ai_config: AIConfiguration) -> List[Dict
             "Authorization": f"Bearer {ai_config.api_key}"
         }
         
-        # 发送API请求
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                ai_config.api_endpoint + "/chat/completions",
-                json=request_data,
-                headers=headers
-            )
-        
-        if response.status_code != 200:
-            raise Exception(f"AI API请求失败: {response.status_code} - {response.text}")
-        
-        result = response.json()
+        # 发送API请求（复用端点的共享连接，限流和临时错误时自动重试）
+        result = await post_chat_completion_with_usage("document", request_data, headers, ai_config, on_usage)
         
         # 提取AI返回的内容
         if "choices" not in result or not result["choices"]:
@@ -687,59 +675,14 @@ async def analyze_with_ai(content: str, ai_config: AIConfiguration) -> List[Dict
 
         # 解析JSON响应
         try:
-            # 尝试直接解析
-            test_cases = json.loads(ai_response)
-            logging.info("直接JSON解析成功")
-        except json.JSONDecodeError as e:
-            logging.info(f"直接JSON解析失败: {e}，开始尝试提取JSON数据")
-            # 如果直接解析失败，尝试提取JSON部分
-            try:
-                # 首先尝试匹配```json...```格式的代码块
-                logging.info("尝试匹配```json...```格式")
-                json_block_match = re.search(r'```json\s*\n?(.*?)\s*```', ai_response, re.DOTALL)
-                if json_block_match:
-                    json_content = json_block_match.group(1).strip()
-                    logging.info(f"找到```json代码块，内容长度: {len(json_content)}")
-                    test_cases = json.loads(json_content)
-                    logging.info("```json代码块解析成功")
-                else:
-                    logging.info("未找到```json...```格式")
-                    # 尝试更简单的匹配模式
-                    simple_json_match = re.search(r'```json(.*?)```', ai_response, re.DOTALL)
-                    if simple_json_match:
-                        json_content = simple_json_match.group(1).strip()
-                        logging.info(f"找到简单```json代码块，内容长度: {len(json_content)}")
-                        test_cases = json.loads(json_content)
-                        logging.info("简单```json代码块解析成功")
-                    else:
-                        logging.info("未找到简单```json代码块，尝试匹配不带json标记的代码块")
-                    # 尝试匹配不带json标记的代码块
-                    code_block_match = re.search(r'```\s*\n?(.*?)\s*```', ai_response, re.DOTALL)
-                    if code_block_match:
-                        json_content = code_block_match.group(1).strip()
-                        logging.info(f"找到```代码块，内容预览: {json_content[:100]}...")
-                        # 检查是否是有效的JSON数组
-                        if json_content.startswith('[') and json_content.endswith(']'):
-                            test_cases = json.loads(json_content)
-                            logging.info("```代码块解析成功")
-                        else:
-                            raise Exception("代码块内容不是JSON数组格式")
-                    else:
-                        logging.info("未找到```...```格式，尝试直接匹配JSON数组")
-                        # 尝试直接匹配JSON数组
-                        json_match = re.search(r'\[.*\]', ai_response, re.DOTALL)
-                        if json_match:
-                            json_content = json_match.group()
-                            logging.info(f"找到JSON数组，内容长度: {len(json_content)}")
-                            test_cases = json.loads(json_content)
-                            logging.info("JSON数组解析成功")
-                        else:
-                            raise Exception("无法从响应中提取JSON数据")
-            except Exception as e:
-                # 如果仍然失败，抛出异常而不是返回默认测试用例
-                error_msg = f"AI响应格式错误，无法提取有效的JSON数据: {str(e)}。AI响应内容: {ai_response[:200]}..."
-                logging.error(error_msg)
-                raise Exception(error_msg)
+            test_cases, repairs = extract_json(ai_response)
+        except JSONExtractError as e:
+            # 如果仍然失败，抛出异常而不是返回默认测试用例
+            error_msg = f"AI响应格式错误，无法提取有效的JSON数据: {str(e)}。AI响应内容: {ai_response[:200]}..."
+            logging.error(error_msg)
+            raise Exception(error_msg)
+        if repairs:
+            logging.info(f"AI响应JSON已修复: {', '.join(repairs)}")
         
         # 检查返回格式是否是包含test_cases的字典
         if isinstance(test_cases, dict) and "test_cases" in test_cases:
@@ -0,0 +1,189 @@
+import os
+import csv
+import codecs
+import logging
+import zipfile
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils.exceptions import InvalidFileException
+from openpyxl.styles import Alignment, Font
+
+# Teambition基础用例导入模板（docs/基础用例模板.xlsx）的说明行
+TEMPLATE_NOTE = "\n".join([
+    "Teambition 基础用例导入模板",
+    "",
+    "1、标题：必填，填写用例的名称；",
+    "2、所属分组：填写当前用例库下已有的分组名称，请从第一级分组开始完整填写（全部用例不属于分组层级），层级之间用“|”间隔，例如：Web端测试用例|首页|我的待办；",
+    "3、维护人：必须是当前企业中的成员名，若有同名则匹配最早加入的成员；",
+    "4、前置条件：选填，填写用例的前置条件；",
+    "5、操作步骤：选填，每条「操作步骤—预期结果」写一行，多个步骤请换行或者加编号填写，如【1】、【2】、【3】；",
+    "",
+    "Tips：",
+    "（1）*为必填项，一次性最多上传500条数据。",
+    "（2）所属分组、维护人、用例类型、用例等级必须与已有信息相匹配，填写错误将无法导入；",
+    "（3）填写规则和示例内容不得删除，删除后将无法正确导入。",
+    "（4）文本字段如“备注”字段：填写任务的具体详情描述。",
+    "（5）单选字段如“优先级”字段：填写不同优先级所对应的键值如“非常紧急”、“紧急”，“普通”，若不填写则为“默认优先级”。",
+    "（6）多选字段如“所属平台”字段：填写所属平台所对应的多个键值，请用“|”符号隔开，如“iOS平台 | Android平台 | Web平台”。",
+    "（7）数字字段如“数值”字段：填写相应的数值即可。",
+    "（8）日期字段如“开始时间”字段：填写格式为 YYYY-MM-DD XX:XX，如“2020-01-01 12:00”。",
+    "（9）层级字段如“城市”字段：必须是已配置的层级字段值，按层级填写字段值，若配置字段必须填写到最后一级则导入时也必须填写到最后一级选项，层级之间请用“/”符号隔开，如“北京市/东城区/前门街道”。",
+    "（10）成员字段：填写多个成员，请用\"|\"符号隔开，如“小明 | 小红”。",
+])
+
+# 模板的列：(列标题, 测试用例字段, 列宽)
+TEMPLATE_COLUMNS: List[Tuple[str, str, int]] = [
+    ("标题*", "title", 30),
+    ("所属分组", "group_name", 25),
+    ("维护人", "maintainer", 15),
+    ("前置条件", "precondition", 30),
+    ("步骤描述", "step_description", 40),
+    ("预期结果", "expected_result", 40),
+    ("用例等级", "case_level", 10),
+    ("用例类型", "case_type", 12),
+]
+
+# 模板中的示例行，导入时按标题识别并跳过
+TEMPLATE_EXAMPLE_ROW = [
+    "（示例勿删）待办列表测试",
+    "Web端测试用例|首页|我的待办",
+    "王XX",
+    "我的待办中存在待处理的任务",
+    "【1】显示当前未处理的任务\n【2】可以正常进入任务详情",
+    "【1】显示当前未处理的任务\n【2】可以正常进入任务详情",
+    "",
+    "",
+]
+
+# 模板说明行合并的单元格范围和行高
+TEMPLATE_NOTE_MERGE = "A1:Q1"
+TEMPLATE_NOTE_ROW_HEIGHT = 260
+
+# 导入时在文件开头查找列标题行的最大行数
+IMPORT_HEADER_SEARCH_ROWS = 10
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+def _case_row_values(case: Any) -> List[str]:
+    values = []
+    for _, field, _ in TEMPLATE_COLUMNS:
+        value = getattr(case, field, None)
+        if field == "case_level":
+            value = value or "中"
+        elif field == "case_type":
+            value = value or "功能测试"
+        values.append(value or "")
+    return values
+
+def write_test_cases_xlsx(cases: Iterable[Any], dest_path: str) -> int:
+    """
+    按基础用例模板格式将测试用例写入xlsx：说明行、列标题行、示例行，之后每个用例一行
+    使用openpyxl只写模式，行数据逐行写入临时文件，内存占用不随用例数增长
+    返回：写入的用例数
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("template")
+    for index, (_, _, width) in enumerate(TEMPLATE_COLUMNS):
+        sheet.column_dimensions[chr(ord("A") + index)].width = width
+    sheet.row_dimensions[1].height = TEMPLATE_NOTE_ROW_HEIGHT
+    sheet.merged_cells.add(TEMPLATE_NOTE_MERGE)
+
+    note = WriteOnlyCell(sheet, value=TEMPLATE_NOTE)
+    note.font = Font(bold=True, size=12)
+    note.alignment = Alignment(wrap_text=True, vertical="top")
+    sheet.append([note])
+    sheet.append([header for header, _, _ in TEMPLATE_COLUMNS])
+    sheet.append(TEMPLATE_EXAMPLE_ROW)
+
+    count = 0
+    for case in cases:
+        sheet.append(_case_row_values(case))
+        count += 1
+
+    workbook.save(dest_path)
+    return count
+
+def export_test_cases_to_tempfile(cases: Iterable[Any]) -> Tuple[str, int]:
+    """写入临时xlsx文件并返回 (文件路径, 用例数)，调用方负责在发送后删除文件"""
+    fd, path = tempfile.mkstemp(prefix="export_", suffix=".xlsx")
+    os.close(fd)
+    try:
+        count = write_test_cases_xlsx(cases, path)
+    except BaseException:
+        os.remove(path)
+        raise
+    logging.info(f"导出测试用例 {count} 条: {path}")
+    return path, count
+
+class CaseSheetError(ValueError):
+    """导入文件格式不符合模板（如找不到列标题行）"""
+
+def _normalize_header(value: Any) -> str:
+    return str(value).strip().rstrip("*").strip() if value is not None else ""
+
+def _cell_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def _iter_xlsx_rows(path: str) -> Iterator[Tuple]:
+    # 只读模式按行流式解析，不加载整个工作簿
+    try:
+        workbook = load_workbook(path, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError) as e:
+        raise CaseSheetError(f"无法解析xlsx文件: {e}")
+    try:
+        sheet = workbook.worksheets[0]
+        yield from sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def _detect_csv_encoding(path: str) -> str:
+    # Excel在中文Windows下另存的CSV通常为GBK编码，文件开头不是合法UTF-8时按GB18030读取
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as f:
+        try:
+            decoder.decode(f.read(1024 * 1024), final=False)
+        except UnicodeDecodeError:
+            return "gb18030"
+    return "utf-8-sig"
+
+def _iter_csv_rows(path: str) -> Iterator[List[str]]:
+    with open(path, "r", encoding=_detect_csv_encoding(path), newline="") as f:
+        yield from csv.reader(f)
+
+def iter_case_sheet_rows(path: str, file_type: str) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """
+    流式读取基础用例模板格式的xlsx或csv文件，逐行返回 (行号, {测试用例字段: 文本})
+    列标题行按内容定位（可以有或没有说明行），列顺序不限；跳过示例行和空行，
+    只包含文件中存在的列
+    """
+    rows = _iter_xlsx_rows(path) if file_type == "xlsx" else _iter_csv_rows(path)
+    header_to_field = {_normalize_header(header): field for header, field, _ in TEMPLATE_COLUMNS}
+    column_fields: Optional[List[Optional[str]]] = None
+
+    for row_number, row in enumerate(rows, start=1):
+        if column_fields is None:
+            headers = [_normalize_header(value) for value in row]
+            if "标题" in headers:
+                column_fields = [header_to_field.get(header) for header in headers]
+            elif row_number >= IMPORT_HEADER_SEARCH_ROWS:
+                raise CaseSheetError(f"前{IMPORT_HEADER_SEARCH_ROWS}行中未找到列标题行（需包含“标题*”列）")
+            continue
+
+        values = {}
+        for index, field in enumerate(column_fields):
+            if field:
+                values[field] = _cell_text(row[index]) if index < len(row) else ""
+        if not any(values.values()):
+            continue
+        if values.get("title", "").startswith("（示例勿删）"):
+            continue
+        yield row_number, values
+
+    if column_fields is None:
+        raise CaseSheetError("文件中未找到列标题行（需包含“标题*”列）")
@@ -0,0 +1,140 @@
+import os
+import re
+import logging
+from typing import Callable, List, Optional, Tuple
+
+# 分词器：estimate（默认，按中英文字符粗略估算）或 tiktoken:<编码名>（需安装tiktoken且编码文件已在本地缓存）
+AI_TOKENIZER = os.getenv("AI_TOKENIZER", "estimate")
+
+_CJK_RUN_RE = re.compile(r'[一-鿿]+')
+_LATIN_RUN_RE = re.compile(r'[a-zA-Z]+')
+
+# 标题行：中文编号、Markdown标题、英文标题
+_HEADING_RE = re.compile(
+    r'^(?:第\d+[章节篇]|[一二三四五六七八九十]+[、.]|\d+[、.])'
+    r'|^#{1,6}\s+'
+    r'|^[A-Z][a-zA-Z\s]{1,50}[：:]'
+)
+
+_token_counter: Optional[Callable[[str], int]] = None
+
+def estimate_token_count(text: str) -> int:
+    """估算文本的token数量（粗略估算）"""
+    # 中文字符通常一个字符约等于2个token
+    # 英文字符通常4个字符约等于1个token
+    chinese_chars = sum(map(len, _CJK_RUN_RE.findall(text)))
+    english_chars = sum(map(len, _LATIN_RUN_RE.findall(text)))
+
+    return int(chinese_chars * 2 + english_chars / 4)
+
+def _load_token_counter() -> Callable[[str], int]:
+    """按AI_TOKENIZER加载分词器，不可用时退回估算"""
+    if AI_TOKENIZER.startswith("tiktoken:"):
+        encoding_name = AI_TOKENIZER.split(":", 1)[1] or "cl100k_base"
+        try:
+            import tiktoken
+            encoding = tiktoken.get_encoding(encoding_name)
+            logging.info(f"使用tiktoken分词器计算token数: {encoding_name}")
+            return lambda text: len(encoding.encode(text, disallowed_special=()))
+        except Exception as e:
+            logging.warning(f"tiktoken分词器不可用（{e}），使用估算方式计算token数")
+    return estimate_token_count
+
+def set_token_counter(counter: Optional[Callable[[str], int]]) -> None:
+    """替换token计数函数，传入None恢复按AI_TOKENIZER加载"""
+    global _token_counter
+    _token_counter = counter
+
+def count_tokens(text: str) -> int:
+    """使用当前分词器计算token数"""
+    global _token_counter
+    if _token_counter is None:
+        _token_counter = _load_token_counter()
+    return _token_counter(text)
+
+def _is_heading(line: str) -> bool:
+    if line.startswith('[标题'):  # 我们的格式
+        return True
+    stripped = line.strip()
+    return bool(
+        _HEADING_RE.match(stripped) or
+        (len(stripped) < 50 and (stripped.endswith('：') or stripped.endswith(':')))  # 短行以冒号结尾
+    )
+
+def _join_lines(lines: List[str], start: int, end: int) -> str:
+    return "\n".join(lines[start:end]).strip()
+
+def split_content(content: str, max_tokens: int = 3000) -> List[str]:
+    """
+    按标题和段落边界分块：每行只计算一次token数，分块和强制拆分都基于行的token数累加，
+    整体为线性时间
+    """
+    lines = content.split('\n')
+    costs = [count_tokens(line) for line in lines]
+
+    if sum(costs) <= max_tokens:
+        return [content]
+
+    # 按标题分割：记录每部分的行区间和token数
+    sections: List[Tuple[int, int, int]] = []
+    section_start = 0
+    current_tokens = 0
+    for index, line in enumerate(lines):
+        line_tokens = costs[index]
+        # 如果当前部分加上新行会超过限制，且遇到了标题，就分割
+        if current_tokens + line_tokens > max_tokens and (current_tokens > max_tokens * 0.8 or _is_heading(line)):
+            sections.append((section_start, index, current_tokens))
+            section_start = index
+            current_tokens = 0
+        current_tokens += line_tokens
+    sections.append((section_start, len(lines), current_tokens))
+
+    chunks = []
+    for start, end, tokens in sections:
+        if tokens <= max_tokens * 1.2:
+            chunk = _join_lines(lines, start, end)
+            if chunk:
+                chunks.append(chunk)
+            continue
+        chunks.extend(_force_split(lines, costs, start, end, max_tokens))
+    return chunks
+
+def _force_split(lines: List[str], costs: List[int], start: int, end: int, max_tokens: int) -> List[str]:
+    """部分过大时按段落（空行分隔）打包，单个段落仍超限时按行打包"""
+    chunks = []
+    part_start = start
+    part_tokens = 0
+    para_start = start
+    para_tokens = 0
+
+    def flush(until: int) -> None:
+        chunk = _join_lines(lines, part_start, until)
+        if chunk:
+            chunks.append(chunk)
+
+    for index in range(start, end + 1):
+        at_boundary = index == end or not lines[index].strip()
+        if not at_boundary:
+            para_tokens += costs[index]
+            continue
+
+        # 一个段落结束：[para_start, index)
+        if part_tokens + para_tokens > max_tokens:
+            if part_tokens:
+                flush(para_start)
+                part_start = para_start
+                part_tokens = 0
+            if para_tokens > max_tokens:
+                for line_index in range(para_start, index):
+                    if part_tokens and part_tokens + costs[line_index] > max_tokens:
+                        flush(line_index)
+                        part_start = line_index
+                        part_tokens = 0
+                    part_tokens += costs[line_index]
+                para_tokens = 0
+        part_tokens += para_tokens
+        para_start = index
+        para_tokens = 0
+
+    flush(end)
+    return chunks
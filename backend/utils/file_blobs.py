@@ -0,0 +1,144 @@
+import os
+import logging
+from typing import Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import FileBlob, FileUpload
+
+UPLOAD_DIR = "uploads"
+
+def blob_disk_path(file_url: str) -> str:
+    """文件URL（/uploads/xxx）对应的磁盘路径"""
+    return os.path.join(UPLOAD_DIR, os.path.basename(file_url))
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning(f"删除文件失败: {path} - {e}")
+
+def acquire_blob(db: Session, content_hash: str) -> Optional[FileBlob]:
+    """
+    内容相同的文件已存储且仍在磁盘上时，原子地增加其引用计数并返回；否则返回None
+    引用计数用UPDATE语句自增，不持有行锁，避免在异步请求中等待锁
+    """
+    updated = db.query(FileBlob).filter(
+        FileBlob.content_hash == content_hash,
+        FileBlob.ref_count > 0
+    ).update({FileBlob.ref_count: FileBlob.ref_count + 1}, synchronize_session=False)
+    db.commit()
+    if not updated:
+        return None
+
+    blob = db.query(FileBlob).filter(FileBlob.content_hash == content_hash).first()
+    if blob is None:
+        return None
+    if not os.path.exists(blob_disk_path(blob.file_url)):
+        # 磁盘文件已丢失，撤销本次引用，按新文件重新存储
+        release_blob(db, content_hash)
+        return None
+    return blob
+
+def register_blob(db: Session, content_hash: str, file_url: str, file_size: int, extracted_content: Optional[str]) -> FileBlob:
+    """
+    登记新存储的文件并引用一次；并发上传同一内容时以先登记的为准，
+    返回的记录file_url与传入不同时，调用方应删除自己存储的文件
+    """
+    blob = db.query(FileBlob).filter(FileBlob.content_hash == content_hash).first()
+    if blob is None:
+        try:
+            blob = FileBlob(
+                content_hash=content_hash,
+                file_url=file_url,
+                file_size=file_size,
+                extracted_content=extracted_content,
+                ref_count=1
+            )
+            db.add(blob)
+            db.commit()
+            return blob
+        except IntegrityError:
+            db.rollback()
+        blob = db.query(FileBlob).filter(FileBlob.content_hash == content_hash).first()
+        if blob is None:
+            return register_blob(db, content_hash, file_url, file_size, extracted_content)
+
+    old_path = blob_disk_path(blob.file_url)
+    stale = (blob.ref_count or 0) <= 0
+    if not stale and os.path.exists(old_path):
+        # 其他请求已登记相同内容，改为引用该记录
+        values = {FileBlob.ref_count: FileBlob.ref_count + 1}
+        if blob.extracted_content is None and extracted_content is not None:
+            values[FileBlob.extracted_content] = extracted_content
+    else:
+        # 已无引用（尚未回收）或磁盘文件丢失的记录，改为指向本次存储的文件
+        values = {
+            FileBlob.file_url: file_url,
+            FileBlob.file_size: file_size,
+            FileBlob.extracted_content: extracted_content,
+            FileBlob.ref_count: 1 if stale else FileBlob.ref_count + 1
+        }
+
+    # 条件更新：读取之后记录被回收或引用状态变化时重新登记
+    updated = db.query(FileBlob).filter(
+        FileBlob.content_hash == content_hash,
+        FileBlob.ref_count <= 0 if stale else FileBlob.ref_count > 0
+    ).update(values, synchronize_session=False)
+    db.commit()
+    if not updated:
+        return register_blob(db, content_hash, file_url, file_size, extracted_content)
+
+    if stale and old_path != blob_disk_path(file_url):
+        _remove_file(old_path)
+    db.refresh(blob)
+    return blob
+
+def release_blob(db: Session, content_hash: str) -> bool:
+    """减少引用计数，计数归零时删除记录和磁盘文件，返回是否已回收"""
+    db.query(FileBlob).filter(FileBlob.content_hash == content_hash).update(
+        {FileBlob.ref_count: FileBlob.ref_count - 1}, synchronize_session=False
+    )
+    db.commit()
+    return _collect_blob(db, content_hash)
+
+def release_upload_file(db: Session, content_hash: Optional[str], file_url: str) -> bool:
+    """上传记录删除后释放其文件：已登记的文件按引用计数回收，去重之前的旧记录在无其他引用时直接删除"""
+    if content_hash and db.query(FileBlob.content_hash).filter(FileBlob.content_hash == content_hash).first():
+        return release_blob(db, content_hash)
+    if db.query(FileUpload.id).filter(FileUpload.file_url == file_url).first():
+        return False
+    _remove_file(blob_disk_path(file_url))
+    return True
+
+def _collect_blob(db: Session, content_hash: str) -> bool:
+    blob = db.query(FileBlob).filter(FileBlob.content_hash == content_hash, FileBlob.ref_count <= 0).first()
+    if blob is None:
+        return False
+    file_url = blob.file_url
+    # 条件删除：期间有新的引用时不删除
+    deleted = db.query(FileBlob).filter(
+        FileBlob.content_hash == content_hash,
+        FileBlob.ref_count <= 0
+    ).delete(synchronize_session=False)
+    db.commit()
+    if deleted:
+        _remove_file(blob_disk_path(file_url))
+        logging.info(f"已回收无引用的上传文件: {file_url}")
+    return bool(deleted)
+
+def collect_unreferenced_blobs() -> int:
+    """回收所有引用计数为0的文件（如上传过程中服务中断遗留的记录）"""
+    db = SessionLocal()
+    try:
+        hashes = [row.content_hash for row in db.query(FileBlob.content_hash).filter(FileBlob.ref_count <= 0)]
+        return sum(1 for content_hash in hashes if _collect_blob(db, content_hash))
+    except Exception as e:
+        db.rollback()
+        logging.warning(f"回收上传文件失败: {e}")
+        return 0
+    finally:
+        db.close()
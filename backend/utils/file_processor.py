@@ -1,78 +1,319 @@
 import os
+import re
+import asyncio
+import hashlib
+import signal
+import zipfile
 import docx
 import PyPDF2
 import pdfplumber
-from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
 import chardet
 import logging
 
+try:
+    import resource
+except ImportError:  # Windows不支持resource模块，不限制内存
+    resource = None
+
+# 文档解析进程池配置
+EXTRACTION_MAX_WORKERS = int(os.getenv("EXTRACTION_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXTRACTION_TIMEOUT_SECONDS = int(os.getenv("EXTRACTION_TIMEOUT_SECONDS", "120"))
+EXTRACTION_MAX_MEMORY_MB = int(os.getenv("EXTRACTION_MAX_MEMORY_MB", "2048"))
+# 解析进程未能按时自行中断时，主进程额外等待的秒数，之后终止进程池
+EXTRACTION_KILL_GRACE_SECONDS = int(os.getenv("EXTRACTION_KILL_GRACE_SECONDS", "10"))
+EXTRACTION_POLL_SECONDS = 0.2
+
+# PDF按页范围并行解析：每个任务至少包含的页数，以及缓存的解析结果页数上限
+PDF_MIN_PAGES_PER_TASK = int(os.getenv("PDF_MIN_PAGES_PER_TASK", "10"))
+PDF_PAGE_CACHE_PAGES = int(os.getenv("PDF_PAGE_CACHE_PAGES", "5000"))
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+# (文件SHA-256, 页号) -> 页文本，按最近使用淘汰
+_pdf_page_cache: "OrderedDict[Tuple[str, int], str]" = OrderedDict()
+
+def _init_extraction_worker(max_memory_mb: int) -> None:
+    """解析进程初始化：限制进程的地址空间，超限时解析抛出MemoryError而不是拖垮主机"""
+    if max_memory_mb > 0 and resource is not None:
+        limit = max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def init_extraction_pool() -> ProcessPoolExecutor:
+    """创建（或返回已有的）文档解析进程池"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=max(1, EXTRACTION_MAX_WORKERS),
+            initializer=_init_extraction_worker,
+            initargs=(EXTRACTION_MAX_MEMORY_MB,)
+        )
+        logging.info(f"文档解析进程池已创建，进程数: {EXTRACTION_MAX_WORKERS}")
+    return _executor
+
+def close_extraction_pool() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+class _ExtractionDeadline(BaseException):
+    """解析进程内的超时信号，继承BaseException，不会被解析函数中的 except Exception 吞掉"""
+
+def _run_with_deadline(timeout: int, func: Callable[..., Any], *args: Any) -> Any:
+    """
+    在解析进程中执行解析函数：从任务开始执行时计时，超时抛出TimeoutError，
+    进程本身不退出，可以继续处理其他任务；不支持SIGALRM的平台（Windows）只由主进程兜底
+    """
+    if timeout <= 0 or not hasattr(signal, "SIGALRM"):
+        return func(*args)
+
+    def on_alarm(signum, frame):
+        raise _ExtractionDeadline()
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(*args)
+    except _ExtractionDeadline:
+        raise TimeoutError(f"文件解析超时（超过{timeout}秒）")
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+def _recycle_extraction_pool(executor: ProcessPoolExecutor) -> None:
+    """
+    无法中断的解析任务只能终止进程池中的进程，当前进程池在下次使用时重建；
+    只回收出问题的那个进程池，其他任务期间已重建的新进程池不受影响
+    """
+    global _executor
+    if _executor is executor:
+        _executor = None
+    for process in list((getattr(executor, "_processes", None) or {}).values()):
+        process.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
+    logging.warning("文档解析进程池已重建")
+
+async def run_extraction(func: Callable[..., Any], *args: Any, retry_on_recycle: bool = True) -> Any:
+    """
+    在解析进程池中执行同步的解析函数，不阻塞事件循环
+    超时由解析进程从任务开始执行时计时，排队等待的时间不计入；
+    解析进程无法自行中断时（如卡在C扩展中），主进程在任务开始后再等待EXTRACTION_KILL_GRACE_SECONDS秒后回收进程池
+    retry_on_recycle: 进程池因其他任务被回收而导致本任务失败时，在新进程池中重试一次
+    """
+    executor = init_extraction_pool()
+    future = executor.submit(_run_with_deadline, EXTRACTION_TIMEOUT_SECONDS, func, *args)
+    wrapped = asyncio.wrap_future(future)
+    # 进程池把任务放入调用队列时标记为running，此时最多还需等待前一个任务（受同样的超时限制）
+    while not future.running() and not wrapped.done():
+        await asyncio.wait({wrapped}, timeout=EXTRACTION_POLL_SECONDS)
+    backstop = None
+    if EXTRACTION_TIMEOUT_SECONDS > 0:
+        backstop = 2 * EXTRACTION_TIMEOUT_SECONDS + EXTRACTION_KILL_GRACE_SECONDS
+    # 解析进程自行超时抛出的TimeoutError直接返回给调用方，不回收进程池
+    done, _ = await asyncio.wait({wrapped}, timeout=backstop)
+    if not done:
+        wrapped.cancel()
+        _recycle_extraction_pool(executor)
+        raise TimeoutError(f"文件解析超时（超过{EXTRACTION_TIMEOUT_SECONDS}秒）")
+    try:
+        return wrapped.result()
+    except BrokenProcessPool:
+        # 进程池已被其他任务回收（超时被终止），本任务只是受到牵连
+        recycled_by_other = _executor is not executor
+        if not recycled_by_other:
+            _recycle_extraction_pool(executor)
+        elif retry_on_recycle:
+            logging.info("解析进程池已被其他任务回收，在新进程池中重试")
+            return await run_extraction(func, *args, retry_on_recycle=False)
+        raise RuntimeError("文件解析进程异常退出，可能超出内存限制")
+
 async def process_file(file_path: str, content_type: Optional[str]) -> str:
     """
-    根据文件类型提取文本内容
+    根据文件类型提取文本内容，解析在独立进程中执行，PDF按页范围并行解析
     """
     try:
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"文件不存在: {file_path}")
-        
-        # PDF文件处理
-        if content_type and "pdf" in content_type.lower():
-            return extract_pdf_content(file_path)
-        
-        # Word文档处理
-        elif content_type and ("word" in content_type.lower() or "document" in content_type.lower()):
-            return extract_docx_content(file_path)
-        
-        # 文本文件处理
-        elif content_type and "text" in content_type.lower():
-            return extract_text_content(file_path)
-        
-        # 根据文件扩展名判断
-        file_extension = os.path.splitext(file_path)[1].lower()
-        
-        if file_extension == ".pdf":
-            return extract_pdf_content(file_path)
-        elif file_extension in [".docx", ".doc"]:
-            return extract_docx_content(file_path)
-        elif file_extension in [".txt", ".md"]:
-            return extract_text_content(file_path)
-        else:
-            # 默认尝试作为文本文件处理
-            return extract_text_content(file_path)
-    
+
+        if detect_file_kind(file_path, content_type) == "pdf":
+            return await extract_pdf_content_parallel(file_path)
+        return await run_extraction(extract_content, file_path, content_type)
+
     except Exception as e:
         return f"文件处理错误: {str(e)}"
 
+# 解析失败时返回内容的前缀，如"文件处理错误: "、"PDF处理错误: "
+_EXTRACTION_ERROR_RE = re.compile(r"^\S{0,10}处理错误: ")
+
+def is_extraction_error(content: Optional[str]) -> bool:
+    """判断提取结果是否为解析失败的错误信息（超时、进程异常等，重试可能成功）"""
+    return bool(content) and bool(_EXTRACTION_ERROR_RE.match(content))
+
+def detect_file_kind(file_path: str, content_type: Optional[str]) -> str:
+    """根据content_type和扩展名判断文件类型：pdf/docx/text"""
+    # PDF文件处理
+    if content_type and "pdf" in content_type.lower():
+        return "pdf"
+    
+    # Word文档处理
+    elif content_type and ("word" in content_type.lower() or "document" in content_type.lower()):
+        return "docx"
+    
+    # 文本文件处理
+    elif content_type and "text" in content_type.lower():
+        return "text"
+    
+    # 根据文件扩展名判断
+    file_extension = os.path.splitext(file_path)[1].lower()
+    
+    if file_extension == ".pdf":
+        return "pdf"
+    elif file_extension in [".docx", ".doc"]:
+        return "docx"
+    else:
+        # 默认尝试作为文本文件处理
+        return "text"
+
+def extract_content(file_path: str, content_type: Optional[str]) -> str:
+    """
+    根据文件类型选择解析函数（同步执行，供解析进程调用）
+    """
+    file_kind = detect_file_kind(file_path, content_type)
+    if file_kind == "pdf":
+        return extract_pdf_content(file_path)
+    elif file_kind == "docx":
+        return extract_docx_content(file_path)
+    return extract_text_content(file_path)
+
+def inspect_pdf(file_path: str) -> Tuple[str, int]:
+    """计算PDF文件的SHA-256和页数"""
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            sha256.update(block)
+    try:
+        with pdfplumber.open(file_path) as pdf:
+            page_count = len(pdf.pages)
+    except Exception:
+        with open(file_path, "rb") as file:
+            page_count = len(PyPDF2.PdfReader(file).pages)
+    return sha256.hexdigest(), page_count
+
+def extract_pdf_pages(file_path: str, start: int, end: int) -> List[str]:
+    """
+    提取第start到end-1页的文本：每页优先使用pdfplumber（更好的文本提取），
+    只有提取不到文本的页才改用PyPDF2，不会整篇重复解析
+    """
+    texts = [""] * (end - start)
+    fallback_pages = []
+
+    try:
+        with pdfplumber.open(file_path) as pdf:
+            for page_no in range(start, end):
+                page = pdf.pages[page_no]
+                try:
+                    texts[page_no - start] = (page.extract_text() or "").strip()
+                except Exception as e:
+                    logging.warning(f"pdfplumber提取第{page_no + 1}页失败: {str(e)}")
+                finally:
+                    # 释放该页解析缓存，控制长文档的内存占用
+                    page.close()
+                if not texts[page_no - start]:
+                    fallback_pages.append(page_no)
+    except Exception as e:
+        logging.warning(f"pdfplumber无法打开PDF: {str(e)}")
+        fallback_pages = list(range(start, end))
+
+    if fallback_pages:
+        try:
+            with open(file_path, "rb") as file:
+                pdf_reader = PyPDF2.PdfReader(file)
+                for page_no in fallback_pages:
+                    try:
+                        texts[page_no - start] = (pdf_reader.pages[page_no].extract_text() or "").strip()
+                    except Exception as e:
+                        logging.warning(f"PyPDF2提取第{page_no + 1}页失败: {str(e)}")
+        except Exception as e:
+            logging.warning(f"PyPDF2无法打开PDF: {str(e)}")
+
+    return texts
+
+def _join_pdf_pages(texts: List[str]) -> str:
+    content = "\n".join(text for text in texts if text)
+    return content if content else "无法提取PDF内容"
+
 def extract_pdf_content(file_path: str) -> str:
     """提取PDF文件内容"""
     try:
-        content = ""
-        
-        # 首先尝试使用pdfplumber（更好的文本提取）
-        try:
-            with pdfplumber.open(file_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        content += page_text + "\n"
-            
-            if content.strip():
-                return content.strip()
-        except Exception:
-            pass
-        
-        # 如果pdfplumber失败，尝试PyPDF2
-        with open(file_path, "rb") as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    content += page_text + "\n"
-        
-        return content.strip() if content.strip() else "无法提取PDF内容"
-    
+        _, page_count = inspect_pdf(file_path)
+        return _join_pdf_pages(extract_pdf_pages(file_path, 0, page_count))
     except Exception as e:
         return f"PDF处理错误: {str(e)}"
 
+def _split_page_ranges(pages: List[int]) -> List[Tuple[int, int]]:
+    """把待解析页号分成连续的页范围，按解析进程数均分"""
+    if not pages:
+        return []
+    pages_per_task = max(PDF_MIN_PAGES_PER_TASK, -(-len(pages) // max(1, EXTRACTION_MAX_WORKERS)))
+    ranges = []
+    start = previous = pages[0]
+    for page_no in pages[1:]:
+        if page_no != previous + 1 or page_no - start >= pages_per_task:
+            ranges.append((start, previous + 1))
+            start = page_no
+        previous = page_no
+    ranges.append((start, previous + 1))
+    return ranges
+
+def _cache_pdf_page(key: Tuple[str, int], text: str) -> None:
+    _pdf_page_cache[key] = text
+    _pdf_page_cache.move_to_end(key)
+    while len(_pdf_page_cache) > PDF_PAGE_CACHE_PAGES:
+        _pdf_page_cache.popitem(last=False)
+
+async def extract_pdf_content_parallel(file_path: str) -> str:
+    """
+    按页范围并行解析PDF：页范围分发到解析进程池，每页的结果按文件哈希缓存，
+    同一文件再次解析（重新上传、部分页范围失败后重试）时只解析缺失的页；
+    各页范围相互独立，某个范围超时或失败不影响其他范围，成功的页仍写入缓存
+    """
+    file_hash, page_count = await run_extraction(inspect_pdf, file_path)
+
+    texts: List[str] = [""] * page_count
+    missing_pages = []
+    for page_no in range(page_count):
+        cached = _pdf_page_cache.get((file_hash, page_no))
+        if cached is None:
+            missing_pages.append(page_no)
+        else:
+            texts[page_no] = cached
+
+    ranges = _split_page_ranges(missing_pages)
+    if ranges:
+        logging.info(f"PDF共 {page_count} 页，{len(missing_pages)} 页待解析，分为 {len(ranges)} 个任务并行执行")
+    results = await asyncio.gather(
+        *[run_extraction(extract_pdf_pages, file_path, start, end) for start, end in ranges],
+        return_exceptions=True
+    )
+
+    first_error = None
+    for (start, end), result in zip(ranges, results):
+        if isinstance(result, BaseException):
+            first_error = first_error or result
+            continue
+        for offset, text in enumerate(result):
+            texts[start + offset] = text
+            _cache_pdf_page((file_hash, start + offset), text)
+    if first_error is not None:
+        raise first_error
+
+    return _join_pdf_pages(texts)
+
 def extract_docx_content(file_path: str) -> str:
     """提取Word文档内容（增强版，支持大文档）"""
     try:
@@ -122,41 +363,129 @@ def extract_docx_content(file_path: str) -> str:
         logging.error(f"Word文档处理错误: {str(e)}")
         return f"Word文档处理错误: {str(e)}"
 
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_P = _W_NS + "p"
+_W_T = _W_NS + "t"
+_W_TAB = _W_NS + "tab"
+_W_BR = _W_NS + "br"
+_W_CR = _W_NS + "cr"
+_W_TBL = _W_NS + "tbl"
+_W_TR = _W_NS + "tr"
+_W_TC = _W_NS + "tc"
+_W_PSTYLE = _W_NS + "pStyle"
+_W_VAL = _W_NS + "val"
+_W_BODY = _W_NS + "body"
+
+def _load_docx_heading_levels(docx_zip: zipfile.ZipFile) -> Dict[str, str]:
+    """读取styles.xml，返回标题样式ID到标题级别的映射"""
+    levels: Dict[str, str] = {}
+    try:
+        styles_xml = docx_zip.open("word/styles.xml")
+    except KeyError:
+        return levels
+    with styles_xml:
+        for _, style in ElementTree.iterparse(styles_xml):
+            if style.tag != _W_NS + "style":
+                continue
+            name = style.find(_W_NS + "name")
+            style_name = name.get(_W_VAL, "") if name is not None else ""
+            # 与python-docx一致：内置标题样式名为"heading N"
+            if style_name.lower().startswith("heading"):
+                levels[style.get(_W_NS + "styleId", "")] = style_name.split()[-1]
+            style.clear()
+    return levels
+
+def iter_docx_blocks(xml_file, heading_levels: Dict[str, str]) -> Iterator[str]:
+    """
+    增量解析document.xml（或页眉页脚xml），按文档顺序产出标题、段落和表格行，
+    每个顶层元素处理完即清空，内存占用不随文档大小增长
+    """
+    paragraph_stack: List[List[str]] = []
+    paragraph_styles: List[str] = []
+    table_depth = 0
+    table_count = 0
+    row_cells: List[str] = []
+    cell_parts: List[str] = []
+    container = None
+
+    for event, elem in ElementTree.iterparse(xml_file, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if tag == _W_P:
+                paragraph_stack.append([])
+                paragraph_styles.append("")
+            elif tag == _W_TBL:
+                table_depth += 1
+                if table_depth == 1:
+                    table_count += 1
+                    yield f"\n[表格{table_count}]"
+            elif container is None and tag in (_W_BODY, _W_NS + "hdr", _W_NS + "ftr"):
+                container = elem
+            continue
+
+        if tag == _W_T:
+            if paragraph_stack and elem.text:
+                paragraph_stack[-1].append(elem.text)
+        elif tag == _W_TAB:
+            if paragraph_stack:
+                paragraph_stack[-1].append("\t")
+        elif tag == _W_BR or tag == _W_CR:
+            if paragraph_stack:
+                paragraph_stack[-1].append("\n")
+        elif tag == _W_PSTYLE:
+            if paragraph_styles:
+                paragraph_styles[-1] = elem.get(_W_VAL, "")
+        elif tag == _W_P:
+            text = "".join(paragraph_stack.pop()).strip()
+            style_id = paragraph_styles.pop()
+            if table_depth:
+                # 单元格中的段落（包括嵌套表格）合并为单元格文本
+                cell_parts.append(text)
+            elif text:
+                level = heading_levels.get(style_id)
+                yield f"[标题{level}] {text}" if level else text
+        elif tag == _W_TC and table_depth == 1:
+            row_cells.append("\n".join(cell_parts).strip())
+            cell_parts = []
+        elif tag == _W_TR and table_depth == 1:
+            row_text = "\t".join(row_cells)
+            row_cells = []
+            if row_text.strip():
+                yield row_text
+        elif tag == _W_TBL:
+            table_depth -= 1
+
+        # 顶层元素处理完毕后从父节点移除，释放已解析的内容
+        if container is not None and not paragraph_stack and not table_depth and tag in (_W_P, _W_TBL):
+            container.clear()
+
 def extract_large_docx_content(file_path: str) -> str:
-    """大文档专用提取函数，减少内存占用"""
+    """大文档专用提取函数：直接从zip中流式解析word/document.xml，不构建完整文档对象"""
     try:
-        doc = docx.Document(file_path)
         content_parts = []
+        with zipfile.ZipFile(file_path) as docx_zip:
+            heading_levels = _load_docx_heading_levels(docx_zip)
 
-        # 分段处理，避免一次性加载所有内容
-        paragraph_count = len(doc.paragraphs)
-        batch_size = 1000  # 每批处理1000个段落
-
-        for batch_start in range(0, paragraph_count, batch_size):
-            batch_end = min(batch_start + batch_size, paragraph_count)
+            with docx_zip.open("word/document.xml") as document_xml:
+                content_parts.extend(iter_docx_blocks(document_xml, heading_levels))
 
-            for i in range(batch_start, batch_end):
-                paragraph = doc.paragraphs[i]
-                if paragraph.text.strip():
-                    if paragraph.style.name.startswith('Heading'):
-                        level = paragraph.style.name.split()[-1] if 'Heading' in paragraph.style.name else '1'
-                        content_parts.append(f"[标题{level}] {paragraph.text.strip()}")
-                    else:
-                        content_parts.append(paragraph.text.strip())
+            # 提取页眉页脚（如果有）
+            for part_name in sorted(docx_zip.namelist()):
+                is_header = re.match(r"^word/header\d*\.xml$", part_name)
+                is_footer = re.match(r"^word/footer\d*\.xml$", part_name)
+                if not (is_header or is_footer):
+                    continue
+                with docx_zip.open(part_name) as part_xml:
+                    part_text = "\n".join(block for block in iter_docx_blocks(part_xml, heading_levels) if block.strip())
+                if not part_text:
+                    continue
+                if is_header:
+                    content_parts.insert(0, f"[页眉]\n{part_text}")
+                else:
+                    content_parts.append(f"[页脚]\n{part_text}")
 
-        # 表格处理
-        for table_idx, table in enumerate(doc.tables):
-            content_parts.append(f"\n[表格{table_idx + 1}]")
-            try:
-                for row in table.rows:
-                    row_text = "\t".join([cell.text.strip() for cell in row.cells])
-                    if row_text.strip():
-                        content_parts.append(row_text)
-            except Exception as e:
-                logging.warning(f"表格{table_idx + 1}处理失败: {str(e)}")
-                content_parts.append(f"[表格{table_idx + 1}处理失败]")
-
-        return "\n".join(content_parts).strip()
+        content = "\n".join(content_parts)
+        return content.strip() if content.strip() else "无法提取Word文档内容"
 
     except Exception as e:
         logging.error(f"大文档处理错误: {str(e)}")
@@ -0,0 +1,62 @@
+import os
+import logging
+from typing import Dict, Iterable
+import httpx
+
+# AI接口HTTP连接池配置
+AI_HTTP_TIMEOUT = float(os.getenv("AI_HTTP_TIMEOUT", "60"))
+AI_HTTP_MAX_CONNECTIONS = int(os.getenv("AI_HTTP_MAX_CONNECTIONS", "20"))
+AI_HTTP_MAX_KEEPALIVE = int(os.getenv("AI_HTTP_MAX_KEEPALIVE", "10"))
+AI_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("AI_HTTP_KEEPALIVE_EXPIRY", "60"))
+AI_HTTP2 = os.getenv("AI_HTTP2", "true").lower() in ("1", "true", "yes")
+
+# 每个API端点一个长连接客户端，批量分块请求复用已建立的连接
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+def _http2_enabled() -> bool:
+    """HTTP/2需要安装h2依赖（httpx[http2]），未安装时退回HTTP/1.1"""
+    if not AI_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logging.warning("未安装h2依赖，AI接口请求使用HTTP/1.1")
+        return False
+
+def _normalize_endpoint(api_endpoint: str) -> str:
+    return api_endpoint.rstrip("/")
+
+def get_http_client(api_endpoint: str) -> httpx.AsyncClient:
+    """获取API端点对应的共享HTTP客户端，不存在时创建"""
+    key = _normalize_endpoint(api_endpoint)
+    client = _clients.get(key)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=AI_HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=AI_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=AI_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=AI_HTTP_KEEPALIVE_EXPIRY
+            ),
+            http2=_http2_enabled()
+        )
+        _clients[key] = client
+        logging.info(f"已创建AI接口HTTP客户端: {key}")
+    return client
+
+def init_http_clients(api_endpoints: Iterable[str]) -> None:
+    """应用启动时为已有的AI配置预先创建HTTP客户端"""
+    for api_endpoint in api_endpoints:
+        if api_endpoint:
+            get_http_client(api_endpoint)
+
+async def close_http_clients() -> None:
+    """应用关闭时释放所有HTTP连接"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logging.warning(f"关闭HTTP客户端失败: {e}")
@@ -0,0 +1,92 @@
+import os
+import uuid
+import socket
+import logging
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from models import AnalysisJob
+
+# 任务租约：持有任务的进程定期续约，超过租约时长未续约的任务视为所在进程已退出
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+# 续约和检查过期任务的间隔
+JOB_HEARTBEAT_SECONDS = max(1, int(os.getenv("JOB_HEARTBEAT_SECONDS", str(max(1, JOB_LEASE_SECONDS // 4)))))
+
+# 当前进程的标识，写入任务的worker_id；同一主机上的多个uvicorn worker按进程号区分
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def _expired_filter():
+    cutoff = datetime.now() - timedelta(seconds=JOB_LEASE_SECONDS)
+    return or_(AnalysisJob.heartbeat_at.is_(None), AnalysisJob.heartbeat_at < cutoff)
+
+def claim_job(db: Session, job_id: str) -> bool:
+    """
+    以条件更新原子地认领任务：只有任务仍在排队且由当前进程持有时才改为running，
+    同一任务被多次入队或被其他进程接管后，其余副本都会认领失败
+    """
+    claimed = db.query(AnalysisJob).filter(
+        AnalysisJob.id == job_id,
+        AnalysisJob.status == "queued",
+        AnalysisJob.worker_id == WORKER_ID
+    ).update({
+        "status": "running",
+        "started_at": datetime.now(),
+        "heartbeat_at": datetime.now(),
+        "progress_message": "开始分析"
+    }, synchronize_session=False)
+    db.commit()
+    return claimed == 1
+
+def renew_leases(db: Session) -> int:
+    """为当前进程持有的排队中和运行中的任务续约"""
+    renewed = db.query(AnalysisJob).filter(
+        AnalysisJob.worker_id == WORKER_ID,
+        AnalysisJob.status.in_(("queued", "running"))
+    ).update({"heartbeat_at": datetime.now()}, synchronize_session=False)
+    db.commit()
+    return renewed
+
+def fail_expired_jobs(db: Session) -> int:
+    """租约已过期的运行中任务所在进程已退出，标记为失败；其他进程中仍在运行的任务不受影响"""
+    failed = db.query(AnalysisJob).filter(
+        AnalysisJob.status == "running",
+        _expired_filter()
+    ).update({
+        "status": "failed",
+        "error_message": "任务所在的服务进程已退出，任务已中断",
+        "progress_message": "分析失败",
+        "finished_at": datetime.now()
+    }, synchronize_session=False)
+    db.commit()
+    if failed:
+        logging.warning(f"{failed} 个分析任务的租约已过期，标记为失败")
+    return failed
+
+def adopt_orphaned_jobs(db: Session, limit: int) -> List[str]:
+    """
+    接管租约已过期的排队任务（原进程已退出），按提交顺序最多接管limit个；
+    逐个以条件更新改写持有者，多个进程同时接管时每个任务只归一方
+    """
+    if limit <= 0:
+        return []
+    candidates = db.query(AnalysisJob.id).filter(
+        AnalysisJob.status == "queued",
+        _expired_filter()
+    ).order_by(AnalysisJob.created_at.asc()).limit(limit).all()
+
+    adopted = []
+    for (job_id,) in candidates:
+        updated = db.query(AnalysisJob).filter(
+            AnalysisJob.id == job_id,
+            AnalysisJob.status == "queued",
+            _expired_filter()
+        ).update({"worker_id": WORKER_ID, "heartbeat_at": datetime.now()}, synchronize_session=False)
+        db.commit()
+        if updated == 1:
+            adopted.append(job_id)
+    if adopted:
+        logging.info(f"接管 {len(adopted)} 个租约已过期的排队任务")
+    return adopted
@@ -0,0 +1,102 @@
+import os
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# 后台分析任务执行配置
+ANALYSIS_MAX_WORKERS = int(os.getenv("ANALYSIS_MAX_WORKERS", "2"))
+ANALYSIS_MAX_QUEUE = int(os.getenv("ANALYSIS_MAX_QUEUE", "20"))
+
+class JobQueueFullError(Exception):
+    """任务队列已满"""
+
+class JobManager:
+    """
+    有界的后台任务执行器：固定数量的worker从有界队列中取任务执行，
+    任务状态由runner自行持久化，这里只负责调度和取消
+    """
+
+    def __init__(self, runner: Callable[[str], Awaitable[None]], max_workers: int, max_queue: int):
+        self._runner = runner
+        self._max_workers = max(1, max_workers)
+        self._max_queue = max(1, max_queue)
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._queued: set = set()
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancelled: set = set()
+
+    async def start(self) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self._max_queue)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self._max_workers)]
+        logging.info(f"后台任务执行器已启动，worker数: {self._max_workers}，队列上限: {self._max_queue}")
+
+    async def stop(self) -> None:
+        for task in list(self._running.values()):
+            task.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    def is_full(self) -> bool:
+        return self._queue is not None and self._queue.full()
+
+    def free_slots(self) -> int:
+        """队列中剩余的空位数"""
+        if self._queue is None:
+            return 0
+        return self._max_queue - self._queue.qsize()
+
+    def submit(self, job_id: str) -> None:
+        """提交任务，队列已满时抛出JobQueueFullError"""
+        if self._queue is None:
+            raise RuntimeError("后台任务执行器未启动")
+        try:
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            raise JobQueueFullError("分析任务队列已满，请稍后重试")
+        self._queued.add(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """取消本进程中排队或运行的任务，返回是否找到该任务"""
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+            return True
+        if job_id in self._queued:
+            self._cancelled.add(job_id)
+            return True
+        return False
+
+    def is_running(self, job_id: str) -> bool:
+        return job_id in self._running
+
+    def is_queued(self, job_id: str) -> bool:
+        return job_id in self._queued
+
+    async def _worker(self, worker_index: int) -> None:
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                if job_id in self._cancelled:
+                    self._cancelled.discard(job_id)
+                    continue
+
+                task = asyncio.create_task(self._runner(job_id))
+                self._running[job_id] = task
+                try:
+                    # 使用wait而不是直接await，区分任务被取消与worker自身被取消
+                    await asyncio.wait({task})
+                except asyncio.CancelledError:
+                    task.cancel()
+                    raise
+                if not task.cancelled() and task.exception():
+                    logging.error(f"后台任务 {job_id} 异常结束: {task.exception()}")
+            finally:
+                self._running.pop(job_id, None)
+                self._queue.task_done()
@@ -0,0 +1,179 @@
+import re
+import json
+from typing import Any, List, Tuple
+
+# 词法单元：双引号字符串、单引号字符串、未闭合的字符串（只可能出现在被截断的末尾）、
+# 结构字符、空白、裸词（数字、true/false/null、未加引号的键等）
+_TOKEN_RE = re.compile(r'''
+    (?P<dq>"(?:[^"\\]|\\.)*")
+  | (?P<sq>'(?:[^'\\]|\\.)*')
+  | (?P<open_string>["'])
+  | (?P<punct>[{}\[\],:])
+  | (?P<ws>\s+)
+  | (?P<word>[^\s{}\[\],:"']+)
+''', re.VERBOSE | re.DOTALL)
+
+# 字符串内未转义的控制字符
+_CONTROL_CHARS = {ord("\n"): "\\n", ord("\r"): "\\r", ord("\t"): "\\t"}
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+class JSONExtractError(ValueError):
+    """无法从AI响应中提取JSON"""
+
+    def __init__(self, message: str, repairs: List[str]):
+        super().__init__(message)
+        self.repairs = repairs
+
+def extract_json(text: str) -> Tuple[Any, List[str]]:
+    """
+    从AI响应中提取JSON，一次扫描完成容错修复：
+    代码块标记、前后说明文字、尾随逗号、未加引号的键、单引号字符串、
+    字符串内的原始换行、Python字面量、元素之间缺失的逗号、被截断的数组/对象
+    返回：(解析结果, 应用的修复列表)，无法提取时抛出JSONExtractError
+    """
+    stripped = text.strip()
+    try:
+        return json.loads(stripped), []
+    except (json.JSONDecodeError, TypeError):
+        pass
+
+    repairs: List[str] = []
+
+    # 定位JSON起点：只有位于第一个{或[之前的```才是代码块标记，此时从其所在行之后开始；
+    # JSON字符串内的```（如用例步骤中的代码示例）不影响定位
+    def first_bracket(scan_from: int) -> int:
+        starts = [pos for pos in (stripped.find("{", scan_from), stripped.find("[", scan_from)) if pos != -1]
+        return min(starts) if starts else -1
+
+    start = first_bracket(0)
+    fence = stripped.find("```")
+    if fence != -1 and (start == -1 or fence < start):
+        line_end = stripped.find("\n", fence)
+        start = first_bracket(line_end + 1 if line_end != -1 else fence + 3)
+        repairs.append("code_fence")
+    if start == -1:
+        raise JSONExtractError("响应中没有JSON对象或数组", repairs)
+    if stripped[:start].replace("```json", "").replace("```", "").strip():
+        repairs.append("stripped_prefix")
+
+    # 快速路径：去掉外层包装后本身就是合法JSON
+    closer = _CLOSERS[stripped[start]]
+    end = stripped.rfind(closer)
+    if end > start:
+        try:
+            result = json.loads(stripped[start:end + 1], strict=False)
+            if stripped[end + 1:].replace("```", "").strip():
+                repairs.append("stripped_suffix")
+            return result, repairs
+        except json.JSONDecodeError:
+            pass
+
+    return _repair_scan(stripped, start, repairs)
+
+def _repair_scan(text: str, start: int, repairs: List[str]) -> Tuple[Any, List[str]]:
+    """按词法单元扫描并重写为合法JSON"""
+    def add_repair(name: str) -> None:
+        if name not in repairs:
+            repairs.append(name)
+
+    out: List[str] = []
+    stack: List[str] = []
+    # 最近一个可以安全截断的位置：(输出长度, 当时的容器栈)，
+    # 只在数组元素之间和容器闭合处记录，截断时不保留写了一半的测试用例
+    checkpoint: Tuple[int, List[str]] = (0, [])
+    last = ""  # 上一个有效词法单元的类别：{ [ } ] , : value
+    pos = start
+    length = len(text)
+    finished = False
+
+    while pos < length:
+        match = _TOKEN_RE.match(text, pos)
+        pos = match.end()
+        kind = match.lastgroup
+        token = match.group()
+
+        if kind == "ws":
+            out.append(token)
+            continue
+
+        if kind == "open_string":
+            # 未闭合的字符串只会出现在截断处
+            break
+
+        if kind == "punct":
+            if token in "{[":
+                if last in ("value", "}", "]"):
+                    out.append(",")
+                    add_repair("missing_comma")
+                stack.append(_CLOSERS[token])
+                out.append(token)
+                last = token
+            elif token in "}]":
+                if last == ",":
+                    # 去掉闭合前的尾随逗号
+                    for back in range(len(out) - 1, -1, -1):
+                        if out[back] == ",":
+                            del out[back]
+                            break
+                    add_repair("trailing_comma")
+                expected = stack.pop()
+                if token != expected:
+                    add_repair("mismatched_bracket")
+                out.append(expected)
+                last = expected
+                if not stack:
+                    finished = True
+                    break
+                if expected == "]" or stack[-1] == "]":
+                    checkpoint = (len(out), list(stack))
+            elif token == ",":
+                if stack[-1] == "]":
+                    checkpoint = (len(out), list(stack))
+                out.append(token)
+                last = token
+            else:
+                out.append(token)
+                last = token
+            continue
+
+        if last in ("value", "}", "]"):
+            out.append(",")
+            add_repair("missing_comma")
+            last = ","
+        expecting_key = stack[-1] == "}" and last in ("{", ",")
+
+        if kind == "dq":
+            if "\n" in token or "\r" in token or "\t" in token:
+                token = token.translate(_CONTROL_CHARS)
+                add_repair("control_chars")
+            out.append(token)
+        elif kind == "sq":
+            body = token[1:-1].replace("\\'", "'").replace('"', '\\"')
+            token = '"' + body.translate(_CONTROL_CHARS) + '"'
+            add_repair("single_quotes")
+            out.append(token)
+        elif expecting_key:
+            out.append(json.dumps(token, ensure_ascii=False))
+            add_repair("unquoted_keys")
+        elif token in _PYTHON_LITERALS:
+            out.append(_PYTHON_LITERALS[token])
+            add_repair("python_literals")
+        else:
+            out.append(token)
+        last = "value"
+
+    if not finished:
+        # 输入被截断：回退到最后一个完整元素之后，并补全未闭合的容器
+        cut, open_stack = checkpoint
+        del out[cut:]
+        out.extend(reversed(open_stack))
+        add_repair("truncated")
+    elif text[pos:].replace("```", "").strip():
+        add_repair("stripped_suffix")
+
+    candidate = "".join(out)
+    try:
+        return json.loads(candidate, strict=False), repairs
+    except json.JSONDecodeError as e:
+        raise JSONExtractError(f"修复后仍无法解析JSON: {e}", repairs)
@@ -0,0 +1,153 @@
+import os
+import re
+import json
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from sqlalchemy import func
+
+from database import SessionLocal
+from models import LLMCacheEntry
+
+# AI结果缓存配置
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+# 每写入多少条缓存执行一次淘汰
+EVICT_EVERY_WRITES = 50
+
+_WHITESPACE_RE = re.compile(r"[ \t　\xa0]+")
+
+# 进程内的命中统计
+_stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+
+def normalize_chunk_text(text: str) -> str:
+    """规范化块文本：去掉行首尾空白、合并行内连续空白、丢弃空行，避免排版差异导致缓存失效"""
+    lines = (_WHITESPACE_RE.sub(" ", line).strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+def chunk_hash(text: str) -> str:
+    """规范化块文本的SHA-256"""
+    return hashlib.sha256(normalize_chunk_text(text).encode("utf-8")).hexdigest()
+
+def build_cache_key(chunk_text: str, model_name: str, api_endpoint: str, temperature: float, prompt_version: str) -> str:
+    """缓存键：块内容哈希、模型、端点、温度和提示词模板版本共同决定"""
+    parts = [
+        chunk_hash(chunk_text),
+        model_name or "",
+        (api_endpoint or "").rstrip("/"),
+        f"{temperature:.3f}",
+        prompt_version or ""
+    ]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+def get_cached_result(cache_key: str) -> Optional[Dict[str, Any]]:
+    """读取缓存，过期条目视为未命中"""
+    if not LLM_CACHE_ENABLED:
+        return None
+    db = SessionLocal()
+    try:
+        entry = db.query(LLMCacheEntry).filter(LLMCacheEntry.cache_key == cache_key).first()
+        if entry is None:
+            _stats["misses"] += 1
+            return None
+
+        if entry.created_at and entry.created_at < datetime.now() - timedelta(seconds=LLM_CACHE_TTL_SECONDS):
+            db.delete(entry)
+            db.commit()
+            _stats["misses"] += 1
+            _stats["evictions"] += 1
+            return None
+
+        entry.hit_count = (entry.hit_count or 0) + 1
+        entry.last_accessed_at = datetime.now()
+        db.commit()
+        _stats["hits"] += 1
+        return json.loads(entry.response)
+    except Exception as e:
+        db.rollback()
+        _stats["errors"] += 1
+        logging.warning(f"读取AI结果缓存失败: {e}")
+        return None
+    finally:
+        db.close()
+
+def store_result(cache_key: str, model_name: str, api_endpoint: str, prompt_version: str, result: Any) -> None:
+    """写入缓存，失败不影响分析流程"""
+    if not LLM_CACHE_ENABLED or not result:
+        return
+    db = SessionLocal()
+    try:
+        payload = json.dumps(result, ensure_ascii=False)
+        entry = db.query(LLMCacheEntry).filter(LLMCacheEntry.cache_key == cache_key).first()
+        if entry is None:
+            entry = LLMCacheEntry(cache_key=cache_key)
+            db.add(entry)
+        entry.model_name = model_name
+        entry.api_endpoint = api_endpoint
+        entry.prompt_version = prompt_version
+        entry.response = payload
+        entry.size_bytes = len(payload.encode("utf-8"))
+        entry.hit_count = 0
+        entry.created_at = datetime.now()
+        entry.last_accessed_at = datetime.now()
+        db.commit()
+        _stats["writes"] += 1
+
+        if _stats["writes"] % EVICT_EVERY_WRITES == 0:
+            evict_expired_entries(db)
+    except Exception as e:
+        db.rollback()
+        _stats["errors"] += 1
+        logging.warning(f"写入AI结果缓存失败: {e}")
+    finally:
+        db.close()
+
+def evict_expired_entries(db=None) -> int:
+    """淘汰过期条目，并按最近访问时间淘汰超出数量上限的条目"""
+    own_session = db is None
+    if own_session:
+        db = SessionLocal()
+    try:
+        expire_before = datetime.now() - timedelta(seconds=LLM_CACHE_TTL_SECONDS)
+        evicted = db.query(LLMCacheEntry).filter(LLMCacheEntry.created_at < expire_before).delete(synchronize_session=False)
+
+        overflow = db.query(LLMCacheEntry).count() - LLM_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            stale_keys = [
+                row.cache_key for row in db.query(LLMCacheEntry.cache_key)
+                .order_by(LLMCacheEntry.last_accessed_at.asc())
+                .limit(overflow)
+            ]
+            evicted += db.query(LLMCacheEntry).filter(LLMCacheEntry.cache_key.in_(stale_keys)).delete(synchronize_session=False)
+
+        db.commit()
+        _stats["evictions"] += evicted
+        if evicted:
+            logging.info(f"AI结果缓存淘汰 {evicted} 条")
+        return evicted
+    except Exception as e:
+        db.rollback()
+        logging.warning(f"AI结果缓存淘汰失败: {e}")
+        return 0
+    finally:
+        if own_session:
+            db.close()
+
+def get_cache_stats() -> Dict[str, Any]:
+    """缓存命中统计（进程内计数）及当前缓存规模"""
+    stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    stats["enabled"] = LLM_CACHE_ENABLED
+    stats["ttl_seconds"] = LLM_CACHE_TTL_SECONDS
+    stats["max_entries"] = LLM_CACHE_MAX_ENTRIES
+    db = SessionLocal()
+    try:
+        stats["entries"] = db.query(LLMCacheEntry).count()
+        stats["size_bytes"] = int(db.query(func.coalesce(func.sum(LLMCacheEntry.size_bytes), 0)).scalar())
+    finally:
+        db.close()
+    return stats
@@ -0,0 +1,230 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+import httpx
+
+from utils.provider_pool import get_pool_members, choose_member, has_alternative, begin_request, end_request, record_success, record_failure
+
+# AI请求失败后的重试配置：第n次重试前等待 [0, min(最大间隔, 基础间隔×2^n)] 内的随机时间，
+# 服务商返回Retry-After时至少等待该时间
+AI_RETRY_MAX_ATTEMPTS = int(os.getenv("AI_RETRY_MAX_ATTEMPTS", "5"))
+AI_RETRY_BASE_DELAY = float(os.getenv("AI_RETRY_BASE_DELAY", "1"))
+AI_RETRY_MAX_DELAY = float(os.getenv("AI_RETRY_MAX_DELAY", "60"))
+
+# 共享同一服务商配额的后端进程数：令牌桶保存在各进程内存中，每个进程只使用 限额/进程数；
+# 默认取uvicorn的WEB_CONCURRENCY（--workers未显式指定时的进程数），多进程部署时应设为实际的worker数
+AI_RATE_LIMIT_PROCESSES = max(1, int(os.getenv("AI_RATE_LIMIT_PROCESSES", os.getenv("WEB_CONCURRENCY", "1"))))
+
+# 可重试的HTTP状态码：限流和服务端临时错误
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+T = TypeVar("T")
+
+class AIRequestError(Exception):
+    """AI接口返回错误状态码"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code in RETRYABLE_STATUS_CODES
+
+def parse_retry_after(headers: httpx.Headers) -> Optional[float]:
+    """解析响应头中的重试等待时间（秒）：retry-after-ms、Retry-After的秒数或HTTP日期"""
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def raise_for_ai_status(response: httpx.Response) -> None:
+    """状态码不是200时抛出AIRequestError，附带服务商要求的重试等待时间"""
+    if response.status_code == 200:
+        return
+    error_msg = f"AI API请求失败: {response.status_code} - {response.text}"
+    logging.error(error_msg)
+    raise AIRequestError(error_msg, status_code=response.status_code, retry_after=parse_retry_after(response.headers))
+
+class TokenBucket:
+    """
+    令牌桶：容量为每分钟限额，按 限额/60 每秒匀速补充；获取时令牌不足则等待，
+    等待者持锁按先来后到排队，避免大请求一直被小请求插队
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.fill_rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.fill_rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1) -> float:
+        """获取amount个令牌（超过容量的按容量计），返回等待的秒数"""
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill(time.monotonic())
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.fill_rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+    def adjust(self, amount: float) -> None:
+        """按实际用量修正：正数补扣（允许欠账，之后的请求相应等待），负数退还预扣多出的部分"""
+        self._refill(time.monotonic())
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+class RateLimiter:
+    """一个AI配置的请求数（RPM）和token数（TPM）限流器，未设置的维度不限制"""
+
+    def __init__(self, requests_per_minute: Optional[int], tokens_per_minute: Optional[int]):
+        self.limits = (requests_per_minute, tokens_per_minute)
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.paused_until = 0.0
+
+    async def acquire(self, estimated_tokens: int) -> float:
+        waited = 0.0
+        # 服务商返回429后暂停期间，同一配置的请求都等待到暂停结束
+        while True:
+            delay = self.paused_until - time.monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+            waited += delay
+        if self.requests:
+            waited += await self.requests.acquire(1)
+        if self.tokens:
+            waited += await self.tokens.acquire(estimated_tokens)
+        return waited
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        if self.tokens and actual_tokens is not None:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def pause(self, seconds: float) -> None:
+        """服务商返回限流时暂停该配置的所有请求，避免并行的请求继续撞上限流"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+def per_process_limit(per_minute: Optional[int]) -> Optional[int]:
+    """配置的每分钟限额在各后端进程间均分后，本进程可用的份额（至少为1）"""
+    if not per_minute:
+        return per_minute
+    return max(1, per_minute // AI_RATE_LIMIT_PROCESSES)
+
+# 每个AI配置一个限流器，同一进程内的并行分析共享本进程的配额份额
+_rate_limiters: Dict[str, RateLimiter] = {}
+
+def get_rate_limiter(ai_config: Any) -> RateLimiter:
+    """获取AI配置对应的限流器，配置的限额变化时重新创建"""
+    key = ai_config.id or ai_config.api_endpoint
+    limits = (
+        per_process_limit(getattr(ai_config, "requests_per_minute", None)),
+        per_process_limit(getattr(ai_config, "tokens_per_minute", None))
+    )
+    limiter = _rate_limiters.get(key)
+    if limiter is None or limiter.limits != limits:
+        limiter = RateLimiter(*limits)
+        _rate_limiters[key] = limiter
+    return limiter
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """第attempt次重试（从0开始）前的等待时间：指数退避加全抖动，不短于Retry-After"""
+    delay = random.uniform(0, min(AI_RETRY_MAX_DELAY, AI_RETRY_BASE_DELAY * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, AI_RETRY_MAX_DELAY))
+    return delay
+
+def _retry_decision(error: Exception) -> Tuple[bool, Optional[float]]:
+    if isinstance(error, AIRequestError):
+        return error.retryable, error.retry_after
+    # 连接失败、超时等网络错误
+    if isinstance(error, (httpx.TransportError, httpx.TimeoutException)):
+        return True, None
+    return False, None
+
+def _is_provider_error(error: Exception) -> bool:
+    # 服务商返回的错误（含鉴权失败）和网络错误，换一个池成员可能成功
+    return isinstance(error, (AIRequestError, httpx.TransportError, httpx.TimeoutException))
+
+async def call_with_retry(
+    ai_config: Any,
+    estimated_tokens: int,
+    send: Callable[[Any], Awaitable[T]],
+    usage_of: Callable[[T], Optional[int]] = lambda result: None,
+    max_attempts: int = AI_RETRY_MAX_ATTEMPTS,
+    call_info: Optional[Dict[str, Any]] = None
+) -> T:
+    """
+    从AI配置所在的提供方池中选择成员，按该成员的限额排队后调用send(成员配置)发出请求；
+    失败时池中还有其他可用成员则立即切换，否则对限流和临时错误指数退避重试
+    estimated_tokens: 预估的token占用（提示词+最大输出），用于TPM限流，请求完成后按usage_of返回的实际用量修正
+    call_info: 传入字典时记录尝试次数（attempts）和最后一次请求的成员配置（member），用于用量统计
+    """
+    members = get_pool_members(ai_config)
+    attempts = max(1, max_attempts)
+    failed = set()
+    for attempt in range(attempts):
+        member = choose_member(members, exclude=failed)
+        if call_info is not None:
+            call_info.update(attempts=attempt + 1, member=member)
+        limiter = get_rate_limiter(member)
+        waited = await limiter.acquire(estimated_tokens)
+        if waited >= 1:
+            logging.info(f"AI请求按配置限额排队等待 {waited:.1f} 秒")
+        started_at = begin_request(member)
+        try:
+            result = await send(member)
+        except Exception as e:
+            retryable, retry_after = _retry_decision(e)
+            provider_error = _is_provider_error(e)
+            if provider_error:
+                record_failure(member, started_at, members)
+            else:
+                end_request(member)
+            # 请求没有被处理，退还预扣的token
+            limiter.record_usage(estimated_tokens, 0)
+
+            failed.add(member.id or member.api_endpoint)
+            failover = provider_error and len(members) > 1 and has_alternative(members, failed)
+            if attempt == attempts - 1 or not (retryable or failover):
+                raise
+
+            delay = backoff_delay(attempt, retry_after)
+            if isinstance(e, AIRequestError) and e.status_code == 429:
+                limiter.pause(delay)
+            if failover:
+                logging.warning(f"AI请求失败（第 {attempt + 1}/{attempts} 次，{member.provider}/{member.model_name}）: {str(e)[:200]}，切换到池中其他配置")
+                continue
+            logging.warning(f"AI请求失败（第 {attempt + 1}/{attempts} 次）: {str(e)[:200]}，{delay:.1f} 秒后重试")
+            await asyncio.sleep(delay)
+            continue
+        record_success(member, started_at, members)
+        limiter.record_usage(estimated_tokens, usage_of(result))
+        return result
@@ -0,0 +1,148 @@
+import os
+import re
+import zlib
+import random
+from typing import Dict, FrozenSet, Generic, List, Optional, Tuple, TypeVar
+
+# 近似重复判定阈值：两个用例"标题+步骤+预期结果"字符n-gram集合的Jaccard相似度不低于该值视为重复，0表示不做近似去重
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9"))
+# 标题单独比较的相似度下限：共用同一套步骤、只在输入条件上不同的用例（如"密码为空/密码错误时登录失败"）标题差异明显，不视为重复
+NEAR_DUPLICATE_TITLE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_TITLE_THRESHOLD", "0.5"))
+# 字符n-gram的长度，中文文本按字切分，3-gram能区分大多数改写
+SHINGLE_SIZE = 3
+# MinHash签名长度
+NUM_PERM = 128
+# LSH分段时估计阈值比判定阈值低出的余量，保证相似度刚达到阈值的用例对也能大概率成为候选
+LSH_RECALL_MARGIN = 0.1
+# 空桶借用非空桶时最多探测的次数，超过后借用第一个非空桶
+DENSIFY_PROBES = 32
+
+_MAX_HASH = 0xFFFFFFFF
+# 步骤编号【1】、1.、(1) 以及空白和标点不参与比较
+_STEP_NUMBER_RE = re.compile(r"【\d+】|^\s*[(（]?\d+[.、)）]", re.MULTILINE)
+_PUNCTUATION_RE = re.compile(r"[\s\W_]+")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+K = TypeVar("K")
+
+def normalize_case_text(text: str) -> str:
+    """去掉步骤编号、空白和标点并转为小写，使格式上的差异不影响相似度"""
+    return _PUNCTUATION_RE.sub("", _STEP_NUMBER_RE.sub("", text or "")).lower()
+
+def shingle_hashes(text: str, size: int = SHINGLE_SIZE) -> FrozenSet[int]:
+    """文本的字符n-gram哈希集合；文本短于n时整段作为一个n-gram"""
+    if len(text) <= size:
+        return frozenset([zlib.crc32(text.encode("utf-8"))]) if text else frozenset()
+    return frozenset(zlib.crc32(text[i:i + size].encode("utf-8")) for i in range(len(text) - size + 1))
+
+def _densify_probes(num_perm: int) -> List[List[int]]:
+    # 每个桶固定的随机探测序列，所有文本共用，保证借用结果只取决于哪些桶非空
+    rng = random.Random(num_perm)
+    return [[rng.randrange(num_perm) for _ in range(DENSIFY_PROBES)] for _ in range(num_perm)]
+
+_probe_tables: Dict[int, List[List[int]]] = {}
+
+def minhash_signature(hashes: FrozenSet[int], num_perm: int = NUM_PERM) -> List[int]:
+    """
+    单次置换MinHash（one permutation hashing）：每个n-gram哈希只计算一次，按哈希值分到num_perm个桶中取桶内最小值，
+    计算量与n-gram数量成线性关系；空桶按该桶固定的随机探测序列借用第一个非空桶的值（optimal densification），
+    相邻空桶借用不同的桶，避免短文本的签名中出现大段相同来源的值
+    """
+    bins: List[Optional[int]] = [None] * num_perm
+    for h in hashes:
+        index = h % num_perm
+        value = h // num_perm
+        current = bins[index]
+        if current is None or value < current:
+            bins[index] = value
+    first = next((value for value in bins if value is not None), None)
+    if first is None:
+        return [_MAX_HASH] * num_perm
+
+    probes = _probe_tables.get(num_perm)
+    if probes is None:
+        probes = _probe_tables[num_perm] = _densify_probes(num_perm)
+    signature = list(bins)
+    for index, value in enumerate(bins):
+        if value is None:
+            signature[index] = next((bins[j] for j in probes[index] if bins[j] is not None), first)
+    return signature
+
+def choose_lsh_bands(threshold: float, num_perm: int = NUM_PERM) -> Tuple[int, int]:
+    """
+    选择LSH的分段数b和每段行数r：候选概率曲线的拐点约为 (1/b)^(1/r)，
+    在拐点不高于 阈值-余量 的前提下取最大的r，使候选对尽量少
+    """
+    target = max(0.05, threshold - LSH_RECALL_MARGIN)
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if bands < 1:
+            break
+        if (1.0 / bands) ** (1.0 / rows) <= target:
+            best = (bands, rows)
+    return best
+
+def jaccard(a: FrozenSet[int], b: FrozenSet[int]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+class NearDuplicateIndex(Generic[K]):
+    """
+    基于MinHash/LSH的近似重复索引：依次加入文本，查询时只和落在相同LSH桶中的候选比较，
+    再用精确的Jaccard相似度确认，整体耗时随文本数量线性增长
+    """
+
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD, num_perm: int = NUM_PERM,
+                 title_threshold: float = NEAR_DUPLICATE_TITLE_THRESHOLD):
+        self.threshold = threshold
+        self.title_threshold = title_threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = choose_lsh_bands(threshold, num_perm)
+        self._buckets: List[Dict[Tuple, List[K]]] = [{} for _ in range(self.bands)]
+        self._hashes: Dict[K, FrozenSet[int]] = {}
+        self._title_hashes: Dict[K, FrozenSet[int]] = {}
+
+    def _band_keys(self, signature: List[int], numbers: Tuple[str, ...]) -> List[Tuple]:
+        # 数值不同的条目不可能重复，数值并入桶键，避免它们互相成为候选
+        return [(numbers, *signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def find_or_add(self, key: K, text: str, numbers: Tuple[str, ...] = (), title: Optional[str] = None) -> Optional[K]:
+        """
+        查找与text近似重复的已有条目，找到时返回其key且不加入索引，否则加入索引并返回None
+        numbers不同的条目（如只在边界值上不同的用例）不视为重复；
+        传入title时，标题相似度还需不低于title_threshold
+        """
+        hashes = shingle_hashes(normalize_case_text(text))
+        title_hashes = shingle_hashes(normalize_case_text(title)) if title is not None else None
+        band_keys = self._band_keys(minhash_signature(hashes, self.num_perm), numbers)
+
+        checked = set()
+        for band, band_key in enumerate(band_keys):
+            for candidate in self._buckets[band].get(band_key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if jaccard(hashes, self._hashes[candidate]) < self.threshold:
+                    continue
+                candidate_title = self._title_hashes.get(candidate)
+                if title_hashes is not None and candidate_title is not None and jaccard(title_hashes, candidate_title) < self.title_threshold:
+                    continue
+                return candidate
+
+        self._hashes[key] = hashes
+        if title_hashes is not None:
+            self._title_hashes[key] = title_hashes
+        for band, band_key in enumerate(band_keys):
+            self._buckets[band].setdefault(band_key, []).append(key)
+        return None
+
+def case_similarity_text(case: Dict[str, str]) -> Tuple[str, Tuple[str, ...]]:
+    """
+    用于近似重复比较的文本（标题+步骤描述+预期结果），以及标题中的数值；
+    预期结果参与比较，步骤相同但预期不同的用例不会被合并
+    """
+    title = case.get("title") or ""
+    text = f"{title}\n{case.get('step_description') or ''}\n{case.get('expected_result') or ''}"
+    return text, tuple(_NUMBER_RE.findall(title))
@@ -0,0 +1,71 @@
+import json
+import base64
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlalchemy import and_, or_
+
+class InvalidCursorError(ValueError):
+    """分页游标无法解析"""
+
+def encode_cursor(ai_order: Optional[int], created_at: Optional[datetime], case_id: str) -> str:
+    """将上一页最后一条用例的排序键编码为不透明的游标字符串"""
+    payload = {
+        "o": ai_order,
+        "c": created_at.isoformat() if created_at else None,
+        "i": case_id
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    解析游标，返回 {"ai_order", "created_at", "id"}
+    游标格式错误时抛出 InvalidCursorError
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        created_at = datetime.fromisoformat(payload["c"]) if payload["c"] else None
+        ai_order = payload["o"]
+        if ai_order is not None and not isinstance(ai_order, int):
+            raise ValueError("ai_order")
+        case_id = str(payload["i"])
+    except (ValueError, TypeError, KeyError) as e:
+        raise InvalidCursorError(f"无效的分页游标: {e}")
+    return {"ai_order": ai_order, "created_at": created_at, "id": case_id}
+
+def keyset_after(order_column, created_column, id_column, key: Dict[str, Any]):
+    """
+    构造"排在游标之后"的过滤条件，对应排序 (order_column, created_column, id_column) 升序；
+    MySQL升序排序时NULL排在最前，order_column为NULL的行位于其他行之前
+    """
+    if key["created_at"] is None:
+        same_order_after = id_column > key["id"]
+    else:
+        same_order_after = or_(
+            created_column > key["created_at"],
+            and_(created_column == key["created_at"], id_column > key["id"])
+        )
+    if key["ai_order"] is None:
+        return or_(
+            and_(order_column.is_(None), same_order_after),
+            order_column.isnot(None)
+        )
+    return or_(
+        order_column > key["ai_order"],
+        and_(order_column == key["ai_order"], same_order_after)
+    )
+
+def parse_fields(fields: Optional[str], allowed: List[str], required: List[str]) -> Optional[List[str]]:
+    """
+    解析逗号分隔的字段列表，按allowed中的顺序返回，并总是包含required中的字段；
+    未传入时返回None表示全部字段，包含未知字段时抛出ValueError
+    """
+    if fields is None or not fields.strip():
+        return None
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise ValueError(f"未知字段: {', '.join(sorted(unknown))}")
+    requested.update(required)
+    return [name for name in allowed if name in requested]
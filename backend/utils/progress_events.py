@@ -0,0 +1,67 @@
+import json
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Set
+
+# 每个订阅者最多缓存的事件数，消费过慢时丢弃最旧的进度事件
+SUBSCRIBER_QUEUE_SIZE = 100
+# 保存为任务最新状态、回放给后订阅者的事件类型；逐条推送的测试用例（case）事件不回放
+REPLAYED_EVENT_TYPES = {"progress"}
+
+class ProgressBroker:
+    """
+    进程内的分析进度事件分发器：分析任务发布结构化事件，
+    SSE连接订阅对应任务的事件，任务结束后清理该任务的全部状态
+    """
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self._queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._last_events: Dict[str, Dict[str, Any]] = {}
+
+    def publish(self, job_id: str, event: Dict[str, Any]) -> None:
+        if event.get("type") in REPLAYED_EVENT_TYPES:
+            self._last_events[job_id] = event
+        for queue in list(self._subscribers.get(job_id, ())):
+            if queue.full():
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait(event)
+
+    def finish(self, job_id: str, event: Dict[str, Any]) -> None:
+        """发布终止事件并释放该任务的状态"""
+        self.publish(job_id, event)
+        self._last_events.pop(job_id, None)
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self._queue_size)
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        last_event = self._last_events.get(job_id)
+        if last_event is not None:
+            queue.put_nowait(last_event)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(job_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            self._subscribers.pop(job_id, None)
+
+    def last_event(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._last_events.get(job_id)
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """将事件编码为SSE消息"""
+    event_type = event.get("type", "message")
+    try:
+        data = json.dumps(event, ensure_ascii=False, default=str)
+    except Exception as e:
+        logging.warning(f"进度事件序列化失败: {e}")
+        data = json.dumps({"type": event_type})
+    return f"event: {event_type}\ndata: {data}\n\n"
+
+progress_broker = ProgressBroker()
@@ -0,0 +1,111 @@
+from typing import Any, Dict, List
+
+from utils.chunker import count_tokens
+
+class PromptTemplate:
+    """
+    版本化的提示词模板：固定的说明放在system消息中，所有请求的这部分逐字相同，
+    可以命中服务商的提示词前缀缓存；可变内容放在user消息中，文档内容位于最后
+    修改模板内容时必须同时修改version，使按版本缓存的AI结果失效
+    """
+
+    def __init__(self, version: str, system: str, user: str, content_field: str = "content"):
+        self.version = version
+        self.system = system.strip()
+        self.user = user.strip()
+        self.content_field = content_field
+
+    def render(self, **fields: Any) -> List[Dict[str, str]]:
+        """生成chat/completions的messages"""
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.user.format(**fields)}
+        ]
+
+    def measure(self, **fields: Any) -> Dict[str, int]:
+        """
+        提示词的token构成：prompt_tokens为全部消息，content_tokens为文档内容，
+        instruction_tokens为其余的说明文字，prefix_tokens为其中可被前缀缓存的system部分
+        """
+        total = sum(count_tokens(message["content"]) for message in self.render(**fields))
+        content = count_tokens(str(fields.get(self.content_field, "")))
+        return {
+            "prompt_tokens": total,
+            "instruction_tokens": total - content,
+            "content_tokens": content,
+            "prefix_tokens": count_tokens(self.system)
+        }
+
+# 分块分析和整篇分析共用的说明，两类请求共享同一个可缓存前缀
+CASE_GENERATION_SYSTEM = """
+你是资深测试工程师，根据产品需求文档（PRD）内容生成可导入Teambition的测试用例，并给出针对该内容的测试策略建议。
+
+只返回一个JSON对象，不要包含其他文本，格式如下：
+{
+  "test_cases": [
+    {
+      "title": "测试用例标题（必填）",
+      "group_name": "所属分组，用|分隔层级，如：Web端测试用例|首页|我的待办",
+      "maintainer": "维护人姓名",
+      "precondition": "前置条件",
+      "step_description": "【1】步骤一\\n【2】步骤二",
+      "expected_result": "【1】步骤一的预期结果\\n【2】步骤二的预期结果",
+      "case_level": "高/中/低，默认中",
+      "case_type": "功能测试/性能测试/安全测试/兼容性测试，默认功能测试",
+      "test_suggestions": "该用例的测试建议，如测试数据准备、注意事项、关联测试"
+    }
+  ],
+  "analysis_suggestions": "针对所给文档内容的测试策略分析和建议"
+}
+
+测试用例要求：
+1. 覆盖所有功能模块和功能点：正常流程、异常流程、边界值、数据验证、权限控制和各种用户误操作
+2. 步骤描述和预期结果使用【1】、【2】、【3】编号，每个步骤单独一行，编号一一对应
+3. 只有title必填，其他字段尽量填写完整，没有内容时填空字符串
+4. 用例等级：核心业务为高，主要功能为中，非核心功能为低；按需包含功能、性能、安全、兼容性测试
+
+analysis_suggestions要求（不能留空，必须基于所给文档的具体内容，不能是通用模板）：
+1. 业务逻辑和技术特点、潜在风险点和测试难点
+2. 推荐的测试方法和工具、性能和安全测试要点
+3. 与其他模块的依赖关系和集成测试要点
+4. 测试数据准备建议
+"""
+
+CHUNK_TEMPLATE = PromptTemplate(
+    version="chunk-v2",
+    system=CASE_GENERATION_SYSTEM,
+    user="""
+这是产品需求文档的第 {index} 部分（共 {total} 部分），请重点关注这部分的功能需求、业务逻辑和技术实现细节。
+
+文档内容片段：
+{content}
+"""
+)
+
+DOCUMENT_TEMPLATE = PromptTemplate(
+    version="single-v2",
+    system=CASE_GENERATION_SYSTEM,
+    user="""
+以下是完整的产品需求文档，请全面分析并生成测试用例。
+
+文档内容：
+{content}
+"""
+)
+
+SUGGESTION_TEMPLATE = PromptTemplate(
+    version="suggestion-v2",
+    system="""
+你是资深测试工程师，负责把同一份产品需求文档各部分的测试策略分析建议合并为一份。合并要求：
+1. 合并相同或相近的建议，去除重复内容
+2. 保留各部分特有的测试重点、风险点、测试数据准备和注意事项
+3. 按功能模块或测试类型组织，使用简洁的条目
+
+直接输出合并后的建议文本，不要返回JSON，不要包含其他说明。
+""",
+    user="""
+请将以下 {count} 条建议（以"---"分隔）合并为{goal}，总长度不超过约 {max_chars} 字。
+
+{content}
+"""
+)
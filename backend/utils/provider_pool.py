@@ -0,0 +1,189 @@
+import os
+import time
+import random
+import logging
+from typing import Any, Dict, List, Optional
+
+from database import SessionLocal
+from models import AIConfiguration
+
+# 同一提供方池的成员列表缓存时间（秒），修改AI配置后最迟在该时间后生效
+AI_POOL_REFRESH_SECONDS = float(os.getenv("AI_POOL_REFRESH_SECONDS", "30"))
+# 连续失败该次数后暂时摘除成员
+AI_POOL_EJECT_FAILURES = int(os.getenv("AI_POOL_EJECT_FAILURES", "3"))
+# 首次摘除的时长（秒），再次摘除时翻倍，不超过最大值
+AI_POOL_EJECT_SECONDS = float(os.getenv("AI_POOL_EJECT_SECONDS", "30"))
+AI_POOL_MAX_EJECT_SECONDS = float(os.getenv("AI_POOL_MAX_EJECT_SECONDS", "300"))
+# 平均延迟超过池中最快成员该倍数时视为过慢并摘除，0表示不按延迟摘除
+AI_POOL_SLOW_FACTOR = float(os.getenv("AI_POOL_SLOW_FACTOR", "3"))
+
+# 延迟和错误率的指数滑动平均系数
+EWMA_ALPHA = 0.3
+# 按延迟判断过慢前至少需要的请求数
+SLOW_MIN_SAMPLES = 5
+# 还没有请求记录的成员使用的初始延迟（秒）
+INITIAL_LATENCY = 1.0
+
+class EndpointStats:
+    """一个AI配置的请求统计：延迟和错误率的滑动平均、连续失败次数和摘除状态"""
+
+    def __init__(self):
+        self.latency = INITIAL_LATENCY
+        self.error_rate = 0.0
+        self.samples = 0
+        self.consecutive_failures = 0
+        self.in_flight = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.probing = False  # 摘除到期后放行一个探测请求，成功后恢复
+
+    def is_available(self, now: float) -> bool:
+        if self.ejected_until > now:
+            return False
+        # 摘除到期的成员同时只放行一个探测请求
+        return not (self.probing and self.in_flight > 0)
+
+    def eject(self, now: float) -> float:
+        duration = min(AI_POOL_MAX_EJECT_SECONDS, AI_POOL_EJECT_SECONDS * (2 ** self.ejections))
+        self.ejections += 1
+        self.ejected_until = now + duration
+        self.probing = True
+        return duration
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        return {
+            "latency_seconds": round(self.latency, 3),
+            "error_rate": round(self.error_rate, 3),
+            "samples": self.samples,
+            "consecutive_failures": self.consecutive_failures,
+            "in_flight": self.in_flight,
+            "ejected": self.ejected_until > now,
+            "ejected_seconds_left": round(max(0.0, self.ejected_until - now), 1),
+            "probing": self.probing
+        }
+
+# 按AI配置ID记录的统计，池成员列表刷新后保留
+_stats: Dict[str, EndpointStats] = {}
+# 池名 -> (加载时间, 成员列表)
+_pool_members: Dict[str, tuple] = {}
+
+def _stats_of(config: Any) -> EndpointStats:
+    key = config.id or config.api_endpoint
+    stats = _stats.get(key)
+    if stats is None:
+        stats = _stats[key] = EndpointStats()
+    return stats
+
+def _load_pool_members(pool_name: str) -> List[AIConfiguration]:
+    db = SessionLocal()
+    try:
+        members = db.query(AIConfiguration).filter(
+            AIConfiguration.pool_name == pool_name,
+            AIConfiguration.weight > 0
+        ).all()
+        # 关闭会话后成员对象仍可读取已加载的字段
+        db.expunge_all()
+        return members
+    finally:
+        db.close()
+
+def get_pool_members(ai_config: Any) -> List[Any]:
+    """
+    AI配置所在提供方池的成员：与其pool_name相同且权重大于0的所有配置；
+    未设置池名时只有该配置本身
+    """
+    pool_name = getattr(ai_config, "pool_name", None)
+    if not pool_name:
+        return [ai_config]
+    cached = _pool_members.get(pool_name)
+    now = time.monotonic()
+    if cached is None or now - cached[0] > AI_POOL_REFRESH_SECONDS:
+        try:
+            members = _load_pool_members(pool_name)
+        except Exception as e:
+            logging.warning(f"加载AI提供方池 {pool_name} 失败: {e}")
+            members = cached[1] if cached else []
+        cached = (now, members)
+        _pool_members[pool_name] = cached
+    return cached[1] or [ai_config]
+
+def _score(config: Any, stats: EndpointStats) -> float:
+    # 权重越高、延迟越低、错误率越低、正在处理的请求越少，被选中的概率越大
+    weight = max(1, getattr(config, "weight", None) or 1)
+    return weight * (1.0 - stats.error_rate) ** 2 / (max(stats.latency, 0.05) * (1 + stats.in_flight))
+
+def choose_member(members: List[Any], exclude: Optional[set] = None) -> Any:
+    """
+    按得分加权随机选择一个可用成员，exclude中的成员（如刚失败的）在有其他可用成员时不选；
+    所有成员都被摘除时选择最早恢复的成员，不直接失败
+    """
+    now = time.monotonic()
+    exclude = exclude or set()
+    available = [m for m in members if _stats_of(m).is_available(now)]
+    preferred = [m for m in available if (m.id or m.api_endpoint) not in exclude] or available
+    if not preferred:
+        return min(members, key=lambda m: _stats_of(m).ejected_until)
+    if len(preferred) == 1:
+        return preferred[0]
+    scores = [_score(m, _stats_of(m)) for m in preferred]
+    return random.choices(preferred, weights=scores, k=1)[0]
+
+def has_alternative(members: List[Any], exclude: set) -> bool:
+    """除exclude外是否还有可用成员，有则失败后可以立即切换，不需要退避等待"""
+    now = time.monotonic()
+    return any((m.id or m.api_endpoint) not in exclude and _stats_of(m).is_available(now) for m in members)
+
+def begin_request(config: Any) -> float:
+    _stats_of(config).in_flight += 1
+    return time.monotonic()
+
+def end_request(config: Any) -> None:
+    """请求因非服务商原因中止（如响应解析失败），不计入统计"""
+    stats = _stats_of(config)
+    stats.in_flight = max(0, stats.in_flight - 1)
+
+def record_success(config: Any, started_at: float, members: List[Any]) -> None:
+    stats = _stats_of(config)
+    now = time.monotonic()
+    stats.in_flight = max(0, stats.in_flight - 1)
+    stats.latency = (1 - EWMA_ALPHA) * stats.latency + EWMA_ALPHA * (now - started_at) if stats.samples else now - started_at
+    stats.error_rate = (1 - EWMA_ALPHA) * stats.error_rate
+    stats.samples += 1
+    stats.consecutive_failures = 0
+    if stats.probing:
+        stats.probing = False
+        stats.ejections = 0
+        logging.info(f"AI提供方 {config.provider}/{config.model_name} 探测成功，恢复使用")
+
+    # 明显慢于池中最快成员时摘除，让请求流向更快的成员
+    if AI_POOL_SLOW_FACTOR > 0 and len(members) > 1 and stats.samples >= SLOW_MIN_SAMPLES:
+        others = [_stats_of(m) for m in members if _stats_of(m) is not stats and _stats_of(m).samples >= SLOW_MIN_SAMPLES]
+        healthy = [s.latency for s in others if s.is_available(now)]
+        if healthy and stats.latency > AI_POOL_SLOW_FACTOR * min(healthy):
+            duration = stats.eject(now)
+            logging.warning(f"AI提供方 {config.provider}/{config.model_name} 平均延迟 {stats.latency:.1f} 秒，暂停使用 {duration:.0f} 秒")
+
+def record_failure(config: Any, started_at: float, members: List[Any]) -> None:
+    stats = _stats_of(config)
+    now = time.monotonic()
+    stats.in_flight = max(0, stats.in_flight - 1)
+    stats.error_rate = (1 - EWMA_ALPHA) * stats.error_rate + EWMA_ALPHA
+    stats.samples += 1
+    stats.consecutive_failures += 1
+    # 只有一个成员时摘除没有意义，由调用方退避重试
+    if len(members) > 1 and (stats.probing or stats.consecutive_failures >= AI_POOL_EJECT_FAILURES):
+        duration = stats.eject(now)
+        stats.consecutive_failures = 0
+        logging.warning(f"AI提供方 {config.provider}/{config.model_name} 连续请求失败，暂停使用 {duration:.0f} 秒")
+
+def get_pool_stats(configs: List[Any]) -> List[Dict[str, Any]]:
+    """各AI配置的请求统计，用于查看池中成员的健康状态"""
+    now = time.monotonic()
+    return [{
+        "id": config.id,
+        "provider": config.provider,
+        "model_name": config.model_name,
+        "pool_name": getattr(config, "pool_name", None),
+        "weight": getattr(config, "weight", None),
+        **_stats_of(config).to_dict(now)
+    } for config in configs]
@@ -0,0 +1,68 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+class IncrementalCaseParser:
+    """
+    增量JSON扫描器：逐段喂入AI的流式输出，识别位于数组中的完整对象（即测试用例），
+    对象一闭合就解析返回。每个字符只扫描一次，不需要反复解析整段响应
+    """
+
+    def __init__(self):
+        self._started = False  # 是否已遇到第一个 { 或 [，之前的说明文字忽略
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._capture: Optional[List[str]] = None
+        self._capture_depth = 0
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """喂入一段新文本，返回本段中新完成的测试用例"""
+        cases = []
+        for ch in text:
+            if not self._started:
+                if ch not in "{[":
+                    continue
+                self._started = True
+
+            if self._capture is not None:
+                self._capture.append(ch)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch == "{" or ch == "[":
+                # 数组中的对象视为一个测试用例，开始记录其文本
+                if ch == "{" and self._capture is None and self._stack and self._stack[-1] == "[":
+                    self._capture = ["{"]
+                    self._capture_depth = len(self._stack)
+                self._stack.append(ch)
+            elif ch == "}" or ch == "]":
+                if self._stack:
+                    self._stack.pop()
+                if self._capture is not None and ch == "}" and len(self._stack) == self._capture_depth:
+                    case = self._finish_capture()
+                    if case is not None:
+                        cases.append(case)
+        return cases
+
+    def _finish_capture(self) -> Optional[Dict[str, Any]]:
+        object_text = "".join(self._capture)
+        self._capture = None
+        try:
+            # AI输出的字符串中常带有未转义的换行，使用非严格模式
+            case = json.loads(object_text, strict=False)
+        except json.JSONDecodeError as e:
+            logging.info(f"流式解析跳过无法解析的对象: {e}")
+            return None
+        if isinstance(case, dict) and case.get("title"):
+            return case
+        return None
@@ -0,0 +1,166 @@
+import os
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.chunker import count_tokens
+from utils.near_duplicates import NearDuplicateIndex
+from utils.prompt_templates import SUGGESTION_TEMPLATE
+
+# 合并后的整体分析建议的token上限，各块建议去重后不超过该值时直接拼接，不请求AI
+SUGGESTION_MAX_TOKENS = int(os.getenv("SUGGESTION_MAX_TOKENS", "2000"))
+# 单次归并请求中各块建议的token上限，超过时分组归并后再逐层合并
+SUGGESTION_REDUCE_INPUT_TOKENS = int(os.getenv("SUGGESTION_REDUCE_INPUT_TOKENS", "6000"))
+# 归并阶段的总token预算（提示词+输出），剩余预算不足以完成下一层时停止请求AI，按段落截断
+SUGGESTION_REDUCE_TOKEN_BUDGET = int(os.getenv("SUGGESTION_REDUCE_TOKEN_BUDGET", "60000"))
+
+# 段落去重的相似度阈值，以及参与去重的最短段落长度（短段落多为小标题，不去重）
+PARAGRAPH_DUPLICATE_THRESHOLD = 0.8
+PARAGRAPH_MIN_CHARS = 20
+# 归并全部建议的总消耗约为建议token数的倍数，用于按预算预先截断；截断后每条建议至少保留的token数
+REDUCE_COST_FACTOR = 3
+ITEM_MIN_TOKENS = 100
+# 各条建议之间的分隔符
+PART_SEPARATOR = "\n\n"
+
+# 归并函数：输入messages，返回 (AI生成的文本, 本次请求消耗的token数)
+Summarize = Callable[[List[Dict[str, str]]], Awaitable[Tuple[str, int]]]
+
+def _reduce_fields(parts: List[str], final: bool, max_tokens: int) -> Dict[str, Any]:
+    return {
+        "count": len(parts),
+        "goal": "一份完整的整体测试策略" if final else "一份阶段性的测试策略汇总（之后还会与其他部分的汇总继续合并）",
+        "max_chars": max_tokens // 2,
+        "content": "\n---\n".join(parts)
+    }
+
+def build_reduce_messages(parts: List[str], final: bool, max_tokens: int = SUGGESTION_MAX_TOKENS) -> List[Dict[str, str]]:
+    """构建归并分析建议的请求消息，final为True时生成最终的整体测试策略"""
+    return SUGGESTION_TEMPLATE.render(**_reduce_fields(parts, final, max_tokens))
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """按行截断到max_tokens以内，第一行就超限时按字符比例截断"""
+    text = text.strip()
+    if count_tokens(text) <= max_tokens:
+        return text
+    kept = []
+    used = 0
+    for line in text.split("\n"):
+        cost = count_tokens(line) + 1
+        if used + cost > max_tokens:
+            if not kept:
+                kept.append(line[:max(1, len(line) * max_tokens // cost)])
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept).rstrip() + "\n……"
+
+def dedupe_suggestions(suggestions: List[str]) -> List[str]:
+    """
+    按段落（空行分隔）去除各块建议中的近似重复内容，保留先出现的段落；
+    每条建议仍独立保留，去重后为空的建议丢弃
+    """
+    index: NearDuplicateIndex[int] = NearDuplicateIndex(threshold=PARAGRAPH_DUPLICATE_THRESHOLD)
+    key = 0
+    result = []
+    for suggestion in suggestions:
+        kept = []
+        for paragraph in (suggestion or "").strip().split("\n\n"):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if len(paragraph) >= PARAGRAPH_MIN_CHARS:
+                key += 1
+                if index.find_or_add(key, paragraph) is not None:
+                    continue
+            kept.append(paragraph)
+        if kept:
+            result.append("\n\n".join(kept))
+    return result
+
+def group_by_tokens(costs: List[int], max_tokens: int) -> List[List[int]]:
+    """按顺序将相邻的建议打包为若干组，每组token数不超过max_tokens"""
+    groups: List[List[int]] = []
+    current: List[int] = []
+    used = 0
+    for index, cost in enumerate(costs):
+        if current and used + cost > max_tokens:
+            groups.append(current)
+            current = []
+            used = 0
+        current.append(index)
+        used += cost
+    if current:
+        groups.append(current)
+    return groups
+
+async def reduce_suggestions(
+    suggestions: List[str],
+    summarize: Summarize,
+    max_tokens: int = SUGGESTION_MAX_TOKENS,
+    input_tokens: int = SUGGESTION_REDUCE_INPUT_TOKENS,
+    token_budget: int = SUGGESTION_REDUCE_TOKEN_BUDGET,
+    progress_callback: Optional[Callable[[int, int], None]] = None
+) -> Tuple[str, int]:
+    """
+    将各块的分析建议树形归并为一份不超过max_tokens的整体建议：
+    先按段落去重，仍超限时把相邻建议按input_tokens打包成组，各组并行请求AI合并，
+    合并结果作为下一层的输入，直到全部建议能放入一次请求，最后一次请求生成整体测试策略
+    每层至少把建议数减半，层数为 O(log n)；建议总量超出token_budget时先按比例截断每条建议，
+    预估下一层仍会超出预算时停止请求AI，按段落截断拼接
+    progress_callback: 每完成一层回调 progress_callback(层数, 累计token数)
+    返回：(整体分析建议, 归并阶段消耗的token数)
+    """
+    items = dedupe_suggestions(suggestions)
+    if not items:
+        return "", 0
+    combined = PART_SEPARATOR.join(items)
+    if count_tokens(combined) <= max_tokens:
+        return combined, 0
+
+    # 单条建议不超过单次输入的一半，保证每组至少包含两条，每层都能减少建议数
+    input_tokens = max(input_tokens, 2 * max_tokens)
+    # 各层输入合计约为首层的两倍，加上输出约三倍；预算不足时先按比例截断每条建议，使各部分都能参与归并
+    total_tokens = sum(count_tokens(item) for item in items)
+    if total_tokens * REDUCE_COST_FACTOR > token_budget:
+        item_tokens = max(ITEM_MIN_TOKENS, token_budget // (REDUCE_COST_FACTOR * len(items)))
+        logging.info(f"分析建议共 {total_tokens} tokens，超出归并预算，每条截断到 {item_tokens} tokens")
+        items = [truncate_to_tokens(item, item_tokens) for item in items]
+    tokens_used = 0
+    level = 0
+    while True:
+        items = [truncate_to_tokens(item, input_tokens // 2) for item in items]
+        costs = [count_tokens(item) for item in items]
+        final = sum(costs) <= input_tokens
+        groups = [list(range(len(items)))] if final else group_by_tokens(costs, input_tokens)
+
+        # 只有一条建议的组原样进入下一层，不请求AI
+        estimate = sum(
+            SUGGESTION_TEMPLATE.measure(**_reduce_fields([items[i] for i in group], final, max_tokens))["prompt_tokens"] + max_tokens
+            for group in groups if len(group) > 1 or final
+        )
+        if tokens_used + estimate > token_budget:
+            logging.warning(f"分析建议归并预计还需 {estimate} tokens，超出预算（已用 {tokens_used}/{token_budget}），按段落截断合并")
+            return truncate_to_tokens(PART_SEPARATOR.join(items), max_tokens), tokens_used
+
+        async def reduce_group(group: List[int]) -> Tuple[str, int]:
+            parts = [items[i] for i in group]
+            if len(parts) == 1 and not final:
+                return parts[0], 0
+            try:
+                text, used = await summarize(build_reduce_messages(parts, final, max_tokens))
+            except Exception as e:
+                logging.error(f"分析建议归并失败: {str(e)}，按段落截断合并该组")
+                return truncate_to_tokens(PART_SEPARATOR.join(parts), max_tokens), 0
+            return truncate_to_tokens(text, max_tokens), used
+
+        results = await asyncio.gather(*(reduce_group(group) for group in groups))
+        tokens_used += sum(used for _, used in results)
+        level += 1
+        logging.info(f"分析建议归并第 {level} 层：{len(items)} 条合并为 {len(results)} 条，累计 {tokens_used} tokens")
+        if progress_callback:
+            progress_callback(level, tokens_used)
+
+        items = [text for text, _ in results if text]
+        if final or len(items) <= 1:
+            return (items[0] if items else ""), tokens_used
@@ -0,0 +1,137 @@
+import os
+import uuid
+import logging
+from typing import Any, Dict, Iterable, List
+from sqlalchemy import insert, update, delete, func
+from sqlalchemy.orm import Session
+
+from models import TestCase
+
+# 批量写入测试用例时每批的行数，每批一次数据库往返
+TEST_CASE_INSERT_BATCH_SIZE = int(os.getenv("TEST_CASE_INSERT_BATCH_SIZE", "500"))
+
+def build_test_case_row(session_id: str, case_data: Dict[str, Any], ai_order: int) -> Dict[str, Any]:
+    """将AI生成或导入的测试用例数据转换为test_cases表的一行"""
+    return {
+        "id": str(uuid.uuid4()),
+        "session_id": session_id,
+        "title": case_data.get("title", ""),
+        "group_name": case_data.get("group_name", ""),
+        "maintainer": case_data.get("maintainer", ""),
+        "precondition": case_data.get("precondition", ""),
+        "step_description": case_data.get("step_description", ""),
+        "expected_result": case_data.get("expected_result", ""),
+        "case_level": case_data.get("case_level", "中"),
+        "case_type": case_data.get("case_type", "功能测试"),
+        "ai_order": ai_order,  # 保存AI返回的原始顺序
+        "test_suggestions": case_data.get("test_suggestions", ""),  # 保存测试建议
+        "source_chunk_hash": case_data.get("source_chunk_hash"),
+        "is_retired": False
+    }
+
+def _batches(rows: List[Dict[str, Any]], batch_size: int) -> Iterable[List[Dict[str, Any]]]:
+    batch_size = max(1, batch_size)
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+def bulk_insert_test_cases(db: Session, rows: List[Dict[str, Any]], batch_size: int = TEST_CASE_INSERT_BATCH_SIZE) -> int:
+    """
+    分批写入测试用例行（executemany），不经过ORM的逐对象工作单元；
+    只执行语句不提交，由调用方在同一事务中提交
+    """
+    for batch in _batches(rows, batch_size):
+        db.execute(insert(TestCase), batch)
+    if rows:
+        logging.info(f"批量写入测试用例 {len(rows)} 条")
+    return len(rows)
+
+def bulk_update_test_cases(db: Session, rows: List[Dict[str, Any]], batch_size: int = TEST_CASE_INSERT_BATCH_SIZE) -> int:
+    """按主键分批更新测试用例，每行需包含id和要更新的列"""
+    for batch in _batches(rows, batch_size):
+        db.execute(update(TestCase), batch)
+    return len(rows)
+
+def update_test_cases_by_ids(db: Session, case_ids: List[str], values: Dict[str, Any], batch_size: int = TEST_CASE_INSERT_BATCH_SIZE) -> int:
+    """将相同的字段值批量更新到多个用例，每批一条 UPDATE ... WHERE id IN (...)；只执行不提交，返回更新的行数"""
+    if not values:
+        return 0
+    updated = 0
+    for batch in _batches(list(dict.fromkeys(case_ids)), batch_size):
+        result = db.execute(
+            update(TestCase).where(TestCase.id.in_(batch)).values(**values),
+            execution_options={"synchronize_session": False}
+        )
+        updated += result.rowcount
+    return updated
+
+def delete_test_cases_by_ids(db: Session, case_ids: List[str], batch_size: int = TEST_CASE_INSERT_BATCH_SIZE) -> int:
+    """批量删除用例，每批一条 DELETE ... WHERE id IN (...)；只执行不提交，返回删除的行数"""
+    deleted = 0
+    for batch in _batches(list(dict.fromkeys(case_ids)), batch_size):
+        result = db.execute(
+            delete(TestCase).where(TestCase.id.in_(batch)),
+            execution_options={"synchronize_session": False}
+        )
+        deleted += result.rowcount
+    return deleted
+
+def upsert_test_cases_by_title(
+    db: Session,
+    session_id: str,
+    cases: Iterable[Dict[str, Any]],
+    batch_size: int = TEST_CASE_INSERT_BATCH_SIZE
+) -> Dict[str, int]:
+    """
+    按 (会话, 标题) 分批写入测试用例：会话中已有同标题的（未退役）用例时只更新传入的字段，
+    否则新建并排在会话现有用例之后；cases可以是生成器，按批消费，不会一次读入全部数据
+    只执行语句不提交，由调用方在同一事务中提交
+    返回：{"created": 新建数, "updated": 更新数}
+    """
+    max_order = db.query(func.max(TestCase.ai_order)).filter(
+        TestCase.session_id == session_id,
+        TestCase.is_retired == False
+    ).scalar()
+    next_order = 0 if max_order is None else max_order + 1
+    # 标题到用例ID的映射，同一文件中重复的标题更新前面新建的用例
+    title_ids: Dict[str, str] = {}
+    looked_up = set()
+    stats = {"created": 0, "updated": 0}
+
+    def flush(batch: List[Dict[str, Any]]) -> None:
+        nonlocal next_order
+        unknown = list({case["title"] for case in batch} - looked_up)
+        if unknown:
+            existing = db.query(TestCase.id, TestCase.title).filter(
+                TestCase.session_id == session_id,
+                TestCase.is_retired == False,
+                TestCase.title.in_(unknown)
+            ).order_by(TestCase.ai_order.asc(), TestCase.created_at.asc())
+            for case_id, title in existing:
+                title_ids.setdefault(title, case_id)
+            looked_up.update(unknown)
+
+        inserts, updates = [], []
+        for case in batch:
+            case_id = title_ids.get(case["title"])
+            if case_id:
+                updates.append({"id": case_id, **case})
+            else:
+                row = build_test_case_row(session_id, case, next_order)
+                next_order += 1
+                title_ids[case["title"]] = row["id"]
+                inserts.append(row)
+        # 先插入再更新，同一批中重复的标题能更新到刚插入的行
+        bulk_insert_test_cases(db, inserts, batch_size)
+        bulk_update_test_cases(db, updates, batch_size)
+        stats["created"] += len(inserts)
+        stats["updated"] += len(updates)
+
+    batch: List[Dict[str, Any]] = []
+    for case in cases:
+        batch.append(case)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return stats
@@ -0,0 +1,59 @@
+import os
+import uuid
+import hashlib
+import logging
+from typing import Tuple
+import aiofiles
+from fastapi import UploadFile
+
+# 上传文件大小上限（MB），0表示不限制
+UPLOAD_MAX_SIZE_MB = int(os.getenv("UPLOAD_MAX_SIZE_MB", "100"))
+# 每次从上传流读取并写入磁盘的字节数
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# 上传过程中的临时文件目录：不能位于对外提供静态文件服务的uploads目录中，
+# 且需与uploads在同一文件系统上，写完后才能原子替换到目标位置
+UPLOAD_TEMP_DIR = os.getenv("UPLOAD_TEMP_DIR", "upload_tmp")
+
+class UploadTooLargeError(Exception):
+    """上传文件超过大小上限"""
+
+def max_upload_bytes() -> int:
+    return UPLOAD_MAX_SIZE_MB * 1024 * 1024
+
+async def save_upload_stream(upload: UploadFile, dest_path: str) -> Tuple[int, str]:
+    """
+    分块读取上传流并写入磁盘，同时计算字节数和SHA-256；
+    先写入UPLOAD_TEMP_DIR中的临时文件（未写完的文件不会被静态文件服务访问到），
+    完成后原子替换为目标文件，超过大小上限时立即中止
+    返回：(文件字节数, SHA-256)
+    """
+    limit = max_upload_bytes()
+    # 已知大小的上传在写盘前直接拒绝
+    if limit and upload.size is not None and upload.size > limit:
+        raise UploadTooLargeError(f"文件大小超过上限 {UPLOAD_MAX_SIZE_MB}MB")
+
+    os.makedirs(UPLOAD_TEMP_DIR, exist_ok=True)
+    temp_path = os.path.join(UPLOAD_TEMP_DIR, f"{uuid.uuid4().hex}.part")
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(temp_path, "wb") as out:
+            while True:
+                block = await upload.read(UPLOAD_CHUNK_BYTES)
+                if not block:
+                    break
+                size += len(block)
+                if limit and size > limit:
+                    raise UploadTooLargeError(f"文件大小超过上限 {UPLOAD_MAX_SIZE_MB}MB")
+                sha256.update(block)
+                await out.write(block)
+        os.replace(temp_path, dest_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+    logging.info(f"上传文件已保存: {dest_path}，大小: {size} 字节")
+    return size, sha256.hexdigest()
@@ -0,0 +1,98 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from models import LLMCallLog
+
+def _usage_columns() -> List[Any]:
+    return [
+        func.count(LLMCallLog.id).label("calls"),
+        func.coalesce(func.sum(case((LLMCallLog.status == "failed", 1), else_=0)), 0).label("failed_calls"),
+        func.coalesce(func.sum(LLMCallLog.prompt_tokens), 0).label("prompt_tokens"),
+        func.coalesce(func.sum(LLMCallLog.completion_tokens), 0).label("completion_tokens"),
+        func.coalesce(func.sum(LLMCallLog.total_tokens), 0).label("total_tokens"),
+        func.coalesce(func.sum(case((LLMCallLog.usage_estimated == True, 1), else_=0)), 0).label("estimated_calls"),
+        func.coalesce(func.sum(LLMCallLog.attempts), 0).label("attempts"),
+        func.avg(LLMCallLog.latency_ms).label("avg_latency_ms"),
+        func.max(LLMCallLog.latency_ms).label("max_latency_ms"),
+        func.sum(LLMCallLog.cost).label("cost"),
+    ]
+
+def _usage_dict(row: Any) -> Dict[str, Any]:
+    calls = int(row.calls or 0)
+    return {
+        "calls": calls,
+        "failed_calls": int(row.failed_calls),
+        "prompt_tokens": int(row.prompt_tokens),
+        "completion_tokens": int(row.completion_tokens),
+        "total_tokens": int(row.total_tokens),
+        "estimated_calls": int(row.estimated_calls),
+        # 重试和切换池成员额外发出的请求数
+        "retries": max(0, int(row.attempts) - calls),
+        "avg_latency_ms": round(float(row.avg_latency_ms)) if row.avg_latency_ms is not None else None,
+        "max_latency_ms": row.max_latency_ms,
+        "cost": round(float(row.cost), 6) if row.cost is not None else None,
+    }
+
+def usage_totals(db: Session, *filters) -> Dict[str, Any]:
+    """符合条件的AI请求用量合计"""
+    return _usage_dict(db.query(*_usage_columns()).filter(*filters).one())
+
+def usage_grouped(db: Session, group_by: List[Any], *filters) -> List[Dict[str, Any]]:
+    """按group_by中的列分组汇总AI请求用量，按token数从多到少排列"""
+    rows = db.query(*group_by, *_usage_columns()).filter(*filters).group_by(*group_by).order_by(
+        func.coalesce(func.sum(LLMCallLog.total_tokens), 0).desc()
+    ).all()
+    return [{**{column.key: getattr(row, column.key) for column in group_by}, **_usage_dict(row)} for row in rows]
+
+def call_log_dict(log: LLMCallLog) -> Dict[str, Any]:
+    return {
+        "id": log.id,
+        "stage": log.stage,
+        "chunk_index": log.chunk_index,
+        "status": log.status,
+        "ai_config_id": log.ai_config_id,
+        "model_name": log.model_name,
+        "prompt_tokens": log.prompt_tokens,
+        "completion_tokens": log.completion_tokens,
+        "total_tokens": log.total_tokens,
+        "usage_estimated": log.usage_estimated,
+        "latency_ms": log.latency_ms,
+        "attempts": log.attempts,
+        "cost": float(log.cost) if log.cost is not None else None,
+        "error_message": log.error_message,
+        "created_at": log.created_at,
+    }
+
+def job_usage(db: Session, job_id: str) -> Dict[str, Any]:
+    """一次分析任务的用量：合计、按阶段（分块/整篇/建议归并）汇总，以及每次请求的明细"""
+    logs = db.query(LLMCallLog).filter(LLMCallLog.job_id == job_id).order_by(
+        LLMCallLog.stage.asc(), LLMCallLog.chunk_index.asc(), LLMCallLog.created_at.asc()
+    ).all()
+    return {
+        "job_id": job_id,
+        "totals": usage_totals(db, LLMCallLog.job_id == job_id),
+        "by_stage": usage_grouped(db, [LLMCallLog.stage], LLMCallLog.job_id == job_id),
+        "calls": [call_log_dict(log) for log in logs],
+    }
+
+def session_usage(db: Session, session_id: str) -> Dict[str, Any]:
+    """会话内所有分析任务的用量：合计、按任务和按模型汇总"""
+    condition = LLMCallLog.session_id == session_id
+    return {
+        "session_id": session_id,
+        "totals": usage_totals(db, condition),
+        "by_job": usage_grouped(db, [LLMCallLog.job_id, LLMCallLog.file_id], condition),
+        "by_model": usage_grouped(db, [LLMCallLog.ai_config_id, LLMCallLog.model_name], condition),
+    }
+
+def config_usage(db: Session, since: Optional[datetime] = None) -> Dict[str, Any]:
+    """各AI配置的用量汇总，since为空时统计全部记录"""
+    filters = [LLMCallLog.created_at >= since] if since else []
+    return {
+        "since": since,
+        "totals": usage_totals(db, *filters),
+        "by_config": usage_grouped(db, [LLMCallLog.ai_config_id, LLMCallLog.model_name, LLMCallLog.stage], *filters),
+    }
@@ -15,13 +15,27 @@ CREATE TABLE file_uploads (
     file_url TEXT NOT NULL,
     file_type VARCHAR(50),
     file_size BIGINT,
+    content_hash VARCHAR(64),
     upload_status VARCHAR(20) DEFAULT 'completed',
     extracted_content LONGTEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     INDEX idx_session_id (session_id),
+    INDEX idx_content_hash (content_hash),
     INDEX idx_created_at (created_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- 上传文件内容表（按内容哈希去重，引用计数为0时回收）
+CREATE TABLE file_blobs (
+    content_hash VARCHAR(64) PRIMARY KEY,
+    file_url TEXT NOT NULL,
+    file_size BIGINT,
+    extracted_content LONGTEXT,
+    ref_count INT DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_ref_count (ref_count)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- 测试用例表
 CREATE TABLE test_cases (
     id VARCHAR(36) PRIMARY KEY,
@@ -35,13 +49,17 @@ CREATE TABLE test_cases (
     case_level VARCHAR(50) DEFAULT '中',
     case_type VARCHAR(50) DEFAULT '功能测试',
     ai_order BIGINT,
+    source_chunk_hash VARCHAR(64),  -- 生成该用例的文档块哈希，用于增量分析
+    is_retired BOOLEAN NOT NULL DEFAULT FALSE,  -- 来源块已从新版文档中移除或变更
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     INDEX idx_session_id (session_id),
     INDEX idx_created_at (created_at),
     INDEX idx_case_level (case_level),
     INDEX idx_case_type (case_type),
-    INDEX idx_ai_order (ai_order)
+    INDEX idx_ai_order (ai_order),
+    INDEX idx_source_chunk_hash (source_chunk_hash),
+    INDEX idx_session_order (session_id, ai_order, created_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- 会话表
@@ -68,11 +86,87 @@ CREATE TABLE ai_configurations (
     api_endpoint TEXT NOT NULL,
     model_name VARCHAR(100) NOT NULL,
     api_key VARCHAR(500) NOT NULL,
+    context_window INT,
+    requests_per_minute INT,
+    tokens_per_minute INT,
+    pool_name VARCHAR(100),
+    weight INT DEFAULT 1,
+    input_price DECIMAL(12,4),  -- 每百万输入token价格，为空时不计算费用
+    output_price DECIMAL(12,4),  -- 每百万输出token价格
     is_active BOOLEAN DEFAULT TRUE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     INDEX idx_user_id (user_id),
-    INDEX idx_is_active (is_active)
+    INDEX idx_is_active (is_active),
+    INDEX idx_pool_name (pool_name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- AI分析任务表
+CREATE TABLE analysis_jobs (
+    id VARCHAR(36) PRIMARY KEY,
+    session_id VARCHAR(36),
+    file_id VARCHAR(36),
+    status VARCHAR(20) DEFAULT 'queued',  -- queued/running/succeeded/failed/cancelled
+    full_reanalysis BOOLEAN DEFAULT FALSE,
+    progress_message TEXT,
+    total_chunks INT DEFAULT 0,
+    completed_chunks INT DEFAULT 0,
+    failed_chunks INT DEFAULT 0,
+    reused_chunks INT DEFAULT 0,
+    test_cases_count INT DEFAULT 0,
+    retired_cases_count INT DEFAULT 0,
+    error_message TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME NULL,
+    finished_at DATETIME NULL,
+    worker_id VARCHAR(100),  -- 持有任务的后端进程
+    heartbeat_at DATETIME NULL,  -- 持有进程最近一次续约的时间
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_session_id (session_id),
+    INDEX idx_file_id (file_id),
+    INDEX idx_status (status),
+    INDEX idx_status_heartbeat (status, heartbeat_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- AI结果缓存表
+CREATE TABLE llm_cache_entries (
+    cache_key VARCHAR(64) PRIMARY KEY,  -- 块内容哈希+模型+端点+温度+提示词版本的SHA-256
+    model_name VARCHAR(100),
+    api_endpoint TEXT,
+    prompt_version VARCHAR(50),
+    response LONGTEXT NOT NULL,
+    size_bytes BIGINT DEFAULT 0,
+    hit_count BIGINT DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_accessed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_created_at (created_at),
+    INDEX idx_last_accessed_at (last_accessed_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- AI请求用量记录表（每次分块/整篇/建议归并请求一条）
+CREATE TABLE llm_call_logs (
+    id VARCHAR(36) PRIMARY KEY,
+    job_id VARCHAR(36),
+    session_id VARCHAR(36),
+    file_id VARCHAR(36),
+    ai_config_id VARCHAR(36),  -- 实际处理请求的AI配置（提供方池中的成员）
+    model_name VARCHAR(100),
+    stage VARCHAR(20) NOT NULL,  -- chunk/document/summary
+    chunk_index INT,
+    status VARCHAR(20) NOT NULL,  -- succeeded/failed
+    prompt_tokens INT DEFAULT 0,
+    completion_tokens INT DEFAULT 0,
+    total_tokens INT DEFAULT 0,
+    usage_estimated BOOLEAN DEFAULT FALSE,  -- 响应中没有usage字段，按分词器估算
+    latency_ms INT,
+    attempts INT DEFAULT 1,
+    cost DECIMAL(14,6),
+    error_message TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_job_id (job_id),
+    INDEX idx_session_id (session_id),
+    INDEX idx_ai_config_created (ai_config_id, created_at),
+    INDEX idx_created_at (created_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- 插入默认AI配置（使用提供的阿里云千问配置）
@@ -0,0 +1,105 @@
+-- AstraTest-PRD2TC数据库升级脚本：为已有数据库补充新增的列、索引和表
+-- 全新安装直接执行 init.sql 即可，无需执行本脚本；已有数据库升级时执行一次：
+--   mysql -u root -p astratest_prd2tc < migrations/001_analysis_jobs_and_usage.sql
+
+USE astratest_prd2tc;
+
+-- 文件上传表：内容哈希（相同内容的文件共用存储和解析结果）
+ALTER TABLE file_uploads
+    ADD COLUMN content_hash VARCHAR(64) AFTER file_size,
+    ADD INDEX idx_content_hash (content_hash);
+
+-- 测试用例表：来源块哈希和退役标记（增量分析），以及按会话分页的索引
+ALTER TABLE test_cases
+    ADD COLUMN source_chunk_hash VARCHAR(64) AFTER ai_order,
+    ADD COLUMN is_retired BOOLEAN NOT NULL DEFAULT FALSE AFTER source_chunk_hash,
+    ADD INDEX idx_source_chunk_hash (source_chunk_hash),
+    ADD INDEX idx_session_order (session_id, ai_order, created_at);
+
+-- AI配置表：上下文窗口、限流、提供方池和价格
+ALTER TABLE ai_configurations
+    ADD COLUMN context_window INT AFTER api_key,
+    ADD COLUMN requests_per_minute INT AFTER context_window,
+    ADD COLUMN tokens_per_minute INT AFTER requests_per_minute,
+    ADD COLUMN pool_name VARCHAR(100) AFTER tokens_per_minute,
+    ADD COLUMN weight INT DEFAULT 1 AFTER pool_name,
+    ADD COLUMN input_price DECIMAL(12,4) AFTER weight,
+    ADD COLUMN output_price DECIMAL(12,4) AFTER input_price,
+    ADD INDEX idx_pool_name (pool_name);
+
+-- 上传文件内容表（按内容哈希去重，引用计数为0时回收）
+CREATE TABLE IF NOT EXISTS file_blobs (
+    content_hash VARCHAR(64) PRIMARY KEY,
+    file_url TEXT NOT NULL,
+    file_size BIGINT,
+    extracted_content LONGTEXT,
+    ref_count INT DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_ref_count (ref_count)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- AI分析任务表
+CREATE TABLE IF NOT EXISTS analysis_jobs (
+    id VARCHAR(36) PRIMARY KEY,
+    session_id VARCHAR(36),
+    file_id VARCHAR(36),
+    status VARCHAR(20) DEFAULT 'queued',  -- queued/running/succeeded/failed/cancelled
+    full_reanalysis BOOLEAN DEFAULT FALSE,
+    progress_message TEXT,
+    total_chunks INT DEFAULT 0,
+    completed_chunks INT DEFAULT 0,
+    failed_chunks INT DEFAULT 0,
+    reused_chunks INT DEFAULT 0,
+    test_cases_count INT DEFAULT 0,
+    retired_cases_count INT DEFAULT 0,
+    error_message TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME NULL,
+    finished_at DATETIME NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_session_id (session_id),
+    INDEX idx_file_id (file_id),
+    INDEX idx_status (status)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- AI结果缓存表
+CREATE TABLE IF NOT EXISTS llm_cache_entries (
+    cache_key VARCHAR(64) PRIMARY KEY,  -- 块内容哈希+模型+端点+温度+提示词版本的SHA-256
+    model_name VARCHAR(100),
+    api_endpoint TEXT,
+    prompt_version VARCHAR(50),
+    response LONGTEXT NOT NULL,
+    size_bytes BIGINT DEFAULT 0,
+    hit_count BIGINT DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_accessed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_created_at (created_at),
+    INDEX idx_last_accessed_at (last_accessed_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- AI请求用量记录表（每次分块/整篇/建议归并请求一条）
+CREATE TABLE IF NOT EXISTS llm_call_logs (
+    id VARCHAR(36) PRIMARY KEY,
+    job_id VARCHAR(36),
+    session_id VARCHAR(36),
+    file_id VARCHAR(36),
+    ai_config_id VARCHAR(36),  -- 实际处理请求的AI配置（提供方池中的成员）
+    model_name VARCHAR(100),
+    stage VARCHAR(20) NOT NULL,  -- chunk/document/summary
+    chunk_index INT,
+    status VARCHAR(20) NOT NULL,  -- succeeded/failed
+    prompt_tokens INT DEFAULT 0,
+    completion_tokens INT DEFAULT 0,
+    total_tokens INT DEFAULT 0,
+    usage_estimated BOOLEAN DEFAULT FALSE,  -- 响应中没有usage字段，按分词器估算
+    latency_ms INT,
+    attempts INT DEFAULT 1,
+    cost DECIMAL(14,6),
+    error_message TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_job_id (job_id),
+    INDEX idx_session_id (session_id),
+    INDEX idx_ai_config_created (ai_config_id, created_at),
+    INDEX idx_created_at (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
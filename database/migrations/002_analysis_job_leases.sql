@@ -0,0 +1,10 @@
+-- AstraTest-PRD2TC数据库升级脚本：分析任务租约（多进程部署时只接管所在进程已退出的任务）
+-- 在 001_analysis_jobs_and_usage.sql 之后执行一次：
+--   mysql -u root -p astratest_prd2tc < migrations/002_analysis_job_leases.sql
+
+USE astratest_prd2tc;
+
+ALTER TABLE analysis_jobs
+    ADD COLUMN worker_id VARCHAR(100) AFTER finished_at,
+    ADD COLUMN heartbeat_at DATETIME NULL AFTER worker_id,
+    ADD INDEX idx_status_heartbeat (status, heartbeat_at);
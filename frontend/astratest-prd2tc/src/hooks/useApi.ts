@@ -126,18 +126,131 @@ export const useUploadFile = () => {
   });
 };
 
+// 分析任务状态（GET /api/jobs/{job_id}）
+export interface AnalysisJob {
+  id: string;
+  status: 'queued' | 'running' | 'succeeded' | 'failed' | 'cancelled';
+  progress_message?: string | null;
+  total_chunks: number;
+  completed_chunks: number;
+  failed_chunks: number;
+  test_cases_count: number;
+  error_message?: string | null;
+}
+
+// 分析任务进度事件（GET /api/jobs/{job_id}/events 推送的 progress 和 done 事件）
+export interface JobProgressEvent {
+  type: 'progress' | 'done';
+  job_id: string;
+  status: AnalysisJob['status'];
+  message?: string | null;
+  total_chunks: number;
+  completed_chunks: number;
+  failed_chunks: number;
+  cases_so_far?: number;
+  eta_seconds?: number | null;
+  test_cases_count?: number;
+  error_message?: string | null;
+}
+
+// 流式生成时逐条推送的测试用例（GET /api/jobs/{job_id}/events 的 case 事件）
+export interface JobCaseEvent {
+  type: 'case';
+  job_id: string;
+  chunk_index: number | null;
+  case: Pick<TestCase, 'title' | 'group_name' | 'precondition' | 'step_description' | 'expected_result' | 'case_level' | 'case_type'>;
+}
+
+const JOB_POLL_INTERVAL_MS = 2000;
+
+export const isJobFinished = (status: string) => status !== 'queued' && status !== 'running';
+
+export const getAnalysisJob = async (jobId: string): Promise<AnalysisJob> => {
+  const response = await fetch(`/api/jobs/${jobId}`);
+  if (!response.ok) {
+    throw new Error(`查询分析任务失败（${response.status}）`);
+  }
+  return response.json();
+};
+
+// 轮询分析任务直到结束（成功、失败或取消）
+export const waitForAnalysisJob = async (
+  jobId: string,
+  onProgress?: (event: JobProgressEvent) => void,
+): Promise<AnalysisJob> => {
+  for (;;) {
+    const job = await getAnalysisJob(jobId);
+    const finished = isJobFinished(job.status);
+    onProgress?.({
+      ...job,
+      type: finished ? 'done' : 'progress',
+      job_id: job.id,
+      message: job.progress_message,
+    });
+    if (finished) {
+      return job;
+    }
+    await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
+};
+
+// 订阅分析任务的进度事件和逐条生成的测试用例，收到done事件后关闭连接并返回任务最终状态；事件流连接失败时改为轮询
+export const watchAnalysisJob = (
+  jobId: string,
+  onProgress?: (event: JobProgressEvent) => void,
+  onCase?: (event: JobCaseEvent) => void,
+): Promise<AnalysisJob> => new Promise((resolve, reject) => {
+  const source = new EventSource(`/api/jobs/${jobId}/events`);
+  let closed = false;
+  const close = () => {
+    closed = true;
+    source.close();
+  };
+
+  source.addEventListener('progress', (e) => {
+    onProgress?.(JSON.parse((e as MessageEvent).data));
+  });
+  source.addEventListener('case', (e) => {
+    onCase?.(JSON.parse((e as MessageEvent).data));
+  });
+  source.addEventListener('done', (e) => {
+    onProgress?.(JSON.parse((e as MessageEvent).data));
+    close();
+    getAnalysisJob(jobId).then(resolve, reject);
+  });
+  source.onerror = () => {
+    if (closed) {
+      return;
+    }
+    close();
+    waitForAnalysisJob(jobId, onProgress).then(resolve, reject);
+  };
+});
+
 export const useAnalyzeDocument = () => {
   const queryClient = useQueryClient();
   
   return useMutation({
-    mutationFn: ({ fileId, sessionId }: { fileId: string; sessionId: string }) => 
-      api.analyzeDocument(fileId, sessionId),
+    // 提交分析任务后订阅进度直到任务结束，任务失败或取消时抛出错误
+    mutationFn: async ({ fileId, sessionId, onProgress, onCase }: {
+      fileId: string;
+      sessionId: string;
+      onProgress?: (event: JobProgressEvent) => void;
+      onCase?: (event: JobCaseEvent) => void;
+    }) => {
+      const { job_id } = (await api.analyzeDocument(fileId, sessionId)) as { job_id: string };
+      const job = await watchAnalysisJob(job_id, onProgress, onCase);
+      if (job.status !== 'succeeded') {
+        throw new Error(job.error_message || (job.status === 'cancelled' ? '分析任务已取消' : 'AI分析失败'));
+      }
+      return job;
+    },
     onSuccess: (_, variables) => {
       queryClient.invalidateQueries({ queryKey: ['testCases', variables.sessionId] });
       message.success('AI分析完成');
     },
-    onError: () => {
-      message.error('AI分析失败');
+    onError: (error: Error) => {
+      message.error(error.message || 'AI分析失败');
     },
   });
 };
@@ -23,7 +23,7 @@ import {
 } from '@ant-design/icons';
 import { useNavigate } from 'react-router-dom';
 import { useSession } from '../contexts/SessionContext';
-import { useUploadFile, useAnalyzeDocument } from '../hooks/useApi';
+import { useUploadFile, useAnalyzeDocument, JobCaseEvent } from '../hooks/useApi';
 import { api } from '../lib/api';
 import type { UploadProps } from 'antd';
 
@@ -43,6 +43,9 @@ const FILE_CONFIG = {
   },
 };
 
+// 分析过程中展示的最近生成的用例数
+const LIVE_CASES_SHOWN = 20;
+
 const HomePage: React.FC = () => {
   const { currentSession, isLoading: sessionLoading, setCurrentSession, setSessions } = useSession();
   const navigate = useNavigate();
@@ -50,6 +53,9 @@ const HomePage: React.FC = () => {
   const [extractedContent, setExtractedContent] = useState<string>('');
   const [uploadProgress, setUploadProgress] = useState(0);
   const [analysisProgress, setAnalysisProgress] = useState(0);
+  const [analysisMessage, setAnalysisMessage] = useState<string>('');
+  // 分析过程中已生成的测试用例（流式生成时逐条推送）
+  const [liveCases, setLiveCases] = useState<JobCaseEvent['case'][]>([]);
   const [isAnalyzing, setIsAnalyzing] = useState(false);
 
   const uploadMutation = useUploadFile();
@@ -160,40 +166,43 @@ const HomePage: React.FC = () => {
 
     setIsAnalyzing(true);
     setAnalysisProgress(0);
-
-    // 模拟分析进度
-    const analysisTimer = setInterval(() => {
-      setAnalysisProgress(prev => {
-        if (prev >= 90) {
-          clearInterval(analysisTimer);
-          return 90;
-        }
-        return prev + Math.random() * 15;
-      });
-    }, 500);
+    setAnalysisMessage('任务排队中');
+    setLiveCases([]);
 
     try {
-      await analyzeMutation.mutateAsync({
+      // 按任务推送的分块完成数更新进度，任务失败或取消时抛出错误
+      const job = await analyzeMutation.mutateAsync({
         fileId: uploadedFile.fileId,
         sessionId: currentSession.id,
+        onProgress: (event) => {
+          if (event.message) {
+            setAnalysisMessage(event.message);
+          }
+          if (event.type === 'done') {
+            setAnalysisProgress(100);
+          } else if (event.total_chunks > 0) {
+            // 分块全部完成后还需合并建议和保存结果，完成前最多显示99%
+            setAnalysisProgress(Math.min(99, (event.completed_chunks / event.total_chunks) * 100));
+          }
+        },
+        onCase: (event) => {
+          setLiveCases(prev => [...prev, event.case]);
+        },
       });
 
-      clearInterval(analysisTimer);
       setAnalysisProgress(100);
-      message.success('AI分析完成！');
 
       // 显示结果提示
       Modal.success({
         title: '分析完成',
-        content: 'AI已成功生成测试用例，是否立即查看？',
+        content: `AI已生成 ${job.test_cases_count} 个测试用例，是否立即查看？`,
         okText: '查看测试用例',
         cancelText: '稍后再看',
         onOk: () => navigate('/test-cases'),
       });
     } catch (error) {
-      clearInterval(analysisTimer);
+      // 失败原因已由useAnalyzeDocument提示
       setAnalysisProgress(0);
-      message.error('AI分析失败，请重试');
     } finally {
       setIsAnalyzing(false);
     }
@@ -399,10 +408,23 @@ const HomePage: React.FC = () => {
             {isAnalyzing && (
               <div className="space-y-2">
                 <div className="flex justify-between text-sm">
-                  <Text>分析进度</Text>
+                  <Text>{analysisMessage || '分析进度'}</Text>
                   <Text>{Math.round(analysisProgress)}%</Text>
                 </div>
                 <Progress percent={analysisProgress} strokeColor="#52c41a" />
+                {liveCases.length > 0 && (
+                  <div className="bg-gray-50 p-3 rounded max-h-48 overflow-y-auto">
+                    <Text type="secondary" className="text-sm block mb-1">
+                      已生成 {liveCases.length} 个测试用例（去重前）
+                    </Text>
+                    {liveCases.slice(-LIVE_CASES_SHOWN).map((item, index) => (
+                      <div key={index} className="text-sm truncate">
+                        <Tag color="green">{item.case_level || '中'}</Tag>
+                        {item.title}
+                      </div>
+                    ))}
+                  </div>
+                )}
               </div>
             )}
 
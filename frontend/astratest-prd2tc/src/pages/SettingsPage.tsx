@@ -3,6 +3,7 @@ import {
   Card,
   Form,
   Input,
+  InputNumber,
   Button,
   Space,
   Typography,
@@ -213,6 +214,63 @@ const SettingsPage: React.FC = () => {
             <Input.Password placeholder="sk-xxxxxxxxxxxxxxx" />
           </Form.Item>
 
+          <Form.Item
+            name="context_window"
+            label="上下文窗口（token）"
+            extra="选填，大文档按该窗口大小打包分块，留空使用默认分块大小"
+          >
+            <InputNumber min={4000} step={1000} className="w-full" placeholder="例如：32000" />
+          </Form.Item>
+
+          <Form.Item
+            name="requests_per_minute"
+            label="每分钟请求数限额（RPM）"
+            extra="选填，填写服务商的限额后，并行分析会按该速率排队请求，留空不限制"
+          >
+            <InputNumber min={1} className="w-full" placeholder="例如：60" />
+          </Form.Item>
+
+          <Form.Item
+            name="tokens_per_minute"
+            label="每分钟token限额（TPM）"
+            extra="选填，按提示词和最大输出token数预估占用，留空不限制"
+          >
+            <InputNumber min={1000} step={1000} className="w-full" placeholder="例如：100000" />
+          </Form.Item>
+
+          <Form.Item
+            name="pool_name"
+            label="提供方池"
+            extra="选填，与默认配置填写相同池名的配置会共同分担分块请求，失败或过慢时自动切换"
+          >
+            <Input placeholder="例如：main-pool" />
+          </Form.Item>
+
+          <Form.Item
+            name="weight"
+            label="池内权重"
+            extra="权重越大分到的请求越多，0表示不参与分担"
+            initialValue={1}
+          >
+            <InputNumber min={0} max={100} className="w-full" />
+          </Form.Item>
+
+          <Form.Item
+            name="input_price"
+            label="输入价格"
+            extra="选填，每百万输入token的价格，用于统计分析费用"
+          >
+            <InputNumber min={0} step={0.1} className="w-full" placeholder="例如：2" />
+          </Form.Item>
+
+          <Form.Item
+            name="output_price"
+            label="输出价格"
+            extra="选填，每百万输出token的价格"
+          >
+            <InputNumber min={0} step={0.1} className="w-full" placeholder="例如：8" />
+          </Form.Item>
+
           <Form.Item
             name="is_active"
             label="设为默认配置"